@@ -0,0 +1,308 @@
+"""Benchmark the theme on a synthetic large book.
+
+Generates a book with a configurable number of pages, toctree depth, sections
+per page and git history in a temporary git repository, then times a full
+build, a no-op rebuild and an incremental rebuild after one page changes.
+Each build runs in its own process, so its peak memory is measured alone.
+
+    python benchmarks/large_book.py --pages 500 --depth 3 --commits 50
+
+Results can be saved as a baseline and later runs compared against it:
+
+    python benchmarks/large_book.py --save-baseline benchmarks/baselines/local.json
+    python benchmarks/large_book.py --baseline benchmarks/baselines/local.json
+"""
+
+import argparse
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BUILDS = ("full", "noop", "incremental")
+# Arguments that define the book, which must match those of the baseline
+CONFIG = ("pages", "depth", "sections", "commits", "jobs", "option")
+# Measurements compared against the baseline
+COMPARED = ("init", "read", "write", "finish", "total", "peak_memory_mb")
+
+CONF = """\
+project = "Synthetic Book"
+author = "Benchmark"
+master_doc = "index"
+exclude_patterns = ["_build"]
+html_theme = "quantecon_book_theme"
+html_theme_options = {{
+    "repository_url": "https://github.com/QuantEcon/synthetic-book",
+    "path_to_docs": "",
+    "profile": True,
+    {options}
+}}
+"""
+
+SECTION = """\
+{title}
+{underline}
+
+Lorem ipsum dolor sit amet, with inline math :math:`x_{i} + \\beta` and a
+reference to :doc:`{target}`.
+
+.. math::
+
+   \\mathbb{{E}}[X_{i}] = \\sum_{{k=1}}^{{n}} k \\, p_k
+
+.. code-block:: python
+
+   def section_{i}(x):
+       return x ** {i}
+
+"""
+
+
+def page_tree(pages: int, depth: int):
+    """The parent of each page of a book, in a tree of the given depth."""
+    fanout = max(2, math.ceil((pages - 1) ** (1 / max(depth, 1))))
+    return {i: (i - 1) // fanout for i in range(1, pages)}
+
+
+def page_name(i: int) -> str:
+    return "index" if i == 0 else f"chapters/page{i:05d}"
+
+
+def write_page(srcdir: Path, i: int, children, sections: int, edits: int = 0):
+    title = "Synthetic Book" if i == 0 else f"Page {i}"
+    text = f"{title}\n{'=' * len(title)}\n\n"
+    for section in range(1, sections + 1):
+        heading = f"Section {i}.{section}"
+        text += SECTION.format(
+            title=heading,
+            underline="-" * len(heading),
+            target=f"/{page_name(max(i - 1, 0))}",
+            i=section,
+        )
+    text += "".join(f"Revision {edit}.\n\n" for edit in range(edits))
+    if children:
+        text += ".. toctree::\n   :maxdepth: 2\n\n"
+        text += "".join(f"   /{page_name(child)}\n" for child in children)
+    path = srcdir / f"{page_name(i)}.rst"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+
+
+def git(srcdir: Path, *args: str):
+    env = {
+        **os.environ,
+        "GIT_AUTHOR_NAME": "Benchmark",
+        "GIT_AUTHOR_EMAIL": "benchmark@example.org",
+        "GIT_COMMITTER_NAME": "Benchmark",
+        "GIT_COMMITTER_EMAIL": "benchmark@example.org",
+    }
+    subprocess.run(["git", *args], cwd=srcdir, env=env, check=True, capture_output=True)
+
+
+def generate_book(srcdir: Path, args) -> Path:
+    """Write a synthetic book with its git history into ``srcdir``."""
+    parents = page_tree(args.pages, args.depth)
+    children = {i: [] for i in range(args.pages)}
+    for child, parent in parents.items():
+        children[parent].append(child)
+
+    options = "".join(f'"{option}": True,\n    ' for option in args.option)
+    srcdir.mkdir(parents=True, exist_ok=True)
+    (srcdir / "conf.py").write_text(CONF.format(options=options), encoding="utf-8")
+    edits = {i: 0 for i in range(args.pages)}
+    for i in range(args.pages):
+        write_page(srcdir, i, children[i], args.sections)
+
+    git(srcdir, "init", "--quiet")
+    git(srcdir, "add", ".")
+    git(srcdir, "commit", "--quiet", "-m", "Initial book")
+    # Each commit edits a spread of pages, so pages get histories of
+    # different lengths
+    for commit in range(1, args.commits):
+        for i in range(commit % 7, args.pages, 7):
+            edits[i] += 1
+            write_page(srcdir, i, children[i], args.sections, edits[i])
+        git(srcdir, "commit", "--quiet", "-am", f"Revise pages ({commit})")
+    return srcdir
+
+
+def _peak_memory_mb() -> float:
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes on Linux
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def run_build(srcdir: Path, outdir: Path, jobs: int) -> dict:
+    """Build the book in this process and time the phases of the build."""
+    from sphinx.application import Sphinx
+
+    doctreedir = outdir / ".doctrees"
+    # Reports are only written when pages are, so drop those of the last build
+    for report in ("qe-theme-metrics.json", "qe-theme-profile.json"):
+        doctreedir.joinpath(report).unlink(missing_ok=True)
+
+    marks = {"start": time.perf_counter()}
+
+    def mark(name):
+        def listener(*args):
+            marks.setdefault(name, time.perf_counter())
+
+        return listener
+
+    app = Sphinx(
+        srcdir,
+        srcdir,
+        outdir,
+        doctreedir,
+        "html",
+        status=None,
+        warning=sys.stderr,
+        parallel=jobs,
+    )
+    marks["init"] = time.perf_counter()
+    app.connect("env-updated", mark("read"), priority=0)
+    app.connect("build-finished", mark("write"), priority=0)
+    app.build()
+    marks["finish"] = time.perf_counter()
+
+    # A no-op rebuild reads and writes nothing
+    marks.setdefault("read", marks["init"])
+    marks.setdefault("write", marks["read"])
+    phases = ("start", "init", "read", "write", "finish")
+    result = {
+        phase: marks[phase] - marks[previous]
+        for previous, phase in zip(phases, phases[1:])
+    }
+    result["total"] = marks["finish"] - marks["start"]
+    result["peak_memory_mb"] = _peak_memory_mb()
+
+    metrics = doctreedir / "qe-theme-metrics.json"
+    if metrics.exists():
+        metrics = json.loads(metrics.read_text(encoding="utf-8"))
+        result["pages"] = metrics["pages"]
+        result["theme_handlers"] = metrics["handler_seconds"]
+        result["git_subprocesses"] = metrics["git_subprocesses"]
+    profile = doctreedir / "qe-theme-profile.json"
+    if profile.exists():
+        profile = json.loads(profile.read_text(encoding="utf-8"))
+        result["handlers"] = {
+            name: stats["total"] for name, stats in profile["handlers"].items()
+        }
+    return result
+
+
+def build_in_subprocess(srcdir: Path, outdir: Path, jobs: int) -> dict:
+    result = subprocess.run(
+        [sys.executable, __file__, "--build", str(srcdir), str(outdir)]
+        + ["--jobs", str(jobs)],
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+def run_benchmark(args) -> dict:
+    workdir = Path(args.keep) if args.keep else Path(tempfile.mkdtemp())
+    try:
+        srcdir = generate_book(workdir / "book", args)
+        outdir = workdir / "book" / "_build" / "html"
+        results = {"book": {key: getattr(args, key) for key in CONFIG}}
+        results["full"] = build_in_subprocess(srcdir, outdir, args.jobs)
+        results["noop"] = build_in_subprocess(srcdir, outdir, args.jobs)
+        page = srcdir / f"{page_name(args.pages // 2)}.rst"
+        page.write_text(page.read_text(encoding="utf-8") + "\nEdited.\n")
+        results["incremental"] = build_in_subprocess(srcdir, outdir, args.jobs)
+        return results
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(baseline: dict, results: dict, tolerance: float) -> list:
+    """List the measurements that grew by more than ``tolerance``."""
+    if baseline.get("book") != results["book"]:
+        return ["the baseline was recorded for a different book"]
+    regressions = []
+    for build in BUILDS:
+        for name in COMPARED:
+            before = baseline.get(build, {}).get(name)
+            after = results[build].get(name)
+            if before and after and after > before * (1 + tolerance):
+                regressions.append(
+                    f"{build} {name}: {before:.2f} -> {after:.2f} "
+                    f"(+{(after - before) / before:.0%})"
+                )
+    return regressions
+
+
+def report(results: dict):
+    print(f"{'':14}" + "".join(f"{build:>14}" for build in BUILDS))
+    for name in COMPARED + ("theme_handlers", "git_subprocesses"):
+        row = [results[build].get(name) for build in BUILDS]
+        print(
+            f"{name:14}"
+            + "".join(
+                f"{'-' if value is None else round(value, 2):>14}" for value in row
+            )
+        )
+    handlers = results["full"].get("handlers", {})
+    if handlers:
+        print("\nSlowest theme handlers and steps (full build, seconds):")
+        for name, seconds in list(handlers.items())[:10]:
+            print(f"  {seconds:8.2f}  {name}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", type=int, default=200, help="pages in the book")
+    parser.add_argument("--depth", type=int, default=3, help="toctree depth")
+    parser.add_argument("--sections", type=int, default=5, help="sections per page")
+    parser.add_argument("--commits", type=int, default=20, help="commits of history")
+    parser.add_argument("--jobs", type=int, default=1, help="parallel Sphinx jobs")
+    parser.add_argument(
+        "--option",
+        action="append",
+        default=[],
+        help="boolean theme option to enable, such as shared_navigation",
+    )
+    parser.add_argument("--keep", help="build the book in this directory and keep it")
+    parser.add_argument("--baseline", type=Path, help="compare with these results")
+    parser.add_argument("--save-baseline", type=Path, help="save the results here")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.2,
+        help="allowed relative growth over the baseline (default 0.2)",
+    )
+    parser.add_argument("--build", nargs=2, type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.build:
+        print(json.dumps(run_build(*args.build, args.jobs)))
+        return 0
+
+    results = run_benchmark(args)
+    report(results)
+    if args.save_baseline:
+        args.save_baseline.parent.mkdir(parents=True, exist_ok=True)
+        args.save_baseline.write_text(json.dumps(results, indent=2) + "\n")
+    if args.baseline:
+        regressions = compare(
+            json.loads(args.baseline.read_text()), results, args.tolerance
+        )
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
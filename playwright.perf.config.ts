@@ -0,0 +1,33 @@
+import { defineConfig, devices } from "@playwright/test";
+
+/**
+ * Playwright configuration for browser performance budgets.
+ *
+ * Runs against the same locally served fixtures build as the visual tests
+ * (see playwright.config.ts). Tests run one at a time on a desktop viewport,
+ * so pages don't compete for the CPU while they are measured.
+ */
+export default defineConfig({
+  testDir: "./tests/performance",
+  fullyParallel: false,
+  forbidOnly: !!process.env.CI,
+  retries: process.env.CI ? 1 : 0,
+  workers: 1,
+  reporter: [
+    ["html", { open: "never", outputFolder: "playwright-report-perf" }],
+    ["list"],
+  ],
+
+  use: {
+    baseURL: process.env.BASE_URL || "http://localhost:8000",
+    ...devices["Desktop Chrome"],
+    viewport: { width: 1280, height: 720 },
+  },
+
+  webServer: {
+    command: `python -m http.server 8000 --directory ${process.env.SITE_PATH || "fixtures/_build/html"}`,
+    url: "http://localhost:8000",
+    reuseExistingServer: !process.env.CI,
+    timeout: 120 * 1000,
+  },
+});
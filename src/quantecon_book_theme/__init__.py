@@ -3,6 +3,9 @@
 from pathlib import Path
 import os
 import hashlib
+import json
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
 from functools import lru_cache
 import subprocess
 from datetime import datetime, timezone
@@ -11,9 +14,49 @@ from docutils import nodes
 from sphinx.util import logging
 from bs4 import BeautifulSoup as bs
 from sphinx.util.fileutil import copy_asset
-from sphinx.util.osutil import ensuredir
-
-from .launch import add_hub_urls
+from sphinx.util.osutil import ensuredir, relative_uri
+from urllib.parse import urlsplit
+
+from .images import (
+    add_responsive_page_images,
+    encode_responsive_images,
+    extract_page_images,
+    lazy_load_page_media,
+    merge_image_sizes,
+    write_responsive_images,
+)
+from .launch import (
+    add_hub_urls,
+    copy_notebooks,
+    defer_thebe,
+    disable_book_theme_launch_buttons,
+    init_launch_config,
+)
+from .mathjax import (
+    MATHJAX_SVG_SCALE,
+    check_math_prerender,
+    mathjax_macros,
+    mathjax_version,
+    prerender_page_math,
+    stop_math_renderer,
+)
+from .search import SEARCH_WORKER, write_search_shards
+from .outputs import defer_heavy_outputs, defer_widget_runtime, truncate_long_outputs
+from .metrics import (
+    clear_metrics,
+    count,
+    record_page_metrics,
+    track_lru_cache,
+    write_metrics,
+)
+from .profiling import clear_profile, profile_step, profiled, write_profile
+from .options import (
+    ColorScheme,
+    get_template_values,
+    get_theme_options,
+    init_theme_options,
+)
+from .service_worker import write_service_worker
 
 __version__ = "0.21.0"
 """quantecon-book-theme version"""
@@ -77,6 +120,7 @@ def get_git_last_modified(source_file, source_dir):
         file_path = Path(source_dir) / source_file
 
         # Check if git is available and we're in a git repo
+        count("git_subprocesses")
         result = subprocess.run(
             ["git", "rev-parse", "--git-dir"],
             cwd=source_dir,
@@ -88,6 +132,7 @@ def get_git_last_modified(source_file, source_dir):
             return None
 
         # Get the last commit date for this file
+        count("git_subprocesses")
         result = subprocess.run(
             ["git", "log", "-1", "--format=%ct", "--follow", "--", str(file_path)],
             cwd=source_dir,
@@ -128,6 +173,7 @@ def get_git_changelog(source_file, source_dir, max_entries=10):
         file_path = Path(source_dir) / source_file
 
         # Check if git is available and we're in a git repo
+        count("git_subprocesses")
         result = subprocess.run(
             ["git", "rev-parse", "--git-dir"],
             cwd=source_dir,
@@ -139,6 +185,7 @@ def get_git_changelog(source_file, source_dir, max_entries=10):
             return []
 
         # Get the changelog with format: hash|author|timestamp|subject
+        count("git_subprocesses")
         result = subprocess.run(
             [
                 "git",
@@ -191,6 +238,68 @@ def get_git_changelog(source_file, source_dir, max_entries=10):
     return []
 
 
+def write_changelog_json(app, pagename, changelog):
+    """Write the changelog entries for a page to a small JSON file.
+
+    The file is fetched by the browser the first time the changelog dropdown is
+    opened, which keeps the history markup out of the page HTML. The browser
+    computes the relative time of each entry from its date, so it does not go
+    stale. The file is only rewritten when the history changed.
+
+    Returns the path of the JSON file relative to the output directory.
+    """
+    entries = [
+        {
+            "hash": entry["hash"],
+            "author": entry["author"],
+            "date": entry["date"].isoformat(),
+            "message": entry["message"],
+        }
+        for entry in changelog
+    ]
+    relpath = changelog_json_path(pagename)
+    path = Path(app.outdir) / relpath
+    content = json.dumps(entries)
+    try:
+        if path.read_text(encoding="utf-8") == content:
+            return relpath
+    except OSError:
+        ensuredir(path.parent)
+    path.write_text(content, encoding="utf-8")
+    return relpath
+
+
+def changelog_json_path(pagename):
+    """The path of a page's changelog JSON, relative to the output directory."""
+    return f"_changelog/{pagename}.json"
+
+
+def write_changelogs(app, exception):
+    """Write the git history of every page for the lazily loaded changelog.
+
+    This is a ``build-finished`` sphinx event, enabled with the
+    ``lazy_changelog`` theme option. It runs on every build, also when no page
+    was written, so a change in the history does not need the pages to be
+    rendered again.
+    """
+    if exception is not None or app.builder.format != "html":
+        return
+    if not get_theme_options(app).lazy_changelog:
+        return
+    max_entries = get_theme_options(app).changelog_max_entries
+
+    def write(docname):
+        source_file = app.env.doc2path(docname, base=False)
+        changelog = get_git_changelog(source_file, app.srcdir, max_entries)
+        if changelog:
+            write_changelog_json(app, docname, changelog)
+        return bool(changelog)
+
+    with ThreadPoolExecutor() as executor:
+        written = sum(executor.map(write, sorted(app.env.found_docs)))
+    SPHINX_LOGGER.verbose("wrote the changelog of %d pages", written)
+
+
 def get_relative_time(past_date):
     """Convert a datetime to relative time string (e.g., '3 months ago')."""
     now = datetime.now(timezone.utc)
@@ -245,10 +354,234 @@ def _process_languages(config_theme):
     return [], ""
 
 
+def generate_sidebar_toctree(app, context, level=1, with_home_page=False):
+    """Return the sidebar toctree for the page being rendered as a soup."""
+    master_doc = app.config["master_doc"]
+
+    # Grab the raw toctree object and structure it so we can manipulate it
+    toctree = context["generate_toctree_html"](
+        startdepth=level - 1,
+        maxdepth=level + 1,
+        kind="sidebar",
+        collapse=False,
+        titles_only=True,
+        includehidden=True,
+    )
+    # toctree = bs(toc_sphinx, "html.parser")
+
+    # pair "current" with "active" since that's what we use w/ bootstrap
+    for li in toctree("li", {"class": "current"}):
+        li["class"].append("active")
+
+    # Add the master_doc page as the first item if specified
+    if with_home_page:
+        master_doctree = app.env.get_doctree(master_doc)
+        master_url = context["pathto"](master_doc)
+        master_title = master_doctree.traverse(nodes.title)[0].astext()
+        if len(master_title) == 0:
+            raise ValueError(f"Landing page missing a title: {master_doc}")
+        li_class = "toctree-l1"
+        if context["pagename"] == master_doc:
+            li_class += " current"
+        # Insert it into our toctree
+        ul_home = bs(
+            f"""
+        <ul class="nav bd-sidenav">
+            <li class="{li_class}">
+                <a href="{master_url}" class="reference internal">{master_title}</a>
+            </li>
+        </ul>""",
+            "html.parser",
+        )
+        toctree.insert(0, ul_home("ul")[0])
+
+    # Add an icon for external links
+    for a_ext in toctree("a", attrs={"class": ["external"]}):
+        a_ext.append(
+            toctree.new_tag("i", attrs={"class": ["fas", "fa-external-link-alt"]})
+        )
+
+    # Add bootstrap classes for first `ul` items
+    for ul in toctree("ul", recursive=False):
+        ul.attrs["class"] = ul.attrs.get("class", []) + ["nav", "sidenav_l1"]
+
+    return toctree
+
+
+# Shared sidebar navigation fragment of the current build, keyed by application
+_SHARED_NAVIGATION = {}
+# The path of the last fragment written for a book, kept in the doctree directory
+SHARED_NAVIGATION_RECORD = "qe-shared-navigation.txt"
+
+
+def _is_relative_url(href):
+    """Return True if ``href`` is a document-relative URL (no scheme, no root)."""
+    return not urlsplit(href).scheme and not href.startswith("/")
+
+
+def _root_relative_href(href, page_uri):
+    """Rewrite ``href`` (relative to ``page_uri``) so it is relative to the site root.
+
+    Anchors on the current page (``#`` or ``#section``) are resolved to the page
+    itself, external and absolute URLs are returned unchanged.
+    """
+    if not href or not _is_relative_url(href):
+        return href
+    path, _, anchor = href.partition("#")
+    if path:
+        normalized = posixpath.normpath(
+            posixpath.join(posixpath.dirname(page_uri), path)
+        )
+        # Keep the trailing slash of directory URLs, as written by dirhtml
+        if path.endswith("/") and not normalized.endswith("/"):
+            normalized += "/"
+        path = normalized
+    else:
+        path = page_uri
+    return f"{path}#{anchor}" if anchor else path
+
+
+def get_shared_navigation(app, pagename, toctree):
+    """Write the sidebar navigation once per build as a fingerprinted fragment.
+
+    The toctree generated for ``pagename`` is made page-independent: links are
+    rewritten relative to the site root and the current/active markers are
+    removed, so the browser can cache one copy for the whole book and mark the
+    current page client-side.
+
+    Returns a tuple of (fragment path relative to the output directory, html).
+    """
+    key = id(app)
+    if key in _SHARED_NAVIGATION:
+        return _SHARED_NAVIGATION[key]
+
+    page_uri = app.builder.get_target_uri(pagename)
+    soup = bs(str(toctree), "html.parser")
+    for a in soup("a", href=True):
+        a["href"] = _root_relative_href(a["href"], page_uri)
+    for tag in soup(class_=True):
+        classes = [c for c in tag["class"] if c not in ("current", "active")]
+        if classes:
+            tag["class"] = classes
+        else:
+            del tag["class"]
+    for details in soup("details", open=True):
+        del details["open"]
+    html = str(soup)
+
+    digest = hashlib.sha1(html.encode("utf-8")).hexdigest()[:16]
+    relpath = f"_static/navigation/sidebar-{digest}.html"
+    path = Path(app.outdir) / relpath
+    if not path.exists():
+        ensuredir(path.parent)
+        # Write atomically since parallel writers may race on the same fragment
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(html, encoding="utf-8")
+        os.replace(tmp_path, path)
+    # Recorded for the service worker, whose process may not have written a page
+    record = Path(app.doctreedir) / SHARED_NAVIGATION_RECORD
+    tmp_record = record.with_name(f"{record.name}.{os.getpid()}.tmp")
+    tmp_record.write_text(relpath, encoding="utf-8")
+    os.replace(tmp_record, record)
+
+    _SHARED_NAVIGATION[key] = (relpath, html)
+    return relpath, html
+
+
+def clear_shared_navigation(app):
+    """Drop the navigation fragment of a previous build in this process.
+
+    This is a ``builder-inited`` sphinx event.
+    """
+    _SHARED_NAVIGATION.pop(id(app), None)
+
+
+def get_shared_navigation_path(app):
+    """The path of the book's navigation fragment, relative to the output directory.
+
+    Read from the record written with the fragment, so it is known in the
+    main process of a parallel build and after a build that wrote no pages.
+    Returns None when the fragment does not exist.
+    """
+    record = Path(app.doctreedir) / SHARED_NAVIGATION_RECORD
+    try:
+        relpath = record.read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+    if not relpath or not (Path(app.outdir) / relpath).is_file():
+        return None
+    return relpath
+
+
+def add_shared_navigation(app, pagename, templatename, context, doctree):
+    """Serve the sidebar navigation as one cached fragment for the whole book.
+
+    Runs after the pydata theme has added its toctree functions to the context.
+    """
+    options = get_theme_options(app)
+    if not options.shared_navigation:
+        return
+
+    toctree = None
+    if id(app) not in _SHARED_NAVIGATION:
+        toctree = generate_sidebar_toctree(
+            app, context, with_home_page=options.home_page_in_toc
+        )
+    context["shared_nav_url"], context["shared_nav_html"] = get_shared_navigation(
+        app, pagename, toctree
+    )
+
+
+def shared_navigation_fallback(html, page_uri):
+    """Return a minimal, top-level-only sidebar for ``page_uri``.
+
+    This is inlined in every page so readers without JavaScript can still
+    navigate the book when the full tree is loaded from a shared fragment.
+    """
+    soup = bs(html, "html.parser")
+    for details in soup("details"):
+        details.decompose()
+    for li in soup("li", class_="has-children"):
+        li["class"].remove("has-children")
+    for a in soup("a", href=True):
+        href = a["href"]
+        if not _is_relative_url(href):
+            continue
+        if href == page_uri:
+            a["href"] = "#"
+            a["class"] = a.get("class", []) + ["current"]
+            li = a.find_parent("li")
+            if li is not None:
+                li["class"] = li.get("class", []) + ["current", "active"]
+        else:
+            a["href"] = relative_uri(page_uri, href)
+    return soup.prettify()
+
+
+def page_has_math(doctree) -> bool:
+    """Whether a doctree has inline or display math."""
+    if doctree is None:
+        return False
+    math = doctree.findall(
+        lambda node: isinstance(node, (nodes.math, nodes.math_block))
+    )
+    return next(iter(math), None) is not None
+
+
+def _is_mathjax_script(app, script) -> bool:
+    """Whether a ``script_files`` entry loads or configures MathJax."""
+    filename = getattr(script, "filename", script)
+    if app.config["mathjax_path"] and filename == app.config["mathjax_path"]:
+        return True
+    body = getattr(script, "attributes", {}).get("body", "")
+    return body.startswith(("window.MathJax", "MathJax.Hub.Config"))
+
+
 def add_to_context(app, pagename, templatename, context, doctree):
     """Functions and variable additions to context."""
 
     config_theme = app.config.html_theme_options
+    options = get_theme_options(app)
 
     def sbt_generate_toctree_html(
         level=1,
@@ -259,52 +592,16 @@ def add_to_context(app, pagename, templatename, context, doctree):
         if isinstance(with_home_page, str):
             with_home_page = with_home_page.lower() == "true"
 
-        # Grab the raw toctree object and structure it so we can manipulate it
-        toctree = context["generate_toctree_html"](
-            startdepth=level - 1,
-            maxdepth=level + 1,
-            kind="sidebar",
-            collapse=False,
-            titles_only=True,
-            includehidden=True,
-        )
-        # toctree = bs(toc_sphinx, "html.parser")
-
-        # pair "current" with "active" since that's what we use w/ bootstrap
-        for li in toctree("li", {"class": "current"}):
-            li["class"].append("active")
-
-        # Add the master_doc page as the first item if specified
-        if with_home_page:
-            master_title = master_doctree.traverse(nodes.title)[0].astext()
-            if len(master_title) == 0:
-                raise ValueError(f"Landing page missing a title: {master_doc}")
-            li_class = "toctree-l1"
-            if context["pagename"] == master_doc:
-                li_class += " current"
-            # Insert it into our toctree
-            ul_home = bs(
-                f"""
-            <ul class="nav bd-sidenav">
-                <li class="{li_class}">
-                    <a href="{master_url}" class="reference internal">{master_title}</a>
-                </li>
-            </ul>""",
-                "html.parser",
-            )
-            toctree.insert(0, ul_home("ul")[0])
-
-        # Add an icon for external links
-        for a_ext in toctree("a", attrs={"class": ["external"]}):
-            a_ext.append(
-                toctree.new_tag("i", attrs={"class": ["fas", "fa-external-link-alt"]})
+        # The full tree is served from a shared fragment, so only inline the
+        # minimal fallback navigation
+        if context.get("shared_nav_url"):
+            return shared_navigation_fallback(
+                context["shared_nav_html"], app.builder.get_target_uri(pagename)
             )
 
-        # Add bootstrap classes for first `ul` items
-        for ul in toctree("ul", recursive=False):
-            ul.attrs["class"] = ul.attrs.get("class", []) + ["nav", "sidenav_l1"]
-
-        return toctree.prettify()
+        with profile_step(app, pagename, "add_to_context.toctree"):
+            toctree = generate_sidebar_toctree(app, context, level, with_home_page)
+            return toctree.prettify()
 
     def generate_toc_html():
         """Return the within-page TOC links in HTML."""
@@ -312,6 +609,10 @@ def add_to_context(app, pagename, templatename, context, doctree):
         if not context.get("toc"):
             return ""
 
+        with profile_step(app, pagename, "add_to_context.toc"):
+            return _generate_toc_html()
+
+    def _generate_toc_html():
         soup = bs(context["toc"], "html.parser")
 
         # Add toc-hN classes
@@ -351,7 +652,7 @@ def add_to_context(app, pagename, templatename, context, doctree):
             github_repo = context["github_repo"]
             if github_repo in str(app.srcdir):
                 index = str(app.srcdir).rfind(github_repo)
-                branch = config_theme.get("nb_branch", "")
+                branch = options.nb_branch
                 if branch == "":
                     branch = "main"
                 folder = str(app.srcdir)[index + len(github_repo) :]
@@ -360,7 +661,6 @@ def add_to_context(app, pagename, templatename, context, doctree):
 
     # Pull metadata about the master doc
     master_doc = app.config["master_doc"]
-    master_doctree = app.env.get_doctree(master_doc)
     master_url = context["pathto"](master_doc)
     context["master_url"] = master_url
 
@@ -394,11 +694,12 @@ def add_to_context(app, pagename, templatename, context, doctree):
 
     # Add a shortened page text to the context using the sections text
     if not len(context["theme_description"]) > 0 and doctree:
-        description = ""
-        for section in doctree.traverse(nodes.section):
-            description += section.astext().replace("\n", " ")
-        description = description[:160]
-        context["theme_description"] = description
+        with profile_step(app, pagename, "add_to_context.description"):
+            description = ""
+            for section in doctree.traverse(nodes.section):
+                description += section.astext().replace("\n", " ")
+            description = description[:160]
+            context["theme_description"] = description
 
     # Add the author if it exists
     if app.config.author != "unknown":
@@ -411,22 +712,32 @@ def add_to_context(app, pagename, templatename, context, doctree):
             (app.config.html_baseurl.rstrip("/"), context["logo_url"])
         )
 
-    # Check mathjax version and set it in a variable
-    if app.config["mathjax_path"] and "@3" in app.config["mathjax_path"]:
-        context["mathjax_version"] = 3
-    else:
-        context["mathjax_version"] = 2
+    context["mathjax_version"] = mathjax_version(app)
+    context["mathjax_macros"] = mathjax_macros(app)
+    context["mathjax_svg_scale"] = MATHJAX_SVG_SCALE
+    # Only configure and load MathJax on pages with math, even when an
+    # extension asks Sphinx to link every asset on every page. Math that was
+    # typeset at build time (math_prerender) needs no MathJax either.
+    context["page_has_math"] = (
+        page_has_math(doctree) or bool(context.get("has_maths_elements"))
+    ) and not context.get("math_prerendered")
+    if not context["page_has_math"] and "script_files" in context:
+        context["script_files"] = [
+            script
+            for script in context["script_files"]
+            if not _is_mathjax_script(app, script)
+        ]
     # Add HTML context variables that the pydata theme uses that we configure elsewhere
     # For some reason the source_suffix sometimes isn't there even when doctree is
     if doctree and context.get("page_source_suffix"):
-        repo_url = config_theme.get("repository_url", "")
+        repo_url = options.repository_url
         # Only add the edit button if `repository_url` is given
         if repo_url:
-            branch = config_theme.get("repository_branch")
+            branch = options.repository_branch
             if not branch:
                 # Explicitly check in case branch is ""
                 branch = "main"
-            relpath = config_theme.get("path_to_docs", "")
+            relpath = options.path_to_docs
             org, repo = repo_url.strip("/").split("/")[-2:]
             context.update(
                 {
@@ -451,27 +762,36 @@ def add_to_context(app, pagename, templatename, context, doctree):
         source_dir = app.srcdir
 
         # Get last modified date
-        last_modified = get_git_last_modified(source_file, source_dir)
+        with profile_step(app, pagename, "add_to_context.git"):
+            last_modified = get_git_last_modified(source_file, source_dir)
         if last_modified:
-            # Get date format from theme options, default to "%b %d, %Y"
-            date_format = config_theme.get("last_modified_date_format", "%b %d, %Y")
-            context["last_modified_date"] = last_modified.strftime(date_format)
+            context["last_modified_date"] = last_modified.strftime(
+                options.last_modified_date_format
+            )
             context["last_modified_iso"] = last_modified.isoformat()
         else:
             context["last_modified_date"] = None
 
-        # Get changelog entries
-        max_changelog_entries = config_theme.get("changelog_max_entries", 10)
-        changelog = get_git_changelog(source_file, source_dir, max_changelog_entries)
+        # Get changelog entries, written for every page at the end of the
+        # build when they are loaded on demand
+        if options.lazy_changelog:
+            changelog = []
+            has_changelog = last_modified is not None
+        else:
+            with profile_step(app, pagename, "add_to_context.git"):
+                changelog = get_git_changelog(
+                    source_file, source_dir, options.changelog_max_entries
+                )
+            has_changelog = len(changelog) > 0
         context["changelog_entries"] = changelog
-        context["has_git_info"] = last_modified is not None and len(changelog) > 0
+        context["has_git_info"] = last_modified is not None and has_changelog
 
         # Add repository URL and source file for GitHub links
-        repo_url = config_theme.get("repository_url", "")
+        repo_url = options.repository_url
         if repo_url:
             context["theme_repository_url"] = repo_url.rstrip("/")
             # Construct full path including path_to_docs
-            path_to_docs = config_theme.get("path_to_docs", "")
+            path_to_docs = options.path_to_docs
             if path_to_docs:
                 full_source_path = f"{path_to_docs}/{source_file}".replace("//", "/")
             else:
@@ -480,6 +800,10 @@ def add_to_context(app, pagename, templatename, context, doctree):
         else:
             context["theme_repository_url"] = None
             context["theme_source_file"] = None
+
+        # Load the changelog on demand instead of rendering it into the page
+        if has_changelog and options.lazy_changelog:
+            context["changelog_url"] = changelog_json_path(pagename)
     else:
         context["last_modified_date"] = None
         context["changelog_entries"] = []
@@ -487,21 +811,25 @@ def add_to_context(app, pagename, templatename, context, doctree):
         context["theme_repository_url"] = None
         context["theme_source_file"] = None
 
+    # Toolbar search queries the sharded index from a web worker
+    if options.sharded_search:
+        worker = get_html_theme_path() / "static" / SEARCH_WORKER
+        context["search_worker_url"] = f"_static/{SEARCH_WORKER}"
+        if worker.exists():
+            context["search_worker_url"] += f"?digest={_gen_hash(worker)}"
+
     # Process language switcher configuration
     context["theme_languages"], context["theme_current_language"] = _process_languages(
         config_theme
     )
 
     # Make sure the context values are bool
-    blns = [
-        "theme_use_edit_page_button",
-        "theme_use_repository_button",
-        "theme_use_issues_button",
-        "theme_enable_rtl",
-    ]
-    for key in blns:
-        if key in context:
-            context[key] = _string_or_bool(context[key])
+    context.update(get_template_values(app))
+    # An option of the parent theme
+    if "theme_use_edit_page_button" in context:
+        context["theme_use_edit_page_button"] = _string_or_bool(
+            context["theme_use_edit_page_button"]
+        )
 
 
 @lru_cache(maxsize=None)
@@ -509,6 +837,9 @@ def _gen_hash(path: str) -> str:
     return hashlib.sha1(path.read_bytes()).hexdigest()
 
 
+track_lru_cache("asset_digests", _gen_hash)
+
+
 def hash_assets_for_files(assets: list, theme_static: Path, context):
     """Generate a hash for assets, and append to its entry in context.
 
@@ -544,10 +875,10 @@ def hash_assets_for_files(assets: list, theme_static: Path, context):
                     break
 
 
-def hash_html_assets(app, pagename, templatename, context, doctree):
-    """Add ?digest={hash} to assets in order to bust cache when changes are made.
+def get_theme_assets(app):
+    """List the theme assets that are linked with a digest.
 
-    The source files are in `static` while the built HTML is in `_static`.
+    Paths are relative to the theme's static folder.
     """
     assets = ["scripts/quantecon-book-theme.js"]
     # Only append the book theme CSS if it's explicitly this theme. Sub-themes
@@ -555,7 +886,50 @@ def hash_html_assets(app, pagename, templatename, context, doctree):
     # run but the book theme CSS file won't be linked in Sphinx.
     if app.config.html_theme == "quantecon_book_theme":
         assets.append("styles/quantecon-book-theme.css")
-    hash_assets_for_files(assets, get_html_theme_path() / "static", context)
+    return assets
+
+
+def get_asset_digests(app):
+    """Map the `_static` link of each theme asset to its digest."""
+    theme_static = get_html_theme_path() / "static"
+    return {
+        f"_static/{asset}": _gen_hash(theme_static / asset)
+        for asset in get_theme_assets(app)
+        if (theme_static / asset).exists()
+    }
+
+
+def hash_html_assets(app, pagename, templatename, context, doctree):
+    """Add ?digest={hash} to assets in order to bust cache when changes are made.
+
+    The source files are in `static` while the built HTML is in `_static`.
+    """
+    hash_assets_for_files(
+        get_theme_assets(app), get_html_theme_path() / "static", context
+    )
+
+
+def add_search_shards(app, exception):
+    """Split the search index into shards once the build has finished."""
+    if exception is not None or app.builder.format != "html":
+        return
+    if not get_theme_options(app).sharded_search:
+        return
+    write_search_shards(app)
+
+
+def add_service_worker(app, exception):
+    """Generate the offline service worker once the build has finished."""
+    if exception is not None or app.builder.format != "html":
+        return
+    if not get_theme_options(app).service_worker:
+        return
+    extra = []
+    if get_theme_options(app).shared_navigation:
+        fragment = get_shared_navigation_path(app)
+        if fragment is not None:
+            extra.append(fragment)
+    write_service_worker(app, get_asset_digests(app), extra)
 
 
 def add_pygments_style_class(app, pagename, templatename, context, doctree):
@@ -565,20 +939,11 @@ def add_pygments_style_class(app, pagename, templatename, context, doctree):
     disables the custom QuantEcon code token styles and allows Pygments
     built-in styles (configured via pygments_style) to be used.
     """
-    config_theme = app.config.html_theme_options
-    qetheme_code_style = config_theme.get("qetheme_code_style", True)
-
-    # Convert string "false"/"true" to boolean if needed
-    if isinstance(qetheme_code_style, str):
-        qetheme_code_style = qetheme_code_style.lower() != "false"
+    options = get_theme_options(app)
 
     # Set a context variable that can be used in templates
-    context["use_pygments_style"] = not qetheme_code_style
-
-    inline_literal_box = config_theme.get("inline_literal_box", False)
-    if isinstance(inline_literal_box, str):
-        inline_literal_box = inline_literal_box.lower() == "true"
-    context["inline_literal_box"] = inline_literal_box
+    context["use_pygments_style"] = not options.qetheme_code_style
+    context["inline_literal_box"] = options.inline_literal_box
 
 
 def setup_pygments_css(app):
@@ -590,16 +955,8 @@ def setup_pygments_css(app):
     """
     from pygments.formatters import HtmlFormatter
 
-    # Access html_theme_options from app.config (it's a dict)
-    config_theme = getattr(app.config, "html_theme_options", {})
-    qetheme_code_style = config_theme.get("qetheme_code_style", True)
-
-    # Convert string "false"/"true" to boolean if needed
-    if isinstance(qetheme_code_style, str):
-        qetheme_code_style = qetheme_code_style.lower() != "false"
-
     # When using Pygments styles, generate and include unscoped CSS
-    if not qetheme_code_style:
+    if not get_theme_options(app).qetheme_code_style:
         # Get the Pygments style name from config (default to 'default')
         pygments_style = getattr(app.config, "pygments_style", None) or "default"
 
@@ -628,7 +985,7 @@ def _string_or_bool(var):
 
 
 # Built-in text color schemes
-_VALID_COLOR_SCHEMES = ["seoul256", "gruvbox", "none"]
+_VALID_COLOR_SCHEMES = [scheme.value for scheme in ColorScheme]
 
 
 def validate_color_scheme(app):
@@ -640,18 +997,9 @@ def validate_color_scheme(app):
     Also checks for a custom_color_scheme.css in the project's _static
     directories and automatically includes it if found.
     """
-    theme_options = app.config.html_theme_options
-    scheme = theme_options.get("color_scheme", "seoul256").strip().lower()
-
-    if scheme not in _VALID_COLOR_SCHEMES:
-        SPHINX_LOGGER.warning(
-            "Unknown color_scheme %r. Valid schemes: %s. Falling back to 'seoul256'.",
-            scheme,
-            ", ".join(_VALID_COLOR_SCHEMES),
-        )
-        theme_options["color_scheme"] = "seoul256"
-    else:
-        theme_options["color_scheme"] = scheme
+    # Unknown schemes are reported when the options are resolved
+    scheme = get_theme_options(app).color_scheme
+    app.config.html_theme_options["color_scheme"] = scheme.value
 
     # Auto-detect custom_color_scheme.css in _static directories
     static_paths = getattr(app.config, "html_static_path", [])
@@ -674,15 +1022,43 @@ def setup(app):
     app.add_js_file("scripts/jquery.js")
     app.add_js_file("scripts/_sphinx_javascript_frameworks_compat.js")
 
-    app.connect("html-page-context", add_hub_urls)
+    app.connect("doctree-resolved", defer_heavy_outputs)
+    app.connect("doctree-resolved", truncate_long_outputs)
+    app.connect("html-page-context", profiled(add_hub_urls))
+    app.connect("html-page-context", profiled(extract_page_images))
+    app.connect("html-page-context", profiled(lazy_load_page_media))
+    app.connect("html-page-context", profiled(add_responsive_page_images))
+    app.connect("html-page-context", profiled(prerender_page_math))
+    app.connect("html-page-context", profiled(defer_widget_runtime))
+    app.connect("html-page-context", profiled(defer_thebe))
+    app.connect("config-inited", init_theme_options)
+    app.connect("builder-inited", init_theme_options)
     app.connect("builder-inited", add_plugins_list)
+    app.connect("builder-inited", clear_shared_navigation)
+    app.connect("builder-inited", clear_profile)
+    app.connect("builder-inited", clear_metrics)
     app.connect("builder-inited", validate_color_scheme)
     app.connect("builder-inited", setup_pygments_css)
-    app.connect("html-page-context", hash_html_assets)
-    app.connect("html-page-context", add_pygments_style_class)
+    app.connect("builder-inited", check_math_prerender)
+    app.connect("builder-inited", disable_book_theme_launch_buttons)
+    app.connect("builder-inited", init_launch_config)
+    app.connect("html-page-context", profiled(hash_html_assets))
+    app.connect("html-page-context", profiled(add_pygments_style_class))
 
     app.add_html_theme("quantecon_book_theme", get_html_theme_path())
-    app.connect("html-page-context", add_to_context)
+    app.connect("html-page-context", profiled(add_to_context))
+    app.connect("html-page-context", profiled(add_shared_navigation), priority=501)
+    app.connect("html-page-context", record_page_metrics, priority=999)
+    app.connect("env-updated", encode_responsive_images)
+    app.connect("build-finished", add_search_shards)
+    app.connect("build-finished", write_changelogs)
+    app.connect("build-finished", add_service_worker)
+    app.connect("build-finished", write_responsive_images)
+    app.connect("build-finished", merge_image_sizes)
+    app.connect("build-finished", stop_math_renderer)
+    app.connect("build-finished", copy_notebooks)
+    app.connect("build-finished", write_profile)
+    app.connect("build-finished", write_metrics)
     return {
         "parallel_read_safe": True,
         "parallel_write_safe": True,
@@ -10,8 +10,8 @@ import "../styles/index.scss";
 
 // Import feature modules
 import { initThemeSettings, initFontSize } from "./theme-settings.js";
-import { initSidebar } from "./sidebar.js";
-import { initSearch } from "./search.js";
+import { initSidebar, initSharedNavigation } from "./sidebar.js";
+import { initSearch, initSearchResults } from "./search.js";
 import { initFullscreen, initBackToTop } from "./navigation.js";
 import { initCollapsibleCode, initTableContainers } from "./code-blocks.js";
 import { initPopups, initLauncherSettings } from "./popups.js";
@@ -19,39 +19,89 @@ import { initPageHeader, initChangelog } from "./page-header.js";
 import { initStderrWarnings } from "./stderr-warnings.js";
 import { initScrollSpy } from "./scrollspy.js";
 import { initLanguageSwitcher } from "./language-switcher.js";
+import { initPrefetch } from "./prefetch.js";
+import { initInstantNavigation } from "./instant-navigation.js";
+import { initServiceWorker } from "./service-worker.js";
+import { initDeferredOutputs, initTruncatedOutputs } from "./outputs.js";
+import { initThebeLauncher } from "./thebe.js";
+import { measure, initPerfReporting } from "./perf.js";
+import { whenIdle } from "./scheduler.js";
+
+/**
+ * Page-scoped initialisers, re-run when instant navigation swaps the page
+ */
+function initPage() {
+  // Initialize content features that change what is painted
+  measure("initCollapsibleCode", initCollapsibleCode);
+  measure("initDeferredOutputs", initDeferredOutputs);
+  measure("initThebeLauncher", initThebeLauncher);
+  measure("initPageHeader", initPageHeader);
+  measure("initStderrWarnings", initStderrWarnings);
+
+  // Defer the features nobody needs at first paint
+  whenIdle("initTableContainers", initTableContainers);
+  whenIdle("initTruncatedOutputs", initTruncatedOutputs, {
+    selector: ".output-truncated-toggle",
+  });
+  whenIdle("initBackToTop", initBackToTop, { selector: ".btn__top" });
+  whenIdle("initChangelog", initChangelog, { selector: "#changelog-toggle" });
+  whenIdle("initScrollSpy", initScrollSpy);
+}
+
+/**
+ * Every initialiser run at DOMContentLoaded, each timed as `qe:<name>`
+ *
+ * Critical initialisers run right away; the rest are scheduled with
+ * `whenIdle` and run early when the reader reaches for their elements.
+ */
+function initTheme() {
+  // Report the timings when asked to
+  initPerfReporting();
 
-document.addEventListener("DOMContentLoaded", function () {
   // Load feather icon set
-  feather.replace();
+  measure("featherReplace", () => feather.replace());
 
   // Initialize theme settings (contrast/dark mode, font size)
-  initThemeSettings();
-  initFontSize();
+  measure("initThemeSettings", initThemeSettings);
+  measure("initFontSize", initFontSize);
 
   // Initialize navigation components
-  initSidebar();
-  initSearch();
-  initFullscreen();
-  initBackToTop();
+  measure("initSidebar", initSidebar);
+  measure("initSharedNavigation", initSharedNavigation);
+  measure("initSearch", initSearch);
+  measure("initSearchResults", initSearchResults);
 
-  // Initialize content features
-  initCollapsibleCode();
-  initTableContainers();
+  // Initialize page-scoped features
+  initPage();
+
+  whenIdle("initFullscreen", initFullscreen, { selector: ".btn__fullscreen" });
 
   // Initialize popups and modals
-  initPopups();
-  initLauncherSettings();
+  whenIdle("initPopups", initPopups, {
+    selector: "[data-tippy-content], #downloadButton, #settingsButton",
+  });
+  whenIdle("initLauncherSettings", initLauncherSettings, {
+    selector: "#settingsButton",
+  });
 
-  // Initialize page header features
-  initPageHeader();
-  initChangelog();
+  // Initialize language switcher
+  whenIdle("initLanguageSwitcher", initLanguageSwitcher, {
+    selector: ".language-switcher",
+  });
 
-  // Initialize stderr warnings
-  initStderrWarnings();
+  // Initialize prefetching of the next page and sidebar links
+  whenIdle("initPrefetch", initPrefetch);
 
-  // Initialize sticky TOC scroll tracking
-  initScrollSpy();
+  // Initialize instant navigation between pages
+  whenIdle("initInstantNavigation", initInstantNavigation, {
+    selector: "a[href]",
+    args: [initPage],
+  });
 
-  // Initialize language switcher
-  initLanguageSwitcher();
+  // Register the offline service worker
+  whenIdle("initServiceWorker", initServiceWorker);
+}
+
+document.addEventListener("DOMContentLoaded", function () {
+  measure("init", initTheme);
 });
@@ -0,0 +1,346 @@
+/**
+ * Instant Navigation Module
+ *
+ * When `instant_navigation` is enabled, internal links are followed by fetching
+ * the target page and swapping only the page-level region (`.qe-page`: content,
+ * page TOC, header and changelog). The sidebar and toolbar stay alive, and only
+ * the page-scoped initialisers are re-run. Anything unexpected falls back to a
+ * normal page load.
+ */
+
+import { markCurrentNavigation } from "./sidebar.js";
+
+let initPage = () => {};
+let loadedAssets = new Set();
+let navigationId = 0;
+let currentPage = "";
+
+/**
+ * The part of a URL that identifies a page
+ */
+function pageKey(url) {
+  return url.pathname + url.search;
+}
+
+/**
+ * Script and stylesheet URLs loaded by a document's head
+ */
+function headAssets(doc, baseURL) {
+  const assets = [];
+  doc.head.querySelectorAll("script[src]").forEach((script) => {
+    assets.push(new URL(script.getAttribute("src"), baseURL).href);
+  });
+  doc.head.querySelectorAll('link[rel="stylesheet"][href]').forEach((link) => {
+    assets.push(new URL(link.getAttribute("href"), baseURL).href);
+  });
+  return assets;
+}
+
+/**
+ * Whether an element contains scripts the browser would need to execute
+ */
+function hasExecutableScripts(root) {
+  // Widget runtimes render once per document (see outputs.js)
+  if (root.querySelector("#qe-deferred-output-scripts")) return true;
+  return Array.from(root.querySelectorAll("script")).some((script) => {
+    const type = (script.getAttribute("type") || "").trim().toLowerCase();
+    return (
+      type === "" ||
+      type === "module" ||
+      type === "text/javascript" ||
+      type === "application/javascript"
+    );
+  });
+}
+
+/**
+ * Rewrite relative URLs under root to absolute ones, so that links in the
+ * persistent regions keep working once the location changes
+ */
+function pinURLs(root, baseURL) {
+  if (!root) return;
+  root.querySelectorAll("a[href]").forEach((link) => {
+    link.setAttribute("href", new URL(link.getAttribute("href"), baseURL).href);
+  });
+  root.querySelectorAll("form[action]").forEach((form) => {
+    form.setAttribute(
+      "action",
+      new URL(form.getAttribute("action"), baseURL).href,
+    );
+  });
+}
+
+/**
+ * A stable key for each toolbar item, used to check that the new page has the
+ * same toolbar as the current one
+ */
+function toolbarKeys(toolbar) {
+  return Array.from(toolbar.querySelectorAll("li")).map(
+    (li) =>
+      `${li.id}|${li.dataset.tippyContent || ""}|${li.querySelectorAll("a").length}`,
+  );
+}
+
+/**
+ * Copy the page-specific links (notebook download, language versions, ...)
+ * from the new page's toolbar. Returns false when the toolbars differ.
+ */
+function syncToolbar(newDoc, baseURL) {
+  const toolbar = document.querySelector(".qe-toolbar");
+  const newToolbar = newDoc.querySelector(".qe-toolbar");
+  if (!toolbar || !newToolbar) return !toolbar && !newToolbar;
+
+  const keys = toolbarKeys(toolbar);
+  const newKeys = toolbarKeys(newToolbar);
+  if (keys.join("\n") !== newKeys.join("\n")) return false;
+
+  const links = toolbar.querySelectorAll("a[href]");
+  const newLinks = newToolbar.querySelectorAll("a[href]");
+  if (links.length !== newLinks.length) return false;
+  links.forEach((link, i) => {
+    link.setAttribute(
+      "href",
+      new URL(newLinks[i].getAttribute("href"), baseURL).href,
+    );
+  });
+  return true;
+}
+
+/**
+ * Find a popup template, which tippy moves out of the document
+ */
+function findTemplate(id, buttonId) {
+  const button = document.getElementById(buttonId);
+  if (button && button._tippy) return button._tippy.props.content;
+  return document.getElementById(id);
+}
+
+/**
+ * Update the notebook launcher with the new page's servers
+ */
+function syncLauncher(newDoc, baseURL) {
+  const modal = findTemplate("settingsModal", "settingsButton");
+  const newModal = newDoc.getElementById("settingsModal");
+  if (!modal || !newModal || !(modal instanceof Element)) return;
+
+  const select = modal.querySelector("#launcher-public-input");
+  const newSelect = newModal.querySelector("#launcher-public-input");
+  if (select && newSelect) {
+    select.replaceChildren(
+      ...Array.from(newSelect.options).map((option) =>
+        document.importNode(option, true),
+      ),
+    );
+  }
+
+  const launch = modal.querySelector("#advancedLaunchButton");
+  const newLaunch = newModal.querySelector("#advancedLaunchButton");
+  if (launch && newLaunch) {
+    launch.setAttribute(
+      "href",
+      new URL(newLaunch.getAttribute("href") || "", baseURL).href,
+    );
+  }
+
+  // Re-apply a previously chosen server, as the launcher script does on load
+  if (
+    typeof window.setLaunchServer === "function" &&
+    (localStorage.launcherPrivate !== undefined ||
+      localStorage.launcherPublic !== undefined)
+  ) {
+    window.setLaunchServer();
+  }
+}
+
+/**
+ * Re-run content initialisers from other Sphinx extensions
+ */
+function initExtensions(page) {
+  if (typeof addCopyButtonToCodeCells === "function") {
+    addCopyButtonToCodeCells();
+  }
+  if (typeof initToggleItems === "function") {
+    initToggleItems();
+  }
+
+  const MathJax = window.MathJax;
+  if (MathJax && typeof MathJax.typesetPromise === "function") {
+    MathJax.typesetPromise([page]).catch(() => {});
+  } else if (MathJax && MathJax.Hub) {
+    MathJax.Hub.Queue(["Typeset", MathJax.Hub, page]);
+  }
+}
+
+/**
+ * Scroll to the URL fragment, or to the top of the page
+ */
+function scrollToTarget(url, scroll) {
+  if (scroll) {
+    window.scrollTo(scroll.x, scroll.y);
+    return;
+  }
+  const id = decodeURIComponent(url.hash.slice(1));
+  const target = id && document.getElementById(id);
+  if (target) {
+    target.scrollIntoView();
+  } else {
+    window.scrollTo(0, 0);
+  }
+}
+
+/**
+ * Fetch a page and swap it in. Returns false if the page needs a full load.
+ */
+async function swapPage(url, { push = true, scroll = null } = {}) {
+  const id = ++navigationId;
+
+  const response = await fetch(url.href, { credentials: "same-origin" });
+  const contentType = response.headers.get("Content-Type") || "";
+  if (!response.ok || !contentType.includes("text/html")) return false;
+
+  const newDoc = new DOMParser().parseFromString(
+    await response.text(),
+    "text/html",
+  );
+  // A newer navigation has started in the meantime
+  if (id !== navigationId) return true;
+
+  const baseURL = new URL(response.url || url.href);
+  baseURL.hash = url.hash;
+
+  const page = document.querySelector(".qe-page");
+  const newPage = newDoc.querySelector(".qe-page");
+  const wrapper = newDoc.querySelector(".qe-wrapper");
+  if (!page || !newPage || !wrapper || !wrapper.dataset.instantNavigation) {
+    return false;
+  }
+  if (hasExecutableScripts(newPage)) return false;
+  if (headAssets(newDoc, baseURL).some((asset) => !loadedAssets.has(asset))) {
+    return false;
+  }
+  if (!syncToolbar(newDoc, baseURL)) return false;
+
+  // The new page's relative URLs resolve against the location, so update it
+  // before the content is inserted
+  if (push) {
+    history.replaceState(
+      { ...history.state, scroll: { x: window.scrollX, y: window.scrollY } },
+      "",
+    );
+    history.pushState({}, "", baseURL.href);
+  }
+
+  currentPage = pageKey(baseURL);
+  document.title = newDoc.title;
+  const contentRoot = newDoc.documentElement.dataset.content_root;
+  if (contentRoot !== undefined) {
+    document.documentElement.dataset.content_root = contentRoot;
+  }
+  document.body.classList.toggle(
+    "main-index",
+    newDoc.body.classList.contains("main-index"),
+  );
+
+  const MathJax = window.MathJax;
+  if (MathJax && typeof MathJax.typesetClear === "function") {
+    MathJax.typesetClear([page]);
+  }
+
+  const adopted = document.importNode(newPage, true);
+  page.replaceWith(adopted);
+  syncLauncher(newDoc, baseURL);
+  markCurrentNavigation();
+
+  initPage();
+  initExtensions(adopted);
+  scrollToTarget(baseURL, scroll);
+
+  // Move focus to the new page for keyboard and screen reader users
+  const heading = adopted.querySelector("h1");
+  if (heading) {
+    heading.setAttribute("tabindex", "-1");
+    heading.focus({ preventScroll: true });
+  }
+
+  document.dispatchEvent(
+    new CustomEvent("qe:page-load", { detail: { url: baseURL.href } }),
+  );
+  return true;
+}
+
+/**
+ * Navigate to url, falling back to a normal page load on any failure
+ */
+function navigate(url, options) {
+  swapPage(url, options)
+    .then((swapped) => {
+      if (!swapped) window.location.assign(url.href);
+    })
+    .catch(() => window.location.assign(url.href));
+}
+
+/**
+ * Whether a click on a link can be handled without a page load
+ */
+function isInstantLink(link, event) {
+  if (
+    event.defaultPrevented ||
+    event.button !== 0 ||
+    event.metaKey ||
+    event.ctrlKey ||
+    event.shiftKey ||
+    event.altKey
+  ) {
+    return false;
+  }
+  if (link.target && link.target !== "_self") return false;
+  if (link.hasAttribute("download")) return false;
+
+  const url = new URL(link.href, window.location.href);
+  if (url.origin !== window.location.origin) return false;
+  if (!/(\.html|\/)$/.test(url.pathname)) return false;
+
+  // Same-page anchors are left to the browser
+  return pageKey(url) !== pageKey(window.location);
+}
+
+/**
+ * Initialize instant navigation
+ *
+ * onPageLoad re-runs the page-scoped initialisers after each swap.
+ */
+export function initInstantNavigation(onPageLoad) {
+  const wrapper = document.querySelector(".qe-wrapper");
+  if (!wrapper || wrapper.dataset.instantNavigation !== "true") return;
+  if (!window.fetch || !window.DOMParser || !history.pushState) return;
+
+  initPage = onPageLoad || initPage;
+  currentPage = pageKey(window.location);
+  loadedAssets = new Set(headAssets(document, window.location.href));
+
+  // Links in the regions that outlive a navigation must not be relative
+  pinURLs(document.getElementById("qe-sidebar-nav"), window.location.href);
+  pinURLs(document.querySelector(".qe-toolbar"), window.location.href);
+
+  history.scrollRestoration = "manual";
+
+  document.addEventListener("click", function (event) {
+    const link = event.target.closest("a[href]");
+    if (!link || !link.closest(".qe-sidebar, .qe-page")) return;
+    if (!isInstantLink(link, event)) return;
+
+    event.preventDefault();
+    navigate(new URL(link.href, window.location.href));
+  });
+
+  window.addEventListener("popstate", function (event) {
+    // Moving between anchors of the page that is already shown
+    if (pageKey(window.location) === currentPage) return;
+
+    const state = event.state || {};
+    navigate(new URL(window.location.href), {
+      push: false,
+      scroll: state.scroll,
+    });
+  });
+}
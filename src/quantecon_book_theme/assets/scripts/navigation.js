@@ -40,10 +40,18 @@ export function initFullscreen() {
   });
 }
 
+// Margin observer of the current page, disconnected when the page is replaced
+let marginObserver = null;
+
 /**
  * Back to Top Button
  */
 export function initBackToTop() {
+  if (marginObserver) {
+    marginObserver.disconnect();
+    marginObserver = null;
+  }
+
   $(".btn__top").on("click", function (event) {
     event.preventDefault();
     event.stopPropagation();
@@ -77,4 +85,5 @@ export function initBackToTop() {
   });
 
   Array.from(targetElements).forEach((el) => observer.observe(el));
+  marginObserver = observer;
 }
@@ -0,0 +1,233 @@
+/**
+ * Outputs Module
+ *
+ * Hydrates the notebook outputs deferred by the `defer_outputs` option.
+ * Outputs with iframes, scripts or widgets are shipped inside a <template>
+ * and inserted when they come near the viewport, or when their button is
+ * clicked for click-to-load outputs.
+ *
+ * Widget views are rendered once, when the widget runtime loads, so the first
+ * deferred output to load inserts every widget of the page before loading the
+ * runtime the page would otherwise load in its head.
+ *
+ * Text outputs cut by the `output_max_lines` and `output_max_bytes` options
+ * get a toggle that fetches the rest of the output from its sidecar file.
+ */
+
+// Start loading outputs a bit before they scroll into view
+const ROOT_MARGIN = "400px 0px";
+const EXECUTABLE_TYPES = [
+  "",
+  "module",
+  "text/javascript",
+  "application/javascript",
+];
+
+// Observer of the current page, disconnected when the page is replaced
+let outputObserver = null;
+let runtime = null;
+
+/**
+ * Load a script from a list of attributes, resolving once it has run
+ */
+export function loadScript(attributes) {
+  return new Promise((resolve) => {
+    const script = document.createElement("script");
+    Object.entries(attributes).forEach(([name, value]) => {
+      script.setAttribute(name, value);
+    });
+    script.addEventListener("load", resolve);
+    script.addEventListener("error", resolve);
+    document.head.appendChild(script);
+  });
+}
+
+/**
+ * Replace an inert script with one the browser runs, resolving once it has
+ */
+function runScript(inert) {
+  return new Promise((resolve) => {
+    const script = document.createElement("script");
+    Array.from(inert.attributes).forEach(({ name, value }) => {
+      if (name !== "type" && name !== "data-qe-type") {
+        script.setAttribute(name, value);
+      }
+    });
+    if (inert.dataset.qeType) script.type = inert.dataset.qeType;
+    script.text = inert.text;
+    if (script.src) {
+      // Keep the order of the output's scripts
+      script.async = false;
+      script.addEventListener("load", resolve);
+      script.addEventListener("error", resolve);
+    }
+    inert.replaceWith(script);
+    if (!script.src) resolve();
+  });
+}
+
+/**
+ * Insert a deferred output into the page. Returns its scripts, kept inert so
+ * they can run in order, or null if the output was already inserted.
+ */
+function insertOutput(container) {
+  if (container.dataset.loaded) return null;
+  container.dataset.loaded = "true";
+  if (outputObserver) outputObserver.unobserve(container);
+
+  const template = container.querySelector(":scope > template");
+  if (!template) return [];
+  const output = template.content.cloneNode(true);
+  const scripts = [];
+  output.querySelectorAll("script").forEach((script) => {
+    const type = (script.getAttribute("type") || "").trim().toLowerCase();
+    if (EXECUTABLE_TYPES.includes(type)) {
+      script.dataset.qeType = type;
+      script.type = "text/qe-deferred";
+      scripts.push(script);
+    }
+  });
+  container.replaceChildren(output);
+  container.classList.add("qe-deferred-output--loaded");
+  return scripts;
+}
+
+/**
+ * Load the widget runtime deferred from the page head, once per page
+ */
+function loadRuntime() {
+  if (!runtime) {
+    const data = document.getElementById("qe-deferred-output-scripts");
+    const sources = data ? JSON.parse(data.textContent) : [];
+    const scripts = [];
+    if (sources.length > 0) {
+      document
+        .querySelectorAll('.qe-deferred-output[data-widget="true"]')
+        .forEach((container) => {
+          scripts.push(...(insertOutput(container) || []));
+        });
+    }
+    runtime = sources
+      .reduce(
+        (loaded, attributes) => loaded.then(() => loadScript(attributes)),
+        Promise.resolve(),
+      )
+      .then(() =>
+        scripts.reduce(
+          (ran, script) => ran.then(() => runScript(script)),
+          Promise.resolve(),
+        ),
+      );
+  }
+  return runtime;
+}
+
+/**
+ * Insert a deferred output and run its scripts
+ */
+async function loadOutput(container) {
+  const scripts = insertOutput(container);
+  if (scripts === null) return;
+  // Outputs may rely on the runtime (plotly uses require.js when present)
+  await loadRuntime();
+  for (const script of scripts) {
+    await runScript(script);
+  }
+}
+
+/**
+ * Initialize deferred outputs
+ */
+export function initDeferredOutputs() {
+  if (outputObserver) {
+    outputObserver.disconnect();
+    outputObserver = null;
+  }
+  runtime = null;
+
+  const containers = document.querySelectorAll(".qe-deferred-output");
+  if (containers.length === 0) return;
+
+  containers.forEach((container) => {
+    const button = container.querySelector(".qe-deferred-output__load");
+    if (button) {
+      button.addEventListener("click", () => loadOutput(container));
+    }
+  });
+
+  const viewport = Array.from(containers).filter(
+    (container) => container.dataset.defer === "viewport",
+  );
+  if (viewport.length === 0) return;
+
+  if (!("IntersectionObserver" in window)) {
+    viewport.forEach((container) => loadOutput(container));
+    return;
+  }
+
+  outputObserver = new IntersectionObserver(
+    (entries) => {
+      entries.forEach((entry) => {
+        if (entry.isIntersecting) loadOutput(entry.target);
+      });
+    },
+    { rootMargin: ROOT_MARGIN },
+  );
+  viewport.forEach((container) => outputObserver.observe(container));
+}
+
+/**
+ * Fetch the rest of a truncated output into its code block, once
+ */
+async function loadRest(button, block) {
+  let rest = block.querySelector(".output-truncated-rest");
+  if (rest) return rest;
+
+  const response = await fetch(button.dataset.src);
+  if (!response.ok) throw new Error(`HTTP ${response.status}`);
+  rest = document.createElement("span");
+  rest.className = "output-truncated-rest";
+  rest.textContent = await response.text();
+  block.querySelector("pre").appendChild(rest);
+  return rest;
+}
+
+/**
+ * Initialize the toggles of truncated outputs
+ */
+export function initTruncatedOutputs() {
+  document.querySelectorAll(".output-truncated-toggle").forEach((button) => {
+    const block = button.previousElementSibling;
+    if (!block || !block.classList.contains("output-truncated")) return;
+
+    const label = button.querySelector(".output-truncated-label");
+    const showText = label.textContent;
+
+    button.addEventListener("click", async (e) => {
+      e.preventDefault();
+      const isExpanded = button.getAttribute("aria-expanded") === "true";
+
+      if (isExpanded) {
+        // Collapse
+        block.querySelector(".output-truncated-rest").hidden = true;
+        button.setAttribute("aria-expanded", "false");
+        label.textContent = showText;
+        return;
+      }
+
+      // Expand
+      button.disabled = true;
+      try {
+        const rest = await loadRest(button, block);
+        rest.hidden = false;
+        button.setAttribute("aria-expanded", "true");
+        label.textContent = "Hide full output";
+      } catch (error) {
+        label.textContent = "Full output could not be loaded";
+        console.warn("Could not load the full output:", error);
+      } finally {
+        button.disabled = false;
+      }
+    });
+  });
+}
@@ -37,11 +37,19 @@ export function initPageHeader() {
   h1.insertAdjacentElement("afterend", newParagraph);
 }
 
+// Escape key listener of the current page, removed when the page is replaced
+let escapeListener = null;
+
 /**
  * Changelog Toggle
  * Handles the collapsible changelog section
  */
 export function initChangelog() {
+  if (escapeListener) {
+    document.removeEventListener("keydown", escapeListener);
+    escapeListener = null;
+  }
+
   const toggleButton = document.getElementById("changelog-toggle");
   const changelogContent = document.getElementById("changelog-content");
 
@@ -58,6 +66,7 @@ export function initChangelog() {
       changelogContent.classList.remove("expanded");
     } else {
       // Expand
+      loadChangelog(changelogContent.querySelector(".changelog-list"));
       toggleButton.setAttribute("aria-expanded", "true");
       changelogContent.setAttribute("aria-hidden", "false");
       changelogContent.classList.add("expanded");
@@ -65,7 +74,7 @@ export function initChangelog() {
   });
 
   // Close on escape key
-  document.addEventListener("keydown", function (e) {
+  escapeListener = function (e) {
     if (
       e.key === "Escape" &&
       toggleButton.getAttribute("aria-expanded") === "true"
@@ -74,5 +83,82 @@ export function initChangelog() {
       changelogContent.setAttribute("aria-hidden", "true");
       changelogContent.classList.remove("expanded");
     }
-  });
+  };
+  document.addEventListener("keydown", escapeListener);
+}
+
+/**
+ * Lazy Changelog
+ * Fetches the changelog entries the first time the list is opened when
+ * the page was built with `lazy_changelog`
+ */
+export function loadChangelog(list) {
+  if (!list || !list.dataset.src || list.dataset.loaded) return;
+  list.dataset.loaded = "true";
+
+  const repositoryUrl = list.dataset.repositoryUrl;
+
+  fetch(list.dataset.src)
+    .then((response) => {
+      if (!response.ok) throw new Error(response.statusText);
+      return response.json();
+    })
+    .then((entries) => {
+      const items = entries.map((entry) => {
+        const item = document.createElement("li");
+        item.className = "changelog-entry";
+
+        let hash;
+        if (repositoryUrl) {
+          hash = document.createElement("a");
+          hash.href = `${repositoryUrl}/commit/${entry.hash}`;
+        } else {
+          hash = document.createElement("span");
+        }
+        hash.className = "changelog-hash";
+        hash.textContent = entry.hash;
+        item.appendChild(hash);
+
+        const author = document.createElement("span");
+        author.className = "changelog-author";
+        author.textContent = entry.author;
+        const time = document.createElement("span");
+        time.className = "changelog-time";
+        time.textContent = relativeTime(new Date(entry.date));
+        const message = document.createElement("span");
+        message.className = "changelog-message";
+        message.textContent = entry.message;
+        item.append(author, time, message);
+        return item;
+      });
+      list.replaceChildren(...items);
+    })
+    .catch(() => {
+      // Allow another attempt the next time the changelog is opened
+      delete list.dataset.loaded;
+    });
+}
+
+// Units of the relative commit times, as in get_relative_time of the theme
+const TIME_UNITS = [
+  ["year", 31536000],
+  ["month", 2592000],
+  ["week", 604800],
+  ["day", 86400],
+  ["hour", 3600],
+  ["minute", 60],
+];
+
+/**
+ * Describe how long ago a date was, e.g. "3 months ago"
+ */
+export function relativeTime(date, now = new Date()) {
+  const seconds = (now - date) / 1000;
+  for (const [unit, size] of TIME_UNITS) {
+    if (seconds >= size) {
+      const n = Math.floor(seconds / size);
+      return `${n} ${unit}${n !== 1 ? "s" : ""} ago`;
+    }
+  }
+  return "just now";
 }
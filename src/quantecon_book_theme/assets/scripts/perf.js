@@ -0,0 +1,68 @@
+/**
+ * Performance Module
+ *
+ * Wraps the theme initialisers in `performance.mark`/`measure` pairs named
+ * `qe:<initialiser>`, so browser profiles show which of them dominate on a
+ * page. `qe:init` covers every initialiser run at DOMContentLoaded, and
+ * `qe:idle` (see scheduler.js) those run later in idle time.
+ *
+ * With the `qe-perf` query parameter (e.g. `page.html?qe-perf`), the measures
+ * are printed with `console.table`. With the `perf_report_url` option, they
+ * are sent to that endpoint with `navigator.sendBeacon` when the page is
+ * hidden.
+ */
+
+const PREFIX = "qe:";
+const DEBUG_PARAM = "qe-perf";
+
+/**
+ * Run an initialiser between two performance marks
+ */
+export function measure(name, init, ...args) {
+  const start = `${PREFIX}${name}:start`;
+  performance.mark(start);
+  try {
+    return init(...args);
+  } finally {
+    performance.measure(`${PREFIX}${name}`, start);
+  }
+}
+
+/**
+ * Report the theme's measures to the console or to the configured endpoint
+ */
+export function initPerfReporting() {
+  const meta = document.querySelector('meta[name="qe-perf-report"]');
+  const endpoint = meta ? meta.content : "";
+  const debug = new URLSearchParams(window.location.search).has(DEBUG_PARAM);
+  if ((!endpoint && !debug) || !("PerformanceObserver" in window)) return;
+
+  let pending = [];
+  const observer = new PerformanceObserver((list) => {
+    const entries = list
+      .getEntries()
+      .filter((entry) => entry.name.startsWith(PREFIX))
+      .map((entry) => ({
+        name: entry.name.slice(PREFIX.length),
+        start: Math.round(entry.startTime * 10) / 10,
+        duration: Math.round(entry.duration * 10) / 10,
+      }));
+    if (entries.length === 0) return;
+    if (debug) console.table(entries);
+    if (endpoint) pending.push(...entries);
+  });
+  // Buffered, so measures taken before this runs are reported too
+  observer.observe({ type: "measure", buffered: true });
+
+  if (!endpoint) return;
+  const send = () => {
+    if (pending.length === 0 || !navigator.sendBeacon) return;
+    const report = { page: window.location.pathname, measures: pending };
+    navigator.sendBeacon(endpoint, JSON.stringify(report));
+    pending = [];
+  };
+  document.addEventListener("visibilitychange", () => {
+    if (document.visibilityState === "hidden") send();
+  });
+  window.addEventListener("pagehide", send);
+}
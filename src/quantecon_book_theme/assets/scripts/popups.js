@@ -3,45 +3,73 @@
  * Handles Tippy.js popups for downloads, settings, and tooltips
  */
 
+// Tooltips not shown for this long are destroyed, and created again on demand
+const TOOLTIP_IDLE_MS = 30000;
+
+const POPUP_OPTIONS = {
+  theme: "light-border",
+  animation: "shift-away",
+  inertia: true,
+  duration: [200, 200],
+  arrow: true,
+  delay: [200, 200],
+  interactive: true,
+  trigger: "click",
+};
+
 export function initPopups() {
   // Download PDF popup
-  if (document.getElementById("downloadButton")) {
-    const template = document.getElementById("downloadPDFModal");
-    template.style.display = "block";
-    tippy("#downloadButton", {
-      content: template,
-      theme: "light-border",
-      animation: "shift-away",
-      inertia: true,
-      duration: [200, 200],
-      arrow: true,
-      delay: [200, 200],
-      interactive: true,
-      trigger: "click",
-    });
-  }
+  initClickPopup("downloadButton", "downloadPDFModal");
 
   // Notebook Launcher popup
-  if (document.getElementById("settingsButton")) {
-    const template = document.getElementById("settingsModal");
-    template.style.display = "block";
-    tippy("#settingsButton", {
-      content: template,
-      theme: "light-border",
-      animation: "shift-away",
-      inertia: true,
-      duration: [200, 200],
-      arrow: true,
-      delay: [200, 200],
-      interactive: true,
-      trigger: "click",
-    });
-  }
+  initClickPopup("settingsButton", "settingsModal");
 
   // General tooltips
-  tippy("[data-tippy-content]", {
+  document.addEventListener("pointerover", function (event) {
+    if (event.pointerType !== "touch") showTooltip(event.target);
+  });
+  document.addEventListener("focusin", function (event) {
+    showTooltip(event.target);
+  });
+}
+
+/**
+ * Build a popup on the first click of its button
+ */
+function initClickPopup(buttonId, templateId) {
+  const button = document.getElementById(buttonId);
+  if (!button) return;
+  button.addEventListener(
+    "click",
+    function () {
+      const template = document.getElementById(templateId);
+      template.style.display = "block";
+      // The popup's own click listener takes over from the next click
+      tippy(button, { ...POPUP_OPTIONS, content: template }).show();
+    },
+    { once: true },
+  );
+}
+
+/**
+ * Create the tooltip of an element when it is first hovered or focused
+ */
+function showTooltip(target) {
+  if (!(target instanceof Element)) return;
+  const reference = target.closest("[data-tippy-content]");
+  if (!reference || reference._tippy) return;
+
+  let timer = null;
+  const instance = tippy(reference, {
     touch: false,
+    onShow() {
+      clearTimeout(timer);
+    },
+    onHidden() {
+      timer = setTimeout(() => instance.destroy(), TOOLTIP_IDLE_MS);
+    },
   });
+  instance.show();
 }
 
 /**
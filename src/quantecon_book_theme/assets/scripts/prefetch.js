@@ -0,0 +1,149 @@
+/**
+ * Prefetch Module - Fetches likely next pages ahead of navigation
+ *
+ * The next page is prefetched with Speculation Rules emitted by the template
+ * (`prefetch_next_page`); this module adds a <link rel="prefetch"> fallback for
+ * browsers without Speculation Rules support. With `prefetch_sidebar_links`,
+ * sidebar links are also prefetched when hovered or focused.
+ */
+
+// Maximum number of prefetches in flight at once
+const MAX_CONCURRENT = 2;
+
+// Hover time (ms) before a link is considered an intent to navigate
+const HOVER_DELAY = 65;
+
+// Time (ms) after which a prefetch that has not finished frees its slot
+const SLOT_TIMEOUT = 5000;
+
+const prefetched = new Set();
+const queue = [];
+let inFlight = 0;
+
+/**
+ * Whether the reader has asked to save data or is on a slow connection
+ */
+function shouldSaveData() {
+  const connection = navigator.connection;
+  if (!connection) return false;
+  return (
+    connection.saveData === true ||
+    /(^|-)2g$/.test(connection.effectiveType || "")
+  );
+}
+
+/**
+ * Whether <link rel="prefetch"> is supported, and fires load/error events
+ */
+function supportsLinkPrefetch() {
+  const link = document.createElement("link");
+  return Boolean(
+    link.relList && link.relList.supports && link.relList.supports("prefetch"),
+  );
+}
+
+/**
+ * Take queued URLs while there is a free slot
+ */
+function drainQueue() {
+  while (inFlight < MAX_CONCURRENT && queue.length > 0) {
+    const url = queue.shift();
+    inFlight++;
+
+    // Free the slot once, on load, on error or after SLOT_TIMEOUT: browsers
+    // that ignore rel=prefetch fire neither event
+    let released = false;
+    const release = function () {
+      if (released) return;
+      released = true;
+      clearTimeout(timer);
+      inFlight--;
+      drainQueue();
+    };
+    const timer = setTimeout(release, SLOT_TIMEOUT);
+
+    if (supportsLinkPrefetch()) {
+      const link = document.createElement("link");
+      link.rel = "prefetch";
+      link.href = url;
+      link.onload = link.onerror = release;
+      document.head.appendChild(link);
+    } else {
+      // Warm the HTTP cache with a low priority fetch instead
+      fetch(url, { credentials: "same-origin", priority: "low" })
+        .catch(() => {})
+        .finally(release);
+    }
+  }
+}
+
+/**
+ * Queue a same-origin page for prefetching, at most once per URL
+ */
+export function prefetch(href) {
+  let url;
+  try {
+    url = new URL(href, window.location.href);
+  } catch (e) {
+    return;
+  }
+  if (url.origin !== window.location.origin) return;
+  url.hash = "";
+
+  // Nothing to gain from refetching the current page
+  const key = url.href;
+  const current = new URL(window.location.href);
+  current.hash = "";
+  if (key === current.href || prefetched.has(key)) return;
+
+  prefetched.add(key);
+  queue.push(key);
+  drainQueue();
+}
+
+/**
+ * Initialize prefetching of the next page and sidebar links
+ */
+export function initPrefetch() {
+  if (shouldSaveData()) return;
+
+  // Fall back to <link rel="prefetch"> where Speculation Rules are unsupported
+  const rules = document.querySelector('script[type="speculationrules"]');
+  const supportsRules =
+    HTMLScriptElement.supports && HTMLScriptElement.supports("speculationrules");
+  if (rules && !supportsRules) {
+    try {
+      const { prefetch: entries = [] } = JSON.parse(rules.textContent);
+      entries.forEach((entry) => (entry.urls || []).forEach(prefetch));
+    } catch (e) {
+      // Ignore malformed rules
+    }
+  }
+
+  const nav = document.getElementById("qe-sidebar-nav");
+  if (!nav || nav.dataset.prefetch !== "true") return;
+
+  // Delegate on the nav so links loaded later (shared navigation) are covered
+  let hoverTimer = null;
+  nav.addEventListener("mouseover", function (e) {
+    const link = e.target.closest("a[href]");
+    if (!link) return;
+    clearTimeout(hoverTimer);
+    hoverTimer = setTimeout(() => prefetch(link.href), HOVER_DELAY);
+  });
+  nav.addEventListener("mouseout", function (e) {
+    if (e.target.closest("a[href]")) clearTimeout(hoverTimer);
+  });
+  nav.addEventListener("focusin", function (e) {
+    const link = e.target.closest("a[href]");
+    if (link) prefetch(link.href);
+  });
+  nav.addEventListener(
+    "touchstart",
+    function (e) {
+      const link = e.target.closest("a[href]");
+      if (link) prefetch(link.href);
+    },
+    { passive: true },
+  );
+}
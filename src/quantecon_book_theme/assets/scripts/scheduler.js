@@ -0,0 +1,98 @@
+/**
+ * Scheduler Module
+ *
+ * Runs the initialisers nobody needs at first paint in idle time instead of
+ * at DOMContentLoaded. Pending tasks run in `requestIdleCallback` chunks of
+ * at most BUDGET_MS, in the order they were scheduled. A task with a
+ * `selector` is upgraded, i.e. run right away, when the reader points at,
+ * focuses or presses a key on a matching element, so its listeners are in
+ * place before the event reaches the element.
+ *
+ * The `qe:idle` measure spans from the first task scheduled on an empty queue
+ * until the queue drains, so together with `qe:init` it covers every
+ * initialiser of a page.
+ */
+
+import { measure } from "./perf.js";
+
+// Longest run of tasks in one idle period
+const BUDGET_MS = 10;
+// Run pending tasks at the latest this long after they were scheduled
+const IDLE_TIMEOUT_MS = 2000;
+const UPGRADE_EVENTS = ["pointerdown", "pointerover", "focusin", "keydown"];
+const QUEUE_MARK = "qe:idle:start";
+
+// Pending tasks by name, in the order they were scheduled
+const tasks = new Map();
+let idleHandle = null;
+let listening = false;
+// Whether the queue has pending tasks since its last `qe:idle` measure
+let queued = false;
+
+function requestIdle(callback) {
+  if ("requestIdleCallback" in window) {
+    return window.requestIdleCallback(callback, { timeout: IDLE_TIMEOUT_MS });
+  }
+  return window.setTimeout(
+    () => callback({ didTimeout: true, timeRemaining: () => 0 }),
+    1,
+  );
+}
+
+function runTask(name) {
+  const task = tasks.get(name);
+  if (!task) return;
+  tasks.delete(name);
+  try {
+    measure(name, task.init, ...task.args);
+  } catch (error) {
+    // Keep the remaining tasks running, as they would not depend on it
+    console.error(`${name} failed:`, error);
+  }
+  if (queued && tasks.size === 0) {
+    queued = false;
+    performance.measure("qe:idle", QUEUE_MARK);
+  }
+}
+
+function runChunk(deadline) {
+  idleHandle = null;
+  const start = performance.now();
+  for (const name of tasks.keys()) {
+    runTask(name);
+    const elapsed = performance.now() - start;
+    if (elapsed >= BUDGET_MS) break;
+    if (!deadline.didTimeout && deadline.timeRemaining() <= 1) break;
+  }
+  if (tasks.size > 0) idleHandle = requestIdle(runChunk);
+}
+
+function upgrade(event) {
+  const target = event.target;
+  if (!(target instanceof Element)) return;
+  for (const [name, task] of tasks) {
+    if (task.selector && target.closest(task.selector)) runTask(name);
+  }
+}
+
+/**
+ * Run an initialiser when the browser is idle, timed as `qe:<name>`
+ *
+ * Scheduling a name that is still pending replaces its task, so re-running
+ * the page initialisers after instant navigation does not queue them twice.
+ */
+export function whenIdle(name, init, { selector = null, args = [] } = {}) {
+  if (!queued) {
+    queued = true;
+    performance.mark(QUEUE_MARK);
+  }
+  tasks.set(name, { init, selector, args });
+
+  if (!listening) {
+    listening = true;
+    UPGRADE_EVENTS.forEach((type) =>
+      document.addEventListener(type, upgrade, { capture: true, passive: true }),
+    );
+  }
+  if (idleHandle === null) idleHandle = requestIdle(runChunk);
+}
@@ -5,11 +5,19 @@
  * It highlights the currently visible section in the TOC as the user scrolls.
  */
 
+// Scroll listener of the current page, removed when the page is replaced
+let scrollListener = null;
+
 /**
  * Initialize ScrollSpy for the sticky table of contents
  * Only activates when the .sticky class is present on the TOC inner container
  */
 export function initScrollSpy() {
+  if (scrollListener) {
+    window.removeEventListener("scroll", scrollListener);
+    scrollListener = null;
+  }
+
   // Only initialize if sticky TOC is enabled
   const stickyContainer = document.querySelector(".inner.sticky");
   if (!stickyContainer) {
@@ -199,6 +207,7 @@ export function initScrollSpy() {
 
   // Listen for scroll events
   window.addEventListener("scroll", onScroll, { passive: true });
+  scrollListener = onScroll;
 
   // Initial update
   updateActiveSection();
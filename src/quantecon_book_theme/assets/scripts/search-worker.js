@@ -0,0 +1,172 @@
+/**
+ * Search Worker
+ *
+ * Runs toolbar search queries off the main thread against the sharded index
+ * written with the `sharded_search` option. Only the shards for the prefixes
+ * of the query words are downloaded, and each one at most once.
+ *
+ * Messages:
+ *   { type: "init", indexURL, languageDataURL }
+ *   { type: "query", id, query }  ->  { type: "results", id, results }
+ */
+
+// Scores follow the defaults of Sphinx's searchtools
+const SCORE_TITLE = 15;
+const SCORE_TERM = 5;
+const SCORE_PARTIAL_TITLE = 7;
+const SCORE_PARTIAL_TERM = 2;
+const MAX_RESULTS = 10;
+
+let meta = null;
+let indexURL = null;
+let stemmer = null;
+let stopWords = new Set();
+const shards = new Map();
+
+/**
+ * Fetch JSON, preferring the gzip-compressed copy when it can be decompressed
+ */
+async function fetchJSON(url, options = {}) {
+  if (typeof DecompressionStream === "function") {
+    try {
+      const response = await fetch(`${url}.gz`, options);
+      if (response.ok) {
+        const stream = response.body.pipeThrough(
+          new DecompressionStream("gzip"),
+        );
+        return await new Response(stream).json();
+      }
+    } catch (e) {
+      // The server may already decode .gz files, use the plain copy
+    }
+  }
+  const response = await fetch(url, options);
+  if (!response.ok) throw new Error(response.statusText);
+  return response.json();
+}
+
+/**
+ * Load the shard holding the terms that start with prefix
+ */
+function loadShard(prefix) {
+  const file = meta.shards[prefix];
+  if (!file) return Promise.resolve(null);
+  if (!shards.has(prefix)) {
+    shards.set(
+      prefix,
+      fetchJSON(new URL(file, indexURL).href).catch(() => {
+        shards.delete(prefix);
+        return null;
+      }),
+    );
+  }
+  return shards.get(prefix);
+}
+
+/**
+ * The documents a term points to (a single index or a list of them)
+ */
+function docsOf(value) {
+  if (value === undefined) return [];
+  return Array.isArray(value) ? value : [value];
+}
+
+/**
+ * Add the scores of one query word to a Map of document -> score
+ */
+function scoreWord(shard, stem, word, partial, scores) {
+  const add = (docs, score) => {
+    docsOf(docs).forEach((doc) => {
+      scores.set(doc, Math.max(scores.get(doc) || 0, score));
+    });
+  };
+
+  add(shard.titleterms[stem], SCORE_TITLE);
+  add(shard.terms[stem], SCORE_TERM);
+
+  // Complete the word being typed
+  if (partial && word.length >= meta.prefixLength) {
+    for (const [term, docs] of Object.entries(shard.titleterms)) {
+      if (term !== stem && term.startsWith(word)) add(docs, SCORE_PARTIAL_TITLE);
+    }
+    for (const [term, docs] of Object.entries(shard.terms)) {
+      if (term !== stem && term.startsWith(word)) add(docs, SCORE_PARTIAL_TERM);
+    }
+  }
+}
+
+/**
+ * Find the pages matching every word of the query
+ */
+async function search(query) {
+  const words = query
+    .toLowerCase()
+    .split(/[^\p{L}\p{N}_]+/u)
+    .filter(Boolean);
+  if (words.length === 0) return [];
+
+  // The last word is still being typed unless the query ends with a space
+  const typing = !/\s$/.test(query);
+
+  let totals = null;
+  for (let i = 0; i < words.length; i++) {
+    const word = words[i];
+    const partial = typing && i === words.length - 1;
+    if (!partial && stopWords.has(word)) continue;
+
+    const stem = stemmer ? stemmer.stemWord(word) : word;
+    const scores = new Map();
+    const prefixes = new Set([
+      stem.slice(0, meta.prefixLength),
+      word.slice(0, meta.prefixLength),
+    ]);
+    for (const prefix of prefixes) {
+      const shard = await loadShard(prefix);
+      if (shard) scoreWord(shard, stem, word, partial, scores);
+    }
+
+    if (totals === null) {
+      totals = scores;
+    } else {
+      for (const doc of totals.keys()) {
+        if (!scores.has(doc)) totals.delete(doc);
+        else totals.set(doc, totals.get(doc) + scores.get(doc));
+      }
+    }
+    if (totals.size === 0) return [];
+  }
+  if (totals === null) return [];
+
+  return Array.from(totals.entries())
+    .sort((a, b) => b[1] - a[1] || a[0] - b[0])
+    .slice(0, MAX_RESULTS)
+    .map(([doc]) => ({ title: meta.titles[doc], url: meta.urls[doc] }));
+}
+
+let ready = null;
+
+self.addEventListener("message", (event) => {
+  const data = event.data;
+
+  if (data.type === "init" && !ready) {
+    indexURL = new URL(data.indexURL);
+    try {
+      importScripts(data.languageDataURL);
+      // Defined by Sphinx's language_data.js
+      if (typeof Stemmer === "function") stemmer = new Stemmer();
+      if (typeof stopwords !== "undefined") stopWords = new Set(stopwords);
+    } catch (e) {
+      // Search unstemmed words
+    }
+    ready = fetchJSON(indexURL.href, { cache: "no-cache" }).then((index) => {
+      meta = index;
+    });
+  } else if (data.type === "query" && ready) {
+    ready
+      .then(() => search(data.query))
+      .catch(() => [])
+      .then((results) => {
+        self.postMessage({ type: "results", id: data.id, results });
+      });
+  }
+});
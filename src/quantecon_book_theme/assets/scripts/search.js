@@ -29,3 +29,152 @@ export function initSearch() {
     }
   });
 }
+
+/**
+ * As-you-type Search Results
+ * Queries the sharded index in a web worker (`sharded_search`) and lists the
+ * best matches in a dropdown under the toolbar search input
+ */
+export function initSearchResults() {
+  const input = document.getElementById("search-input");
+  const form = input && input.closest("form");
+  if (!form || !form.dataset.searchWorker || !window.Worker) return;
+
+  // Resolve now, the page (and its relative paths) may change later
+  const workerURL = new URL(form.dataset.searchWorker, window.location.href);
+  const indexURL = new URL(form.dataset.searchIndex, window.location.href);
+  const languageDataURL = new URL(
+    form.dataset.languageData,
+    window.location.href,
+  );
+  const rootURL = new URL(form.dataset.contentRoot || "", window.location.href);
+  const searchPageURL = new URL(form.getAttribute("action"), window.location.href);
+
+  const results = document.createElement("ul");
+  results.className = "qe-search__results";
+  results.id = "qe-search-results";
+  results.setAttribute("role", "listbox");
+  results.hidden = true;
+  form.parentElement.appendChild(results);
+
+  input.setAttribute("role", "combobox");
+  input.setAttribute("aria-controls", results.id);
+  input.setAttribute("aria-expanded", "false");
+  input.setAttribute("aria-autocomplete", "list");
+
+  let worker = null;
+  let lastId = 0;
+  let timer = null;
+  let active = -1;
+
+  function getWorker() {
+    if (!worker) {
+      worker = new Worker(workerURL);
+      worker.addEventListener("message", (event) => {
+        if (event.data.type === "results" && event.data.id === lastId) {
+          render(event.data.results);
+        }
+      });
+      worker.postMessage({
+        type: "init",
+        indexURL: indexURL.href,
+        languageDataURL: languageDataURL.href,
+      });
+    }
+    return worker;
+  }
+
+  function close() {
+    results.hidden = true;
+    input.setAttribute("aria-expanded", "false");
+    input.removeAttribute("aria-activedescendant");
+    active = -1;
+  }
+
+  function setActive(index) {
+    const items = results.querySelectorAll("li");
+    if (items.length === 0) return;
+    active = (index + items.length) % items.length;
+    items.forEach((item, i) => {
+      item.classList.toggle("is-active", i === active);
+      item.setAttribute("aria-selected", i === active ? "true" : "false");
+    });
+    input.setAttribute("aria-activedescendant", items[active].id);
+  }
+
+  function addItem(href, text, className) {
+    const item = document.createElement("li");
+    item.id = `qe-search-result-${results.children.length}`;
+    item.setAttribute("role", "option");
+    if (className) item.className = className;
+    const link = document.createElement("a");
+    link.href = href;
+    link.textContent = text;
+    item.appendChild(link);
+    results.appendChild(item);
+  }
+
+  function render(matches) {
+    const query = input.value.trim();
+    results.replaceChildren();
+    active = -1;
+    if (!query) {
+      close();
+      return;
+    }
+
+    matches.forEach((match) => {
+      const url = new URL(match.url, rootURL);
+      url.searchParams.set("highlight", query);
+      addItem(url.href, match.title);
+    });
+
+    // Full results on Sphinx's search page
+    const all = new URL(searchPageURL);
+    all.searchParams.set("q", query);
+    addItem(
+      all.href,
+      matches.length ? "See all results" : "No quick matches, search all pages",
+      "qe-search__all",
+    );
+
+    results.hidden = false;
+    input.setAttribute("aria-expanded", "true");
+  }
+
+  input.addEventListener("focus", getWorker, { once: true });
+
+  input.addEventListener("input", function () {
+    clearTimeout(timer);
+    const query = input.value;
+    if (!query.trim()) {
+      lastId++;
+      close();
+      return;
+    }
+    timer = setTimeout(() => {
+      getWorker().postMessage({ type: "query", id: ++lastId, query });
+    }, 80);
+  });
+
+  input.addEventListener("keydown", function (e) {
+    if (results.hidden) return;
+    if (e.key === "ArrowDown") {
+      e.preventDefault();
+      setActive(active + 1);
+    } else if (e.key === "ArrowUp") {
+      e.preventDefault();
+      setActive(active - 1);
+    } else if (e.key === "Enter" && active >= 0) {
+      e.preventDefault();
+      results.querySelectorAll("a")[active].click();
+    } else if (e.key === "Escape") {
+      close();
+    }
+  });
+
+  // Close when focus leaves both the input and the results
+  form.parentElement.addEventListener("focusout", function (e) {
+    if (!form.parentElement.contains(e.relatedTarget)) close();
+  });
+}
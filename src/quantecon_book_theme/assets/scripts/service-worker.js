@@ -0,0 +1,24 @@
+/**
+ * Service Worker Registration
+ * Registers the offline service worker generated with `service_worker`
+ */
+
+export function initServiceWorker() {
+  const meta = document.querySelector('meta[name="qe-service-worker"]');
+  if (!meta || !("serviceWorker" in navigator)) return;
+
+  const register = () => {
+    navigator.serviceWorker
+      .register(meta.content, { scope: meta.dataset.scope || "./" })
+      .catch(() => {
+        // Not available (e.g. file:// URLs), the site works as before
+      });
+  };
+
+  // Keep registration off the critical path of the first page load
+  if (document.readyState === "complete") {
+    register();
+  } else {
+    window.addEventListener("load", register, { once: true });
+  }
+}
@@ -25,20 +25,14 @@ export function initSidebar() {
     localStorage.setSidebar = 0;
   }
 
-  // Restore sidebar state from localStorage
-  function setSidebar() {
-    const setSidebar = localStorage.setSidebar;
-    if (
-      setSidebar == 1 &&
-      $sidebar.hasClass("persistent") &&
-      $(window).width() > 1340
-    ) {
-      openSidebar();
-    }
+  // The saved open state of a persistent sidebar is set on <html> before
+  // first paint (see the head script in layout.html)
+  const root = document.documentElement;
+  if (root.classList.contains("qe-sidebar-open")) {
+    openSidebar();
+    root.classList.remove("qe-sidebar-open");
   }
 
-  setSidebar();
-
   // Toggle sidebar on button click
   $(document).on("click", ".btn__sidebar", function (event) {
     event.preventDefault();
@@ -58,3 +52,71 @@ export function initSidebar() {
     }
   });
 }
+
+/**
+ * Shared Navigation
+ * Replaces the minimal inline sidebar with the book-wide navigation fragment
+ * (written once per build and cached by the browser) and marks the current page
+ */
+export function initSharedNavigation() {
+  const nav = document.getElementById("qe-sidebar-nav");
+  if (!nav || !nav.dataset.sharedNav) return;
+
+  const fragmentURL = new URL(nav.dataset.sharedNav, window.location.href);
+  const rootURL = new URL(nav.dataset.contentRoot || "", window.location.href);
+
+  fetch(fragmentURL)
+    .then((response) => {
+      if (!response.ok) throw new Error(response.statusText);
+      return response.text();
+    })
+    .then((html) => {
+      const template = document.createElement("template");
+      template.innerHTML = html;
+
+      // Fragment links are relative to the site root
+      template.content.querySelectorAll("a[href]").forEach((link) => {
+        const href = link.getAttribute("href");
+        if (/^[a-z][a-z0-9+.-]*:/i.test(href) || href.startsWith("/")) return;
+        link.setAttribute("href", new URL(href, rootURL).href);
+      });
+
+      markCurrentNavigation(template.content);
+      nav.replaceChildren(template.content);
+    })
+    .catch(() => {
+      // Keep the inline fallback navigation
+    });
+}
+
+/**
+ * Mark the sidebar entry for the current page (and its ancestors) as active
+ */
+export function markCurrentNavigation(
+  root = document.getElementById("qe-sidebar-nav"),
+) {
+  if (!root) return;
+
+  const normalize = (path) => path.replace(/\/index\.html$/, "/");
+  const here = normalize(window.location.pathname);
+
+  root.querySelectorAll(".current, .active").forEach((el) => {
+    el.classList.remove("current", "active");
+  });
+
+  root.querySelectorAll("a[href]").forEach((link) => {
+    const url = new URL(link.getAttribute("href"), window.location.href);
+    if (url.origin !== window.location.origin || url.hash) return;
+    if (normalize(url.pathname) !== here) return;
+
+    link.classList.add("current");
+    let li = link.closest("li");
+    while (li) {
+      li.classList.add("current", "active");
+      const details = li.querySelector(":scope > details");
+      if (details) details.setAttribute("open", "open");
+      if (li.parentElement) li.parentElement.classList.add("current");
+      li = li.parentElement ? li.parentElement.closest("li") : null;
+    }
+  });
+}
@@ -0,0 +1,78 @@
+/**
+ * Thebe Module
+ *
+ * Loads Thebe when the reader first activates live code. With
+ * `launch_buttons.thebe`, the sphinx-thebe script and stylesheet are kept out
+ * of the page head, and the `initThebe()` call of the Thebe launch buttons
+ * loads them first. sphinx-thebe then fetches the Thebe runtime and requests
+ * a kernel as usual.
+ *
+ * The configured BinderHub, if any, is only preconnected once the reader
+ * reaches for a launch button, so readers who never run code make no
+ * requests to it.
+ */
+
+import { loadScript } from "./outputs.js";
+
+let loading = null;
+
+/**
+ * Add a preconnect hint for each host, once
+ */
+function preconnect(hosts) {
+  hosts.forEach((host) => {
+    if (document.head.querySelector(`link[rel="preconnect"][href="${host}"]`)) {
+      return;
+    }
+    const link = document.createElement("link");
+    link.rel = "preconnect";
+    link.href = host;
+    link.crossOrigin = "";
+    document.head.appendChild(link);
+  });
+}
+
+/**
+ * Load the deferred sphinx-thebe assets, once per page
+ */
+function loadThebe(assets) {
+  if (!loading) {
+    preconnect(assets.preconnect);
+    assets.stylesheets.forEach((href) => {
+      const link = document.createElement("link");
+      link.rel = "stylesheet";
+      link.href = href;
+      document.head.appendChild(link);
+    });
+    loading = assets.scripts.reduce(
+      (loaded, attributes) => loaded.then(() => loadScript(attributes)),
+      Promise.resolve(),
+    );
+  }
+  return loading;
+}
+
+/**
+ * Initialize on-demand Thebe loading
+ */
+export function initThebeLauncher() {
+  const data = document.getElementById("qe-thebe-assets");
+  if (!data) return;
+  const assets = JSON.parse(data.textContent);
+
+  document.querySelectorAll(".thebe-launch-button").forEach((button) => {
+    ["pointerenter", "focus"].forEach((type) => {
+      button.addEventListener(type, () => preconnect(assets.preconnect), {
+        once: true,
+      });
+    });
+  });
+
+  // sphinx-thebe defines the real initThebe, replacing this one, once loaded
+  if (typeof window.initThebe === "function") return;
+  const launch = () =>
+    loadThebe(assets).then(() => {
+      if (window.initThebe !== launch) window.initThebe();
+    });
+  window.initThebe = launch;
+}
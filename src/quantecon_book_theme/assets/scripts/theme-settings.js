@@ -4,23 +4,24 @@
  */
 
 export function initThemeSettings() {
+  const root = document.documentElement;
   const $body = $("body");
   const $lightLogo = $(".logo-img");
   const $darkLogo = $(".dark-logo-img");
 
-  // Set contrast from localStorage on page load
-  function setContrast() {
-    const setContrast = localStorage.setContrast;
-    if (setContrast == 1) {
-      $body.addClass("dark-theme");
-      $(".btn__contrast").addClass("btn-active");
-      document.documentElement.setAttribute('data-theme', 'dark');
-    } else {
-      document.documentElement.setAttribute('data-theme', 'light');
-    }
+  // The saved contrast is applied to <html> before first paint (see the
+  // head script in layout.html). <body> keeps the class for stylesheets
+  // that still select body.dark-theme.
+  function setContrast(dark) {
+    root.classList.toggle("dark-theme", dark);
+    root.setAttribute("data-theme", dark ? "dark" : "light");
+    $body.toggleClass("dark-theme", dark);
   }
 
-  setContrast();
+  if (root.classList.contains("dark-theme")) {
+    setContrast(true);
+    $(".btn__contrast").addClass("btn-active");
+  }
 
   // Toggle contrast/dark mode
   $(".btn__contrast").on("click", function (event) {
@@ -30,13 +31,11 @@ export function initThemeSettings() {
     if ($(this).hasClass("btn-active")) {
       $(this).removeClass("btn-active");
       localStorage.setContrast = 0;
-      $body.removeClass("dark-theme");
-      document.documentElement.setAttribute('data-theme', 'light');
+      setContrast(false);
     } else {
       $(this).addClass("btn-active");
       localStorage.setContrast = 1;
-      $body.addClass("dark-theme");
-      document.documentElement.setAttribute('data-theme', 'dark');
+      setContrast(true);
       if (!$darkLogo.length) {
         $lightLogo.css("display", "block");
       }
@@ -63,12 +62,12 @@ export function initFontSize() {
     }
   }
 
-  setFontSize();
-
+  // The saved font size is applied to <html> before first paint, so only
+  // the buttons are wired up here
   $(".btn__plus").on("click", function (event) {
     event.preventDefault();
     event.stopPropagation();
-    let toolbarFont = parseInt(localStorage.getItem("toolbarFont")) + 1;
+    let toolbarFont = (parseInt(localStorage.getItem("toolbarFont")) || 0) + 1;
     if (toolbarFont > 0) {
       toolbarFont = 1;
     }
@@ -79,7 +78,7 @@ export function initFontSize() {
   $(".btn__minus").on("click", function (event) {
     event.preventDefault();
     event.stopPropagation();
-    let toolbarFont = parseInt(localStorage.getItem("toolbarFont")) - 1;
+    let toolbarFont = (parseInt(localStorage.getItem("toolbarFont")) || 0) - 1;
     if (toolbarFont < 0) {
       toolbarFont = -1;
     }
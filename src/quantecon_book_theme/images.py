@@ -0,0 +1,674 @@
+import base64
+import binascii
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from docutils.nodes import document
+from sphinx.application import Sphinx
+from sphinx.environment import BuildEnvironment
+from sphinx.util import logging
+from sphinx.util.osutil import ensuredir, relative_uri
+
+from .metrics import count_cache
+from .options import get_theme_options
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+SPHINX_LOGGER = logging.getLogger(__name__)
+
+IMAGES_DIR = "_images"
+
+# Smaller images are cheaper inline than as a separate request
+DATA_URI_MIN_BYTES = 1024
+
+DATA_URI_EXTENSIONS = {
+    "png": "png",
+    "jpeg": "jpg",
+    "jpg": "jpg",
+    "gif": "gif",
+    "webp": "webp",
+    "svg+xml": "svg",
+}
+
+DATA_URI_IMG = re.compile(
+    r"""(<img\b[^>]*?\bsrc\s*=\s*)(["'])"""
+    r"""data:image/(?P<type>[a-z0-9.+-]+);base64,(?P<data>[A-Za-z0-9+/=\s]+)\2""",
+    re.IGNORECASE,
+)
+
+
+def write_content_addressed(outdir: Path, data: bytes, extension: str) -> str:
+    """Write ``data`` to ``_images/<sha>.<extension>`` unless it already exists.
+
+    Returns the path relative to ``outdir``. Identical images share one file.
+    """
+    digest = hashlib.sha1(data).hexdigest()[:16]
+    relpath = f"{IMAGES_DIR}/{digest}.{extension}"
+    path = outdir / relpath
+    if not path.exists():
+        ensuredir(path.parent)
+        # Write atomically since parallel writers may race on the same image
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    return relpath
+
+
+def extract_data_uri_images(
+    html: str, outdir: Path, page_uri: str, min_bytes: int = DATA_URI_MIN_BYTES
+) -> str:
+    """Move base64 ``data:`` images in ``html`` into files under ``_images``.
+
+    :param page_uri: The page's target URI, used to make the new ``src``
+        relative to the page.
+    :param min_bytes: Images smaller than this stay inline.
+    """
+
+    def replace(match):
+        extension = DATA_URI_EXTENSIONS.get(match.group("type").lower())
+        if extension is None:
+            return match.group(0)
+        try:
+            data = base64.b64decode(re.sub(r"\s+", "", match.group("data")))
+        except (binascii.Error, ValueError):
+            return match.group(0)
+        if len(data) < min_bytes:
+            return match.group(0)
+        relpath = write_content_addressed(outdir, data, extension)
+        quote = match.group(2)
+        return f"{match.group(1)}{quote}{relative_uri(page_uri, relpath)}{quote}"
+
+    return DATA_URI_IMG.sub(replace, html)
+
+
+def extract_page_images(
+    app: Sphinx,
+    pagename: str,
+    templatename: str,
+    context: Dict[str, Any],
+    doctree: Optional[document],
+):
+    """Replace inline ``data:`` images in the page body with image files.
+
+    This is a ``html-page-context`` sphinx event (see :ref:`sphinx:events`),
+    enabled with the ``extract_data_uri_images`` theme option.
+    """
+    if not get_theme_options(
+        app
+    ).extract_data_uri_images or "data:image/" not in context.get("body", ""):
+        return
+
+    context["body"] = extract_data_uri_images(
+        context["body"], Path(app.outdir), app.builder.get_target_uri(pagename)
+    )
+
+
+IMAGE_SIZE_INDEX = "qe-image-sizes"
+
+# Image size indexes, keyed by doctree directory
+_IMAGE_SIZES = {}
+
+# Start tags, whose quoted attribute values may contain ">"
+IMG_TAG = re.compile(r"""<img\b(?:[^>"']|"[^"]*"|'[^']*')*>""", re.IGNORECASE)
+IFRAME_TAG = re.compile(r"""<iframe\b(?:[^>"']|"[^"]*"|'[^']*')*>""", re.IGNORECASE)
+SVG_LENGTH = re.compile(r"^\s*([0-9.]+)\s*(px|pt)?\s*$")
+SVG_UNITS = {None: 1, "px": 1, "pt": 4 / 3}
+
+
+def _svg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """Size of an SVG from the width/height or viewBox of its root element."""
+    match = re.search(rb"<svg\b[^>]*>", data[:4096])
+    if match is None:
+        return None
+    tag = match.group(0).decode("utf-8", "replace")
+
+    def attribute(name):
+        found = re.search(rf"""\s{name}\s*=\s*["']([^"']*)["']""", tag)
+        return found.group(1) if found else None
+
+    width, height = attribute("width"), attribute("height")
+    if width and height:
+        w, h = SVG_LENGTH.match(width), SVG_LENGTH.match(height)
+        if w and h:
+            return (
+                round(float(w.group(1)) * SVG_UNITS[w.group(2)]),
+                round(float(h.group(1)) * SVG_UNITS[h.group(2)]),
+            )
+    view_box = attribute("viewBox")
+    if view_box:
+        parts = re.split(r"[\s,]+", view_box.strip())
+        if len(parts) == 4:
+            try:
+                return round(float(parts[2])), round(float(parts[3]))
+            except ValueError:
+                return None
+    return None
+
+
+def _jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """Size of a JPEG from its first start-of-frame marker."""
+    offset = 2
+    while offset + 9 < len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        (length,) = struct.unpack(">H", data[offset + 2 : offset + 4])
+        # SOF0-SOF15, except DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", data[offset + 5 : offset + 9])
+            return width, height
+        offset += 2 + length
+    return None
+
+
+def read_image_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """Read (width, height) from the header of a PNG, GIF, JPEG, WebP or SVG.
+
+    Returns None for other formats or unreadable headers.
+    """
+    try:
+        if data.startswith(b"\x89PNG\r\n\x1a\n") and data[12:16] == b"IHDR":
+            return struct.unpack(">II", data[16:24])
+        if data[:6] in (b"GIF87a", b"GIF89a"):
+            return struct.unpack("<HH", data[6:10])
+        if data.startswith(b"\xff\xd8"):
+            return _jpeg_size(data)
+        if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+            chunk = data[12:16]
+            if chunk == b"VP8 ":
+                width, height = struct.unpack("<HH", data[26:30])
+                return width & 0x3FFF, height & 0x3FFF
+            if chunk == b"VP8L":
+                bits = int.from_bytes(data[21:25], "little")
+                return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            if chunk == b"VP8X":
+                width = int.from_bytes(data[24:27], "little") + 1
+                height = int.from_bytes(data[27:30], "little") + 1
+                return width, height
+            return None
+        if b"<svg" in data[:4096]:
+            return _svg_size(data)
+    except struct.error:
+        return None
+    return None
+
+
+def _load_size_index(doctreedir: Path) -> Dict[str, Any]:
+    """Load the image size index persisted in the doctree directory."""
+    key = str(doctreedir)
+    if key not in _IMAGE_SIZES:
+        index = {"files": {}, "sizes": {}}
+        path = doctreedir / f"{IMAGE_SIZE_INDEX}.json"
+        try:
+            index.update(json.loads(path.read_text(encoding="utf-8")))
+        except (OSError, ValueError):
+            pass
+        _IMAGE_SIZES[key] = index
+    return _IMAGE_SIZES[key]
+
+
+def _image_record(doctreedir: Path, path: Path) -> Optional[Tuple[str, Any]]:
+    """The content hash and size of an image file, reading it only if it changed.
+
+    Files are matched by path, size and modification time, and sizes are stored
+    by content hash so copies of the same image are only parsed once. New
+    entries are appended to a per-process record file (parallel writers can't
+    share memory), which ``merge_image_sizes`` folds into the index.
+    """
+    index = _load_size_index(doctreedir)
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    signature = [stat.st_size, stat.st_mtime_ns]
+
+    entry = index["files"].get(str(path))
+    if entry and entry[:2] == signature and entry[2] in index["sizes"]:
+        count_cache("image_sizes", hits=1)
+        return entry[2], index["sizes"][entry[2]]
+    count_cache("image_sizes", misses=1)
+
+    data = path.read_bytes()
+    sha = hashlib.sha1(data).hexdigest()
+    if sha in index["sizes"]:
+        size = index["sizes"][sha]
+    else:
+        size = read_image_size(data)
+    size = list(size) if size else None
+    index["files"][str(path)] = signature + [sha]
+    index["sizes"][sha] = size
+
+    record = {"path": str(path), "file": signature + [sha], "size": size}
+    records = doctreedir / f"{IMAGE_SIZE_INDEX}.{os.getpid()}.jsonl"
+    with open(records, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+    return sha, size
+
+
+def get_image_size(doctreedir: Path, path: Path) -> Optional[Tuple[int, int]]:
+    """Look up the (width, height) of an image file in the size index."""
+    record = _image_record(doctreedir, path)
+    if record is None or not record[1]:
+        return None
+    return tuple(record[1])
+
+
+def merge_image_sizes(app: Sphinx, exception: Optional[Exception]):
+    """Fold the per-process records into the persisted image size index.
+
+    This is a ``build-finished`` sphinx event.
+    """
+    doctreedir = Path(app.doctreedir)
+    record_files = sorted(doctreedir.glob(f"{IMAGE_SIZE_INDEX}.*.jsonl"))
+    if not record_files:
+        return
+
+    index = _load_size_index(doctreedir)
+    for record_file in record_files:
+        try:
+            lines = record_file.read_text(encoding="utf-8").splitlines()
+        except OSError:
+            continue
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            index["files"][record["path"]] = record["file"]
+            index["sizes"][record["file"][2]] = record["size"]
+
+    # Forget files that no longer exist
+    index["files"] = {
+        path: entry for path, entry in index["files"].items() if Path(path).exists()
+    }
+    used = {entry[2] for entry in index["files"].values()}
+    index["sizes"] = {sha: size for sha, size in index["sizes"].items() if sha in used}
+
+    path = doctreedir / f"{IMAGE_SIZE_INDEX}.json"
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(index), encoding="utf-8")
+    os.replace(tmp_path, path)
+    for record_file in record_files:
+        record_file.unlink(missing_ok=True)
+
+
+class _StartTagParser(HTMLParser):
+    """Reads the attributes of a single HTML start tag."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.attributes = None
+
+    def handle_starttag(self, tag, attrs):
+        if self.attributes is None:
+            self.attributes = {}
+            # The first of repeated attributes wins, as in browsers
+            for name, value in attrs:
+                self.attributes.setdefault(name, value)
+
+
+def _tag_attributes(tag: str) -> Dict[str, Optional[str]]:
+    """The attributes of an HTML start tag, with lowercase names."""
+    parser = _StartTagParser()
+    parser.feed(tag)
+    parser.close()
+    return parser.attributes or {}
+
+
+def _has_attribute(tag: str, name: str) -> bool:
+    return name.lower() in _tag_attributes(tag)
+
+
+def _get_attribute(tag: str, name: str) -> Optional[str]:
+    return _tag_attributes(tag).get(name.lower())
+
+
+def _add_attributes(tag: str, attributes: Dict[str, Any]) -> str:
+    """Add the attributes that are not set on an HTML start tag yet."""
+    new = "".join(
+        f' {name}="{value}"'
+        for name, value in attributes.items()
+        if not _has_attribute(tag, name)
+    )
+    if not new:
+        return tag
+    end = -2 if tag.endswith("/>") else -1
+    return tag[:end].rstrip() + new + tag[end:].replace("/>", " />")
+
+
+def _image_target(page_uri: str, src: Optional[str]) -> Optional[str]:
+    """The path relative to the output directory of a local image ``src``."""
+    if not src:
+        return None
+    parts = urlsplit(src)
+    if parts.scheme or parts.netloc or src.startswith("/"):
+        return None
+    target = posixpath.normpath(
+        posixpath.join(posixpath.dirname(page_uri), unquote(parts.path))
+    )
+    return None if target.startswith("..") else target
+
+
+def _resolve_image(app: Sphinx, target: str, sources: Dict[str, str]):
+    """Find the file behind an image path relative to the output directory.
+
+    Images are only copied to ``_images`` when the build finishes, so the
+    copy there is the previous build's. The source file of an image is used
+    instead, and the built file only for images Sphinx does not copy.
+    """
+    if target.startswith(f"{IMAGES_DIR}/"):
+        source = sources.get(target[len(IMAGES_DIR) + 1 :])
+        if source:
+            path = Path(app.srcdir) / source
+            if path.exists():
+                return path
+    built = Path(app.outdir) / target
+    return built if built.exists() else None
+
+
+def add_lazy_loading(html: str, app: Sphinx, page_uri: str, eager: int) -> str:
+    """Lazy-load images and iframes in ``html`` and add image dimensions.
+
+    The first ``eager`` images are not lazy-loaded so the largest contentful
+    paint is not delayed. Dimensions are only added to images that set neither
+    ``width`` nor ``height``.
+    """
+    sources = {dest: source for source, dest in app.builder.images.items()}
+    doctreedir = Path(app.doctreedir)
+    count = 0
+
+    def replace_img(match):
+        nonlocal count
+        tag = match.group(0)
+        attributes = {"decoding": "async"}
+        if count >= eager:
+            attributes["loading"] = "lazy"
+        count += 1
+
+        if not _has_attribute(tag, "width") and not _has_attribute(tag, "height"):
+            target = _image_target(page_uri, _get_attribute(tag, "src"))
+            path = _resolve_image(app, target, sources) if target else None
+            size = get_image_size(doctreedir, path) if path else None
+            if size:
+                attributes["width"], attributes["height"] = size
+        return _add_attributes(tag, attributes)
+
+    def replace_iframe(match):
+        return _add_attributes(match.group(0), {"loading": "lazy"})
+
+    html = IMG_TAG.sub(replace_img, html)
+    return IFRAME_TAG.sub(replace_iframe, html)
+
+
+def lazy_load_page_media(
+    app: Sphinx,
+    pagename: str,
+    templatename: str,
+    context: Dict[str, Any],
+    doctree: Optional[document],
+):
+    """Add native lazy loading and intrinsic sizes to content images.
+
+    This is a ``html-page-context`` sphinx event (see :ref:`sphinx:events`),
+    enabled with the ``lazy_loading`` theme option.
+    """
+    options = get_theme_options(app)
+    if not options.lazy_loading or not context.get("body"):
+        return
+
+    eager = options.lazy_loading_eager_images
+    context["body"] = add_lazy_loading(
+        context["body"], app, app.builder.get_target_uri(pagename), eager
+    )
+
+
+RESPONSIVE_DIR = f"{IMAGES_DIR}/responsive"
+RESPONSIVE_CACHE = "qe-responsive"
+RESPONSIVE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+# The content column is at most 900px wide
+DEFAULT_RESPONSIVE_SIZES = "(max-width: 900px) 100vw, 900px"
+
+
+def get_responsive_widths(app: Sphinx) -> List[int]:
+    """The ``responsive_image_widths`` option as a sorted list of pixel widths."""
+    return list(get_theme_options(app).responsive_image_widths)
+
+
+def variant_name(sha: str, width: int) -> str:
+    """The file name of a WebP variant, from the hash of the original image."""
+    return f"{sha[:16]}-{width}w.webp"
+
+
+def _variant_names(job: Dict[str, Any]) -> List[str]:
+    """All the variant file names needed for an image."""
+    return [variant_name(job["sha"], width) for width in job["widths"]]
+
+
+def _responsive_job(
+    doctreedir: Path, path: Path, widths: List[int]
+) -> Optional[Dict[str, Any]]:
+    """The variants to encode for an image file, or None if it has no size."""
+    record = _image_record(doctreedir, path)
+    if record is None or not record[1]:
+        return None
+    sha, (width, _) = record
+    return {
+        "source": str(path),
+        "sha": sha,
+        "widths": [w for w in widths if w < width] + [width],
+    }
+
+
+def _variants_cached(cache_dir: Path, job: Dict[str, Any]) -> bool:
+    return all(cache_dir.joinpath(name).exists() for name in _variant_names(job))
+
+
+def encode_variants(source: str, cache_dir: str, job: Dict[str, Any]) -> str:
+    """Write the WebP variants of one image to ``cache_dir``."""
+    with Image.open(source) as image:
+        image.load()
+        if image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA")
+        for width in job["widths"]:
+            if width == image.width:
+                resized = image
+            else:
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.LANCZOS)
+
+            path = Path(cache_dir) / variant_name(job["sha"], width)
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            resized.save(tmp_path, format="WEBP", quality=80, method=4)
+            os.replace(tmp_path, path)
+    return job["sha"]
+
+
+# Variant jobs of the images of the current build by content hash, keyed by
+# application
+_RESPONSIVE_JOBS = {}
+
+
+def encode_responsive_images(app: Sphinx, env: BuildEnvironment):
+    """Encode the WebP variants of every image of the book in a process pool.
+
+    This is a ``env-updated`` sphinx event, so the variants are in the cache in
+    the doctree directory before any page is written, and pages only offer
+    variants that exist. Variants are named after the content hash of their
+    original, so only new or changed images are encoded.
+    """
+    if app.builder.format != "html":
+        return
+    if not get_theme_options(app).responsive_images or Image is None:
+        return
+
+    doctreedir = Path(app.doctreedir)
+    widths = get_responsive_widths(app)
+    jobs = {}
+    for source in env.images:
+        if posixpath.splitext(source)[1].lower() not in RESPONSIVE_EXTENSIONS:
+            continue
+        job = _responsive_job(doctreedir, Path(app.srcdir) / source, widths)
+        if job is not None:
+            jobs[job["sha"]] = job
+    _RESPONSIVE_JOBS[id(app)] = jobs
+
+    cache_dir = doctreedir / RESPONSIVE_CACHE
+    ensuredir(cache_dir)
+    missing = [job for job in jobs.values() if not _variants_cached(cache_dir, job)]
+    count_cache("responsive_images", hits=len(jobs) - len(missing), misses=len(missing))
+    if not missing:
+        return
+
+    with ProcessPoolExecutor() as executor:
+        futures = [
+            (job, executor.submit(encode_variants, job["source"], str(cache_dir), job))
+            for job in missing
+        ]
+        for job, future in futures:
+            try:
+                future.result()
+            except Exception as error:
+                SPHINX_LOGGER.warning(
+                    "could not encode variants of %s: %s", job["source"], error
+                )
+    SPHINX_LOGGER.verbose("encoded variants of %d images", len(missing))
+
+
+def _inside_picture(html: str, position: int) -> bool:
+    return html.rfind("<picture", 0, position) > html.rfind("</picture>", 0, position)
+
+
+def add_responsive_images(
+    html: str, app: Sphinx, page_uri: str, widths: List[int], sizes: str
+) -> str:
+    """Wrap images from ``_images`` in ``<picture>`` elements with variants.
+
+    Each PNG or JPEG image gets a WebP ``<source>`` whose ``srcset`` lists a
+    copy at each of ``widths`` smaller than the image, and one at full size.
+    The original stays as the fallback ``<img>``. Only images whose variants
+    ``encode_responsive_images`` put in the cache get a ``<source>``, so an
+    image that could not be encoded keeps its plain ``<img>``.
+    """
+    sources = {dest: source for source, dest in app.builder.images.items()}
+    doctreedir = Path(app.doctreedir)
+    cache_dir = doctreedir / RESPONSIVE_CACHE
+
+    def replace(match):
+        tag = match.group(0)
+        if _has_attribute(tag, "srcset") or _inside_picture(html, match.start()):
+            return tag
+        src = _get_attribute(tag, "src")
+        target = _image_target(page_uri, src)
+        if not target or not target.startswith(f"{IMAGES_DIR}/"):
+            return tag
+        extension = posixpath.splitext(target)[1].lower()
+        if extension not in RESPONSIVE_EXTENSIONS:
+            return tag
+        path = _resolve_image(app, target, sources)
+        job = _responsive_job(doctreedir, path, widths) if path else None
+        if job is None or not _variants_cached(cache_dir, job):
+            return tag
+
+        variants = [
+            (relative_uri(page_uri, f"{RESPONSIVE_DIR}/{name}"), w)
+            for name, w in zip(_variant_names(job), job["widths"])
+        ]
+        srcset = ", ".join(f"{url} {w}w" for url, w in variants)
+        source = f'<source type="image/webp" srcset="{srcset}" sizes="{sizes}" />'
+        return f"<picture>{source}{tag}</picture>"
+
+    return IMG_TAG.sub(replace, html)
+
+
+def add_responsive_page_images(
+    app: Sphinx,
+    pagename: str,
+    templatename: str,
+    context: Dict[str, Any],
+    doctree: Optional[document],
+):
+    """Offer downscaled WebP variants of the images in the page body.
+
+    This is a ``html-page-context`` sphinx event (see :ref:`sphinx:events`),
+    enabled with the ``responsive_images`` theme option. It needs Pillow.
+    """
+    options = get_theme_options(app)
+    if not options.responsive_images or Image is None:
+        return
+    if f"{IMAGES_DIR}/" not in context.get("body", ""):
+        return
+
+    sizes = options.responsive_image_sizes
+    context["body"] = add_responsive_images(
+        context["body"],
+        app,
+        app.builder.get_target_uri(pagename),
+        get_responsive_widths(app),
+        sizes or DEFAULT_RESPONSIVE_SIZES,
+    )
+
+
+def _link_or_copy(source: Path, destination: Path):
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+def write_responsive_images(app: Sphinx, exception: Optional[Exception]):
+    """Copy the image variants of the book to the output directory.
+
+    This is a ``build-finished`` sphinx event. The variants encoded by
+    ``encode_responsive_images`` are linked from the cache into
+    ``_images/responsive``, and the variants of images that are no longer in
+    the book are removed from both.
+    """
+    jobs = _RESPONSIVE_JOBS.pop(id(app), None)
+    if exception is not None or app.builder.format != "html":
+        return
+    if not get_theme_options(app).responsive_images:
+        return
+    if Image is None:
+        SPHINX_LOGGER.warning(
+            "responsive_images is enabled but Pillow is not installed, skipping."
+        )
+        return
+    if jobs is None:
+        return
+
+    cache_dir = Path(app.doctreedir) / RESPONSIVE_CACHE
+    outdir = Path(app.outdir) / RESPONSIVE_DIR
+    ensuredir(outdir)
+    names = set()
+    for job in jobs.values():
+        if not _variants_cached(cache_dir, job):
+            continue
+        for name in _variant_names(job):
+            names.add(name)
+            if not outdir.joinpath(name).exists():
+                _link_or_copy(cache_dir / name, outdir / name)
+
+    for directory in (cache_dir, outdir):
+        for path in directory.iterdir():
+            if path.is_file() and path.name not in names:
+                path.unlink(missing_ok=True)
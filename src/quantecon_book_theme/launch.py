@@ -1,14 +1,139 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
 
 from docutils.nodes import document
 from sphinx.application import Sphinx
 from sphinx.util import logging
 from shutil import copy2
+from sphinx_book_theme.header_buttons.launch import add_launch_buttons
+
+from .metrics import count_cache
+from .options import ThemeOptions, get_theme_options
+from .outputs import _script_attributes
 
 
 SPHINX_LOGGER = logging.getLogger(__name__)
 
+# Compiled launch configurations, keyed by application
+_LAUNCH_CONFIGS = {}
+
+# Records of the notebooks to copy into ``_sources``, one file per process
+NOTEBOOK_COPIES = "qe-notebook-copies"
+
+# Assets sphinx-thebe adds to every page
+THEBE_SCRIPT = "sphinx-thebe.js"
+THEBE_STYLESHEET = "sphinx-thebe.css"
+
+
+def compile_launch_config(options: ThemeOptions) -> Dict[str, Any]:
+    """Resolve the launch button options into URL templates.
+
+    Everything but the page name is the same for all the pages of a build, so
+    the templates only need the notebook path of a page, substituted for
+    ``{path}``. ``hub`` is None when no notebook repository is configured.
+
+    :raises ValueError: if ``launch_buttons.notebook_interface`` is unknown
+    """
+    launch_buttons = options.launch_buttons
+    launch = {"launch_buttons": launch_buttons, "hub": None}
+
+    if not options.nb_repository_url:
+        return launch
+    repo_url = options.nb_repository_url
+
+    # Parse the repo parts from the URL
+    org, repo, repo_subpath = _split_repo_url(repo_url)
+    if repo_subpath:
+        repo_url = repo_url.replace("/" + repo_subpath, "")
+        repo_subpath += "/"  # compatibility of code for cases which dont have this var
+
+    if org is None and repo is None:
+        # Skip the rest because the repo_url isn't right
+        launch["invalid_repository"] = True
+        return launch
+
+    # Construct the extra URL parts (app and relative path)
+    notebook_interface_prefixes = {"classic": "tree", "jupyterlab": "lab/tree"}
+    notebook_interface = launch_buttons.get("notebook_interface", "classic")
+    if notebook_interface not in notebook_interface_prefixes:
+        raise ValueError(
+            (
+                "Notebook UI for Binder/JupyterHub links must be one"
+                f"of {tuple(notebook_interface_prefixes.keys())},"
+                f"not {notebook_interface}"
+            )
+        )
+    ui_pre = notebook_interface_prefixes[notebook_interface]
+
+    # Notebook paths are relative to the notebook repository root
+    # Use nb_path_to_notebooks for notebook repo path (defaults to empty for flat repos)
+    nb_relpath = options.nb_path_to_notebooks.strip("/")
+    if nb_relpath != "":
+        nb_relpath += "/"
+
+    branch = options.nb_branch or "main"
+    jupyterhub_url = launch_buttons.get("jupyterhub_url")
+    binderhub_url = launch_buttons.get("binderhub_url")
+    colab_url = launch_buttons.get("colab_url")
+
+    hub = {
+        # Stripped from page names since notebook repo structure may differ
+        "path_to_docs": options.path_to_docs.strip("/"),
+        "branch": branch,
+        "binder": None,
+        "jupyterhub": jupyterhub_url,
+        "colab": None,
+    }
+    if binderhub_url:
+        binderhub_url = options.binderhub_url or "https://mybinder.org"
+        # Binder links use the page name rather than the notebook path
+        hub["binder"] = (
+            f"{binderhub_url}/v2/gh/{org}/{repo}/{branch}?"
+            f"urlpath=tree/{repo_subpath}{{page}}.ipynb"
+        )
+
+    urlpath = f"{ui_pre}/{repo}/{repo_subpath}{nb_relpath}{{path}}"
+    hub["jupyterhub_urlpath"] = urlpath
+    hub["jupyterhub_url"] = (
+        f"{jupyterhub_url}/user-redirect/git-pull?"
+        f"repo={repo_url}&urlpath={urlpath}"  # noqa: E501
+        f"&branch={branch}"
+    )
+    if colab_url:
+        hub[
+            "colab"
+        ] = f"{colab_url}/github/{org}/{repo}/blob/{branch}/{repo_subpath}{nb_relpath}{{path}}"  # noqa: E501
+
+    launch["hub"] = hub
+    return launch
+
+
+def init_launch_config(app: Sphinx):
+    """Compile the launch button options once per build.
+
+    This is a ``builder-inited`` sphinx event, so that misconfigured launch
+    buttons are reported before any page is written. Builders that write no
+    HTML pages have no launch buttons to check.
+    """
+    if app.builder.format != "html":
+        return
+    _get_launch_config(app)
+
+
+def _get_launch_config(app: Sphinx) -> Dict[str, Any]:
+    """The compiled launch configuration of the current theme options."""
+    options = get_theme_options(app)
+    cached = _LAUNCH_CONFIGS.get(id(app))
+    if cached is None or cached[0] is not options:
+        cached = (options, compile_launch_config(options))
+        _LAUNCH_CONFIGS[id(app)] = cached
+    return cached[1]
+
 
 def add_hub_urls(
     app: Sphinx,
@@ -28,102 +153,40 @@ def add_hub_urls(
         it will be None when the page is created from an HTML template alone.
 
     """
+    launch = _get_launch_config(app)
+    launch_buttons = launch["launch_buttons"]
+    if launch.get("invalid_repository"):
+        return
 
-    # First decide if we'll insert any links
-    path = app.env.doc2path(pagename)
-    extension = Path(path).suffix
-
-    # If so, insert the URLs depending on the configuration
-    config_theme = app.config["html_theme_options"]
-    launch_buttons = config_theme.get("launch_buttons", {})
-
-    if config_theme.get("nb_repository_url"):
-        repo_url = _get_repo_url(config_theme)
-
-        # Parse the repo parts from the URL
-        org, repo, repo_subpath = _split_repo_url(repo_url)
-        if repo_subpath:
-            repo_url = repo_url.replace("/" + repo_subpath, "")
-            repo_subpath += (
-                "/"  # compatibility of code for cases which dont have this var
-            )
-
-        if org is None and repo is None:
-            # Skip the rest because the repo_url isn't right
-            return
-
-        # Construct the extra URL parts (app and relative path)
-        notebook_interface_prefixes = {"classic": "tree", "jupyterlab": "lab/tree"}
-        notebook_interface = launch_buttons.get("notebook_interface", "classic")
-        if notebook_interface not in notebook_interface_prefixes:
-            raise ValueError(
-                (
-                    "Notebook UI for Binder/JupyterHub links must be one"
-                    f"of {tuple(notebook_interface_prefixes.keys())},"
-                    f"not {notebook_interface}"
-                )
-            )
-        ui_pre = notebook_interface_prefixes[notebook_interface]
-
-        # Check if we have a non-ipynb file, but an ipynb of same name exists
-        # If so, we'll use the ipynb extension instead of the text extension
-        # if extension != ".ipynb" and Path(path).with_suffix(".ipynb").exists():
-        #     extension = ".ipynb"
-        extension = ".ipynb"  # since we have nb_repo url
-
-        # Construct a path to the file relative to the notebook repository root
-        # Use nb_path_to_notebooks for notebook repo path (defaults to empty for flat repos)
-        nb_relpath = config_theme.get("nb_path_to_notebooks", "").strip("/")
-        if nb_relpath != "":
-            nb_relpath += "/"
-
+    hub = launch["hub"]
+    if hub is not None:
         # Strip path_to_docs from pagename since notebook repo structure may differ
-        path_to_docs = config_theme.get("path_to_docs", "").strip("/")
+        path_to_docs = hub["path_to_docs"]
         notebook_pagename = pagename
         if path_to_docs and pagename.startswith(path_to_docs + "/"):
             notebook_pagename = pagename[len(path_to_docs) + 1 :]
+        # since we have nb_repo url
+        path = f"{notebook_pagename}.ipynb"
 
-        path_rel_repo = f"{nb_relpath}{notebook_pagename}{extension}"
-
-        branch = _get_branch(config_theme)
-        # Now build infrastructure-specific links
-        jupyterhub_url = launch_buttons.get("jupyterhub_url")
-        binderhub_url = launch_buttons.get("binderhub_url")
-        colab_url = launch_buttons.get("colab_url")
         context["launch_buttons"] = []
-
-        if binderhub_url:
-            binderhub_url = (
-                config_theme["binderhub_url"]
-                if "binderhub_url" in config_theme
-                else "https://mybinder.org"
-            )
-
-            context["binder_url"] = (
-                f"{binderhub_url}/v2/gh/{org}/{repo}/{branch}?"
-                f"urlpath=tree/{repo_subpath}{ pagename }.ipynb"
-            )
+        if hub["binder"]:
+            context["binder_url"] = hub["binder"].replace("{page}", pagename)
             context["launch_buttons"].append(
                 {"name": "BinderHub", "url": context["binder_url"]}
             )
 
-        urlpath = ui_pre + "/" + repo + "/" + repo_subpath + path_rel_repo
-        url = (
-            f"{jupyterhub_url}/user-redirect/git-pull?"
-            f"repo={repo_url}&urlpath={urlpath}"  # noqa: E501
-            f"&branch={branch}"
+        context["jupyterhub_url"] = hub["jupyterhub_url"].replace("{path}", path)
+        context["jupyterhub_urlpath"] = hub["jupyterhub_urlpath"].replace(
+            "{path}", path
         )
-        context["jupyterhub_url"] = url
-        context["jupyterhub_urlpath"] = urlpath
-        context["repo_branch"] = branch
-        if jupyterhub_url:
+        context["repo_branch"] = hub["branch"]
+        if hub["jupyterhub"]:
             context["launch_buttons"].append(
                 {"name": "JupyterHub", "url": context["jupyterhub_url"]}
             )
 
-        if colab_url:
-            url = f"{colab_url}/github/{org}/{repo}/blob/{branch}/{repo_subpath}{path_rel_repo}"  # noqa: E501
-            context["colab_url"] = url
+        if hub["colab"]:
+            context["colab_url"] = hub["colab"].replace("{path}", path)
             context["launch_buttons"].append(
                 {"name": "Colab", "url": context["colab_url"]}
             )
@@ -132,11 +195,7 @@ def add_hub_urls(
         if len(context["launch_buttons"]) == 1:
             context["default_server"] = context["launch_buttons"][0]["url"]
         else:
-            context["default_server"] = context["colab_url"]
-
-        if org is None and repo is None:
-            # Skip the rest because the repo_url isn't right
-            return
+            context["default_server"] = context.get("colab_url")
 
     if not launch_buttons or not _is_notebook(app, pagename):
         return
@@ -154,9 +213,12 @@ def add_hub_urls(
         # Paths to old and new notebooks
         path_ntbk = ntbk_dir.joinpath(pagename).with_suffix(".ipynb")
         path_new_notebook = sources_dir.joinpath(pagename).with_suffix(".ipynb")
-        # Copy the notebook to `_sources` dir so it can be downloaded
-        path_new_notebook.parent.mkdir(exist_ok=True, parents=True)
-        copy2(path_ntbk, path_new_notebook)
+        # The notebook is copied to the `_sources` dir at the end of the build,
+        # so it can be downloaded
+        record = {"source": str(path_ntbk), "destination": str(path_new_notebook)}
+        records = Path(app.doctreedir) / f"{NOTEBOOK_COPIES}.{os.getpid()}.jsonl"
+        with open(records, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
         context["ipynb_source"] = pagename + ".ipynb"
 
     # Add thebe flag in context
@@ -164,6 +226,171 @@ def add_hub_urls(
         context["use_thebe"] = True
 
 
+def disable_book_theme_launch_buttons(app: Sphinx):
+    """Remove the launch buttons handler inherited from sphinx-book-theme.
+
+    This is a ``builder-inited`` sphinx event. The theme builds its own launch
+    buttons in ``add_hub_urls`` and does not render sphinx-book-theme's header
+    buttons, whose handler would also copy every markdown notebook into
+    ``_sources`` on every page write.
+    """
+    if app.config.html_theme != "quantecon_book_theme":
+        return
+    for listener in list(app.events.listeners.get("html-page-context", [])):
+        if listener.handler is add_launch_buttons:
+            app.disconnect(listener.id)
+
+
+def _file_digest(path: Path) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def sync_notebook(source: Path, destination: Path) -> bool:
+    """Copy a notebook, unless the destination already holds the same file.
+
+    Files of the same size and modification time are taken to be the same,
+    and files of the same size are compared by hash. The destination is a
+    hard link to the source where the filesystem allows. Returns whether the
+    destination was written.
+    """
+    source_stat = source.stat()
+    try:
+        destination_stat = destination.stat()
+    except FileNotFoundError:
+        destination_stat = None
+
+    if destination_stat is not None and destination_stat.st_size == source_stat.st_size:
+        if destination_stat.st_mtime_ns == source_stat.st_mtime_ns:
+            return False
+        if _file_digest(source) == _file_digest(destination):
+            # Executed again with the same outputs, only the times moved
+            os.utime(destination, ns=(source_stat.st_atime_ns, source_stat.st_mtime_ns))
+            return False
+
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = destination.with_name(f"{destination.name}.{os.getpid()}.tmp")
+    tmp_path.unlink(missing_ok=True)
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        copy2(source, tmp_path)
+    os.replace(tmp_path, destination)
+    return True
+
+
+def copy_notebooks(app: Sphinx, exception: Optional[Exception]):
+    """Copy the notebooks of the markdown pages written into ``_sources``.
+
+    This is a ``build-finished`` sphinx event. ``add_hub_urls`` records the
+    copies, which are made here in a thread pool, skipping unchanged notebooks.
+    """
+    if exception is not None or app.builder.format != "html":
+        return
+
+    doctreedir = Path(app.doctreedir)
+    record_files = sorted(doctreedir.glob(f"{NOTEBOOK_COPIES}.*.jsonl"))
+    copies = {}
+    for record_file in record_files:
+        for line in record_file.read_text(encoding="utf-8").splitlines():
+            record = json.loads(line)
+            copies[record["destination"]] = record["source"]
+
+    def copy(item):
+        destination, source = item
+        try:
+            return sync_notebook(Path(source), Path(destination))
+        except OSError as error:
+            SPHINX_LOGGER.warning(f"could not copy notebook {source}: {error}")
+            return False
+
+    if copies:
+        with ThreadPoolExecutor() as executor:
+            copied = sum(executor.map(copy, copies.items()))
+        count_cache("notebook_copies", hits=len(copies) - copied, misses=copied)
+        SPHINX_LOGGER.verbose(
+            "copied %d of %d notebooks into _sources", copied, len(copies)
+        )
+    for record_file in record_files:
+        record_file.unlink(missing_ok=True)
+
+
+def defer_thebe(
+    app: Sphinx,
+    pagename: str,
+    templatename: str,
+    context: Dict[str, Any],
+    doctree: Optional[document],
+):
+    """Load Thebe only once the reader first activates it.
+
+    This is a ``html-page-context`` sphinx event. With ``launch_buttons.thebe``
+    set, the sphinx-thebe script and stylesheet are moved out of the page head
+    into ``thebe_assets``. ``thebe.js`` loads them, and through them the Thebe
+    runtime and kernel, when a Thebe launch button is first clicked.
+    """
+    options = get_theme_options(app)
+    launch_buttons = options.launch_buttons or {}
+    if not launch_buttons.get("thebe", False):
+        return
+    # The runtime is wanted on every page
+    thebe_config = getattr(app.config, "thebe_config", None) or {}
+    if thebe_config.get("always_load") is True:
+        return
+
+    pathto = context["pathto"]
+    scripts, deferred_scripts = [], []
+    for script in context.get("script_files", []):
+        filename = str(getattr(script, "filename", script) or "")
+        if Path(filename).name == THEBE_SCRIPT:
+            attributes = _script_attributes(script)
+            attributes["src"] = pathto(filename, 1)
+            deferred_scripts.append(attributes)
+        else:
+            scripts.append(script)
+    if not deferred_scripts:
+        return
+
+    stylesheets, deferred_stylesheets = [], []
+    for css in context.get("css_files", []):
+        filename = str(getattr(css, "filename", css) or "")
+        if Path(filename).name == THEBE_STYLESHEET:
+            deferred_stylesheets.append(pathto(filename, 1))
+        else:
+            stylesheets.append(css)
+
+    context["script_files"] = scripts
+    context["css_files"] = stylesheets
+    context["thebe_assets"] = {
+        "scripts": deferred_scripts,
+        "stylesheets": deferred_stylesheets,
+        "preconnect": _thebe_preconnect(thebe_config, options),
+    }
+
+
+def _thebe_preconnect(thebe_config: Dict[str, Any], options: ThemeOptions) -> List[str]:
+    """The origin of the BinderHub Thebe requests its kernel from, if any.
+
+    Taken from ``thebe_config``, then the ``binderhub_url`` theme and launch
+    button options. Nothing is preconnected when no BinderHub is configured.
+    """
+    launch_buttons = options.launch_buttons or {}
+    binderhub_url = (
+        thebe_config.get("binderhub_url")
+        or options.binderhub_url
+        or launch_buttons.get("binderhub_url")
+    )
+    if not binderhub_url:
+        return []
+    url = urlsplit(binderhub_url)
+    if not url.scheme or not url.netloc:
+        return []
+    return [f"{url.scheme}://{url.netloc}"]
+
+
 def _split_repo_url(url):
     """Split a repository URL into an org / repo combination."""
     if "github.com/" in url:
@@ -178,17 +405,5 @@ def _split_repo_url(url):
     return org, repo, repo_subpath
 
 
-def _get_repo_url(config):
-    repo_url = config.get("nb_repository_url")
-    return repo_url
-
-
 def _is_notebook(app, pagename):
     return app.env.metadata[pagename].get("kernelspec")
-
-
-def _get_branch(config_theme):
-    branch = config_theme.get("nb_branch")
-    if not branch:
-        branch = "main"
-    return branch
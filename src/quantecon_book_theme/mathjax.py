@@ -0,0 +1,268 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import subprocess
+from functools import lru_cache
+from html import unescape
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from docutils.nodes import document
+from sphinx.application import Sphinx
+from sphinx.util import logging
+
+from .metrics import count_cache
+from .options import get_theme_options
+
+
+SPHINX_LOGGER = logging.getLogger(__name__)
+
+# Shared by the client-side MathJax configuration and the build-time renderer
+MATHJAX_MACROS = {
+    "argmax": "arg\\,max",
+    "argmin": "arg\\,min",
+    "col": "col",
+    "Span": "span",
+    "epsilon": "\\varepsilon",
+    "EE": "\\mathbb{E}",
+    "PP": "\\mathbb{P}",
+    "RR": "\\mathbb{R}",
+    "NN": "\\mathbb{N}",
+    "ZZ": "\\mathbb{Z}",
+    "aA": "\\mathcal{A}",
+    "bB": "\\mathcal{B}",
+    "cC": "\\mathcal{C}",
+    "dD": "\\mathcal{D}",
+    "eE": "\\mathcal{E}",
+    "fF": "\\mathcal{F}",
+    "gG": "\\mathcal{G}",
+    "hH": "\\mathcal{H}",
+}
+MATHJAX_SVG_SCALE = 0.92
+
+MATH_CACHE = "qe-math"
+MATH_RENDERER = (
+    Path(__file__).parent / "theme" / "quantecon_book_theme" / "mathjax-render.js"
+)
+
+# How Sphinx's mathjax extension writes math nodes
+INLINE_MATH = re.compile(
+    r'(<span class="math notranslate nohighlight">)(.*?)(</span>)', re.DOTALL
+)
+DISPLAY_MATH = re.compile(
+    r'(<div class="math notranslate nohighlight"[^>]*>\s*(?:<span class="eqno">.*?</span>)?)'
+    r"(.*?)(</div>)",
+    re.DOTALL,
+)
+
+# Renderer processes, keyed by the pid of the process that started them
+_RENDERERS = {}
+
+
+def mathjax_version(app: Sphinx) -> int:
+    """The MathJax major version ``mathjax_path`` points to."""
+    mathjax_path = app.config["mathjax_path"]
+    return 3 if mathjax_path and "@3" in mathjax_path else 2
+
+
+def mathjax_macros(app: Sphinx) -> Dict[str, Any]:
+    """The theme's TeX macros, with the macros of ``mathjax3_config`` over them."""
+    config = getattr(app.config, "mathjax3_config", None)
+    tex = config.get("tex") if isinstance(config, dict) else None
+    macros = tex.get("macros") if isinstance(tex, dict) else None
+    return {**MATHJAX_MACROS, **(macros if isinstance(macros, dict) else {})}
+
+
+@lru_cache(maxsize=None)
+def mathjax_full_version(srcdir: str) -> Optional[str]:
+    """The version of mathjax-full the renderer would load for a project.
+
+    Follows the renderer's lookup: ``node_modules`` of the project directory
+    and its parents, then ``NODE_PATH``.
+    """
+    project = Path(srcdir).resolve()
+    directories = [parent / "node_modules" for parent in (project, *project.parents)]
+    directories += [
+        Path(entry) for entry in os.environ.get("NODE_PATH", "").split(os.pathsep)
+    ]
+    for directory in directories:
+        package = directory / "mathjax-full" / "package.json"
+        if package.is_file():
+            try:
+                return json.loads(package.read_text(encoding="utf-8"))["version"]
+            except (OSError, ValueError, KeyError):
+                return None
+    return None
+
+
+def math_cache_key(
+    tex: str,
+    display: bool,
+    renderer: Optional[str] = None,
+    macros: Optional[Dict[str, Any]] = None,
+) -> str:
+    """The cache key of an equation.
+
+    From its source, the ``macros`` (the theme's by default) and the
+    mathjax-full ``renderer`` version, so that changing a macro or upgrading
+    mathjax-full renders the equations again.
+    """
+    if macros is None:
+        macros = MATHJAX_MACROS
+    source = json.dumps(
+        [tex, display, macros, MATHJAX_SVG_SCALE, renderer], sort_keys=True
+    )
+    return hashlib.sha1(source.encode("utf-8")).hexdigest()
+
+
+def _strip_delimiters(tex: str, delimiters) -> str:
+    start, end = delimiters
+    tex = tex.strip()
+    if tex.startswith(start) and tex.endswith(end):
+        return tex[len(start) : len(tex) - len(end)].strip()
+    return tex
+
+
+def _start_renderer(app: Sphinx) -> Optional[subprocess.Popen]:
+    """Start a renderer process, or return None if it cannot run."""
+    node = shutil.which("node")
+    if node is None:
+        SPHINX_LOGGER.warning(
+            "math_prerender is enabled but node was not found, "
+            "equations will be typeset in the browser."
+        )
+        return None
+
+    config = {"macros": mathjax_macros(app), "scale": MATHJAX_SVG_SCALE}
+    process = subprocess.Popen(
+        [node, str(MATH_RENDERER), json.dumps(config)],
+        cwd=app.srcdir,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+        encoding="utf-8",
+    )
+    status = json.loads(process.stdout.readline() or "{}")
+    if not status.get("ready"):
+        SPHINX_LOGGER.warning(
+            "math_prerender is enabled but the renderer did not start (%s), "
+            "equations will be typeset in the browser.",
+            status.get("error", "no response"),
+        )
+        process.wait()
+        return None
+    return process
+
+
+def render_equation(app: Sphinx, tex: str, display: bool) -> Optional[str]:
+    """Render an equation to SVG markup with the renderer process.
+
+    Forked writer processes start their own renderer, as they cannot share
+    the pipes of their parent's.
+    """
+    pid = os.getpid()
+    if pid not in _RENDERERS:
+        _RENDERERS[pid] = _start_renderer(app)
+    process = _RENDERERS[pid]
+    if process is None:
+        return None
+
+    process.stdin.write(json.dumps({"tex": tex, "display": display}) + "\n")
+    process.stdin.flush()
+    result = json.loads(process.stdout.readline() or '{"error": "no response"}')
+    if "error" in result:
+        SPHINX_LOGGER.warning("could not pre-render %r: %s", tex, result["error"])
+        return None
+    return result["html"]
+
+
+def get_rendered_equation(app: Sphinx, tex: str, display: bool) -> Optional[str]:
+    """Look up an equation in the on-disk cache, rendering it if it is new."""
+    key = math_cache_key(
+        tex, display, mathjax_full_version(str(app.srcdir)), mathjax_macros(app)
+    )
+    path = Path(app.doctreedir) / MATH_CACHE / key[:2] / f"{key}.svg"
+    if path.exists():
+        count_cache("math", hits=1)
+        return path.read_text(encoding="utf-8")
+
+    count_cache("math", misses=1)
+    rendered = render_equation(app, tex, display)
+    if rendered is not None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(rendered, encoding="utf-8")
+        os.replace(tmp_path, path)
+    return rendered
+
+
+def prerender_math(html: str, app: Sphinx) -> Tuple[str, bool]:
+    """Replace the TeX of the math in ``html`` with pre-rendered SVG.
+
+    Returns the new HTML, and whether every equation could be rendered.
+    """
+    complete = True
+
+    def replacer(display, delimiters):
+        def replace(match):
+            nonlocal complete
+            tex = _strip_delimiters(unescape(match.group(2)), delimiters)
+            rendered = get_rendered_equation(app, tex, display)
+            if rendered is None:
+                complete = False
+                return match.group(0)
+            return match.group(1) + rendered + match.group(3)
+
+        return replace
+
+    html = DISPLAY_MATH.sub(replacer(True, app.config.mathjax_display), html)
+    html = INLINE_MATH.sub(replacer(False, app.config.mathjax_inline), html)
+    return html, complete
+
+
+def prerender_page_math(
+    app: Sphinx,
+    pagename: str,
+    templatename: str,
+    context: Dict[str, Any],
+    doctree: Optional[document],
+):
+    """Typeset the math of a page at build time.
+
+    This is a ``html-page-context`` sphinx event (see :ref:`sphinx:events`),
+    enabled with the ``math_prerender`` theme option. When every equation of
+    the page is rendered, ``math_prerendered`` is set so that the page does
+    not load MathJax.
+    """
+    if not get_theme_options(app).math_prerender or mathjax_version(app) != 3:
+        return
+    if not context.get("has_maths_elements") or not context.get("body"):
+        return
+
+    context["body"], context["math_prerendered"] = prerender_math(context["body"], app)
+
+
+def check_math_prerender(app: Sphinx):
+    """Warn when ``math_prerender`` is enabled but cannot be used.
+
+    This is a ``builder-inited`` sphinx event.
+    """
+    if not get_theme_options(app).math_prerender or app.builder.format != "html":
+        return
+    if mathjax_version(app) != 3:
+        SPHINX_LOGGER.warning(
+            "math_prerender needs MathJax 3, equations will be typeset in the browser."
+        )
+
+
+def stop_math_renderer(app: Sphinx, exception: Optional[Exception]):
+    """Stop the renderer process of the main process.
+
+    This is a ``build-finished`` sphinx event.
+    """
+    process = _RENDERERS.pop(os.getpid(), None)
+    if process is not None:
+        process.stdin.close()
+        process.wait()
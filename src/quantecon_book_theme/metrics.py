@@ -0,0 +1,304 @@
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from sphinx.application import Sphinx
+from sphinx.util import logging
+
+from .options import get_theme_options
+
+
+SPHINX_LOGGER = logging.getLogger(__name__)
+
+PROFILE_ENV = "QE_THEME_PROFILE"
+METRICS_RECORDS = "qe-metrics"
+METRICS_FILE = "qe-theme-metrics.json"
+METRICS_VERSION = 1
+METRICS_LARGEST_PAGES = 10
+
+INLINE_STYLE = re.compile(r"<style\b[^>]*>(.*?)</style>", re.DOTALL | re.IGNORECASE)
+INLINE_SCRIPT = re.compile(
+    r"<script\b(?![^>]*\bsrc=)[^>]*>(.*?)</script>", re.DOTALL | re.IGNORECASE
+)
+SIDEBAR_NAVIGATION = re.compile(
+    r'<nav\b[^>]*\bid="qe-sidebar-nav"[^>]*>(.*?)</nav>', re.DOTALL
+)
+
+# Metrics where more is worse, compared by ``compare_metrics``
+COMPARED_METRICS = (
+    "bytes.html",
+    "bytes.inline_css",
+    "bytes.inline_js",
+    "bytes.navigation",
+    "git_subprocesses",
+)
+
+# Counters of this process since its last page record. Parallel writers are
+# forked processes, so each page record carries the counts of its own page.
+# Threads, such as the changelog writers, count under the lock.
+_COUNTERS = Counter()
+_COUNTERS_LOCK = threading.Lock()
+_HANDLER_SECONDS = {}
+# functools.lru_cache functions whose hit rates are reported, with their
+# statistics at the last page record
+_LRU_CACHES = {}
+
+
+def profiling_enabled(app: Sphinx) -> bool:
+    """Whether handler timings are recorded for this build.
+
+    Enabled with the ``profile`` theme option, or by setting the
+    ``QE_THEME_PROFILE`` environment variable to anything but ``0``.
+    """
+    if os.environ.get(PROFILE_ENV, "0").strip() not in ("", "0"):
+        return True
+    return get_theme_options(app).profile
+
+
+def count(name: str, n: int = 1):
+    """Add to a build counter, such as ``git_subprocesses``."""
+    with _COUNTERS_LOCK:
+        _COUNTERS[name] += n
+
+
+def count_cache(name: str, hits: int = 0, misses: int = 0):
+    """Count the hits and misses of one of the theme's caches."""
+    with _COUNTERS_LOCK:
+        _COUNTERS[f"cache.{name}.hits"] += hits
+        _COUNTERS[f"cache.{name}.misses"] += misses
+
+
+def track_lru_cache(name: str, function: Callable):
+    """Report the hit rate of a ``functools.lru_cache`` function."""
+    _LRU_CACHES[name] = (function, (0, 0))
+
+
+def add_handler_time(pagename: str, seconds: float):
+    """Add the time one of the theme's page handlers took on a page."""
+    _HANDLER_SECONDS[pagename] = _HANDLER_SECONDS.get(pagename, 0.0) + seconds
+
+
+def _take_counters() -> Dict[str, int]:
+    for name, (function, (hits, misses)) in _LRU_CACHES.items():
+        info = function.cache_info()
+        count_cache(name, hits=info.hits - hits, misses=info.misses - misses)
+        _LRU_CACHES[name] = (function, (info.hits, info.misses))
+    with _COUNTERS_LOCK:
+        counters = {name: n for name, n in _COUNTERS.items() if n}
+        _COUNTERS.clear()
+    return counters
+
+
+def clear_metrics(app: Sphinx):
+    """Drop the records left by an interrupted build.
+
+    This is a ``builder-inited`` sphinx event.
+    """
+    for record_file in Path(app.doctreedir).glob(f"{METRICS_RECORDS}.*.jsonl"):
+        record_file.unlink(missing_ok=True)
+    _take_counters()
+    _HANDLER_SECONDS.clear()
+
+
+def record_page_metrics(
+    app: Sphinx, pagename: str, templatename: str, context: Dict[str, Any], doctree
+):
+    """Record the counters of a page, and its handler time when profiled.
+
+    This is a ``html-page-context`` sphinx event, connected after the theme's
+    other handlers.
+    """
+    if app.builder.format != "html":
+        return
+    outfile = Path(app.builder.get_outfilename(pagename))
+    record = {
+        "page": pagename,
+        "file": outfile.relative_to(app.outdir).as_posix(),
+        "counters": _take_counters(),
+    }
+    if pagename in _HANDLER_SECONDS:
+        record["handler_seconds"] = _HANDLER_SECONDS.pop(pagename)
+    records = Path(app.doctreedir) / f"{METRICS_RECORDS}.{os.getpid()}.jsonl"
+    with open(records, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def page_bytes(html: str) -> Dict[str, int]:
+    """The size of a page, and of its inline CSS, JS and sidebar navigation."""
+
+    def size(matches):
+        return sum(len(match.group(1).encode("utf-8")) for match in matches)
+
+    return {
+        "html": len(html.encode("utf-8")),
+        "inline_css": size(INLINE_STYLE.finditer(html)),
+        "inline_js": size(INLINE_SCRIPT.finditer(html)),
+        "navigation": size(SIDEBAR_NAVIGATION.finditer(html)),
+    }
+
+
+def summarize_metrics(
+    records: List[Dict[str, Any]],
+    pages: Dict[str, Dict[str, int]],
+    counters: Optional[Dict[str, int]] = None,
+) -> Dict[str, Any]:
+    """Build the metrics report from page records and the size of each page.
+
+    ``counters`` are counts made outside of any page, such as those of the
+    ``build-finished`` handlers. Handler time is ``None`` when no page was
+    profiled.
+    """
+    counters = Counter(counters or {})
+    for record in records:
+        counters.update(record["counters"])
+
+    caches = {}
+    names = {name.split(".")[1] for name in counters if name.startswith("cache.")}
+    for cache in sorted(names):
+        hits = counters[f"cache.{cache}.hits"]
+        misses = counters[f"cache.{cache}.misses"]
+        caches[cache] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else None,
+        }
+
+    totals = Counter()
+    for sizes in pages.values():
+        totals.update(sizes)
+    timed = [
+        record["handler_seconds"] for record in records if "handler_seconds" in record
+    ]
+    largest = sorted(pages.items(), key=lambda item: item[1]["html"], reverse=True)
+    return {
+        "version": METRICS_VERSION,
+        "pages": len(records),
+        "handler_seconds": sum(timed) if timed else None,
+        "git_subprocesses": counters["git_subprocesses"],
+        "caches": caches,
+        "bytes": {
+            name: totals[name]
+            for name in ("html", "inline_css", "inline_js", "navigation")
+        },
+        "largest_pages": [
+            {"page": pagename, **sizes}
+            for pagename, sizes in largest[:METRICS_LARGEST_PAGES]
+        ],
+        "page_bytes": dict(sorted(pages.items())),
+    }
+
+
+def write_metrics(app: Sphinx, exception: Optional[Exception]):
+    """Write the metrics of the pages written in this build.
+
+    This is a ``build-finished`` sphinx event, connected after the other
+    ``build-finished`` handlers so their cache counts are included. The report
+    is written to ``qe-theme-metrics.json`` in the doctree directory.
+    """
+    doctreedir = Path(app.doctreedir)
+    record_files = sorted(doctreedir.glob(f"{METRICS_RECORDS}.*.jsonl"))
+    if exception is not None or not record_files:
+        return
+
+    records = []
+    for record_file in record_files:
+        try:
+            lines = record_file.read_text(encoding="utf-8").splitlines()
+        except OSError:
+            continue
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    for record_file in record_files:
+        record_file.unlink(missing_ok=True)
+
+    pages = {}
+    for record in records:
+        try:
+            html = (Path(app.outdir) / record["file"]).read_text(encoding="utf-8")
+        except OSError:
+            continue
+        pages[record["page"]] = page_bytes(html)
+
+    report = summarize_metrics(records, pages, _take_counters())
+    path = doctreedir / METRICS_FILE
+    path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    SPHINX_LOGGER.verbose("build metrics written to %s", path)
+
+
+def _metric(report: Dict[str, Any], name: str) -> Optional[float]:
+    value = report
+    for key in name.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def compare_metrics(
+    baseline: Dict[str, Any],
+    current: Dict[str, Any],
+    tolerance: float = 0.05,
+    time_tolerance: Optional[float] = None,
+) -> List[str]:
+    """List the metrics of ``current`` that regressed from ``baseline``.
+
+    A metric regresses when it grew by more than ``tolerance``, relative to
+    the baseline. Handler time is only compared when ``time_tolerance`` is
+    given, as it depends on the machine the book is built on.
+    """
+    tolerances = {name: tolerance for name in COMPARED_METRICS}
+    if time_tolerance is not None:
+        tolerances["handler_seconds"] = time_tolerance
+
+    regressions = []
+    for name, allowed in tolerances.items():
+        before, after = _metric(baseline, name), _metric(current, name)
+        if before is None or after is None:
+            continue
+        if after > before * (1 + allowed) and after > before:
+            change = f"+{(after - before) / before:.1%}" if before else "new"
+            regressions.append(f"{name}: {before} -> {after} ({change})")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m quantecon_book_theme.metrics",
+        description="Compare the build metrics of two builds of a book.",
+    )
+    parser.add_argument("baseline", type=Path, help="metrics of the previous build")
+    parser.add_argument("current", type=Path, help="metrics of the new build")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.05,
+        help="allowed relative growth of the size and git metrics (default 0.05)",
+    )
+    parser.add_argument(
+        "--time-tolerance",
+        type=float,
+        help="allowed relative growth of the handler time (not compared by default)",
+    )
+    args = parser.parse_args(argv)
+
+    baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+    current = json.loads(args.current.read_text(encoding="utf-8"))
+    regressions = compare_metrics(
+        baseline, current, args.tolerance, args.time_tolerance
+    )
+    for regression in regressions:
+        print(f"regression: {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,261 @@
+import ast
+import difflib
+from dataclasses import dataclass, field, fields, replace
+from enum import StrEnum
+from typing import Any, Collection, Dict, List, Optional, Tuple
+
+from sphinx.application import Sphinx
+from sphinx.config import Config
+from sphinx.theming import Theme
+from sphinx.util import logging
+
+
+SPHINX_LOGGER = logging.getLogger(__name__)
+
+
+class ColorScheme(StrEnum):
+    """The built-in text color schemes."""
+
+    SEOUL256 = "seoul256"
+    GRUVBOX = "gruvbox"
+    NONE = "none"
+
+
+@dataclass(frozen=True, slots=True)
+class ThemeOptions:
+    """The options of ``theme.conf``, with the user's overrides applied.
+
+    Options given as strings, as ``-D`` and ``theme.conf`` do, are parsed into
+    the type of their field. The defaults match ``theme.conf``.
+    """
+
+    authors: Any = ""
+    binderhub_url: str = ""
+    changelog_max_entries: int = 10
+    color_scheme: ColorScheme = ColorScheme.SEOUL256
+    contents_autoexpand: bool = True
+    current_language: str = ""
+    dark_logo: str = ""
+    defer_outputs: bool = False
+    defer_outputs_click_bytes: int = 0
+    description: str = ""
+    download_nb_path: str = ""
+    enable_rtl: bool = False
+    expand_sections: List[Any] = field(default_factory=list)
+    expand_toc_sections: List[Any] = field(default_factory=list)
+    extra_footer: str = ""
+    extra_navbar: str = 'Theme by the <a href="https://quantecon.org/">QuantEcon</a>'
+    extract_data_uri_images: bool = False
+    header_organisation: str = ""
+    header_organisation_url: str = ""
+    home_page_in_toc: bool = False
+    inline_literal_box: bool = False
+    instant_navigation: bool = False
+    keywords: str = ""
+    languages: List[Any] = field(default_factory=list)
+    last_modified_date_format: str = "%b %d, %Y"
+    launch_buttons: Dict[str, Any] = field(default_factory=dict)
+    lazy_changelog: bool = False
+    lazy_loading: bool = False
+    lazy_loading_eager_images: int = 1
+    mainpage_author_fontsize: int = 18
+    math_prerender: bool = False
+    mathjax_lazy: bool = False
+    navbar_footer_text: str = ""
+    nb_branch: str = ""
+    nb_path_to_notebooks: str = ""
+    nb_repository_url: str = ""
+    og_logo_url: str = ""
+    output_max_bytes: int = 0
+    output_max_lines: int = 0
+    path_to_docs: str = ""
+    perf_report_url: str = ""
+    persistent_sidebar: bool = False
+    plugins_list: List[Any] = field(default_factory=list)
+    profile: bool = False
+    prefetch_next_page: bool = False
+    prefetch_sidebar_links: bool = False
+    qetheme_code_style: bool = True
+    quantecon_project: bool = True
+    repository_branch: str = ""
+    repository_url: str = ""
+    responsive_image_sizes: str = "(max-width: 900px) 100vw, 900px"
+    responsive_image_widths: Tuple[int, ...] = (480, 960)
+    responsive_images: bool = False
+    service_worker: bool = False
+    service_worker_max_pages: int = 50
+    shared_navigation: bool = False
+    sharded_search: bool = False
+    single_page: bool = False
+    sticky_contents: bool = True
+    twitter: str = ""
+    twitter_logo_url: str = ""
+    use_issues_button: bool = False
+    use_repository_button: bool = False
+
+
+# Resolved options and their template values, keyed by application
+_THEME_OPTIONS = {}
+
+
+def _parse_bool(name: str, value: Any, default: bool) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        return value.strip().lower() == "true"
+    SPHINX_LOGGER.warning(f"{name} must be True or False, got {value!r}.")
+    return default
+
+
+def _parse_int(name: str, value: Any, default: int) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        SPHINX_LOGGER.warning(f"{name} must be an integer, using {default}.")
+        return default
+
+
+def _parse_widths(name: str, value: Any, default: Tuple[int, ...]) -> Tuple[int, ...]:
+    # A comma separated string when passed with ``-D``
+    if isinstance(value, str):
+        value = [width for width in value.strip("[]()").split(",") if width.strip()]
+    try:
+        widths = sorted({int(width) for width in value})
+    except (TypeError, ValueError):
+        SPHINX_LOGGER.warning(
+            f"{name} must be a list of integers, using {list(default)}."
+        )
+        return default
+    return tuple(width for width in widths if width > 0)
+
+
+def _parse_literal(name: str, value: Any, default: Any) -> Any:
+    if isinstance(value, type(default)):
+        return value
+    if isinstance(value, str):
+        try:
+            parsed = ast.literal_eval(value.strip() or repr(default))
+        except (SyntaxError, ValueError):
+            parsed = None
+        if isinstance(parsed, type(default)):
+            return parsed
+    SPHINX_LOGGER.warning(f"{name} must be a {type(default).__name__}, got {value!r}.")
+    return default
+
+
+def _parse_color_scheme(name: str, value: Any, default: ColorScheme) -> ColorScheme:
+    scheme = str(value).strip().lower()
+    if scheme not in tuple(ColorScheme):
+        SPHINX_LOGGER.warning(
+            "Unknown color_scheme %r. Valid schemes: %s. Falling back to 'seoul256'.",
+            scheme,
+            ", ".join(ColorScheme),
+        )
+        return default
+    return ColorScheme(scheme)
+
+
+_PARSERS = {
+    bool: _parse_bool,
+    int: _parse_int,
+    Tuple[int, ...]: _parse_widths,
+    List[Any]: _parse_literal,
+    Dict[str, Any]: _parse_literal,
+    ColorScheme: _parse_color_scheme,
+}
+
+
+def resolve_theme_options(theme_options: Dict[str, Any]) -> ThemeOptions:
+    """Parse the user's ``html_theme_options`` into a :class:`ThemeOptions`.
+
+    Values of the wrong type are reported and replaced by their default.
+    Options that are not this theme's, like those of the parent themes, are
+    left out.
+    """
+    options = ThemeOptions()
+    values = {}
+    for option in fields(ThemeOptions):
+        if option.name not in theme_options:
+            continue
+        value = theme_options[option.name]
+        default = getattr(options, option.name)
+        parser = _PARSERS.get(option.type)
+        if parser is not None:
+            value = parser(option.name, value, default)
+        elif value is None:
+            value = default
+        values[option.name] = value
+    return replace(options, **values)
+
+
+def warn_unknown_options(theme_options: Dict[str, Any], inherited: Collection[str]):
+    """Report the options that are neither this theme's nor inherited.
+
+    ``inherited`` are the names of the options of the parent themes. The
+    closest option of this theme is suggested, as most are typos.
+    """
+    names = [option.name for option in fields(ThemeOptions)]
+    for name in theme_options:
+        if name in names or name in inherited:
+            continue
+        matches = difflib.get_close_matches(name, names, n=1)
+        hint = f", did you mean {matches[0]!r}?" if matches else "."
+        SPHINX_LOGGER.warning(f"Unknown theme option {name!r}{hint}")
+
+
+def _template_values(options: ThemeOptions) -> Dict[str, Any]:
+    """The ``theme_*`` template variables of the boolean options."""
+    return {
+        f"theme_{option.name}": getattr(options, option.name)
+        for option in fields(ThemeOptions)
+        if option.type is bool
+    }
+
+
+def _resolve(app: Sphinx):
+    theme_options = getattr(app.config, "html_theme_options", None)
+    options = resolve_theme_options(theme_options or {})
+    # The configured dict is kept, so its identity tells a replaced one apart
+    cached = (theme_options, options, _template_values(options))
+    _THEME_OPTIONS[id(app)] = cached
+    return cached
+
+
+def _get_resolved(app: Sphinx):
+    cached = _THEME_OPTIONS.get(id(app))
+    theme_options = getattr(app.config, "html_theme_options", None)
+    if cached is None or cached[0] is not theme_options:
+        cached = _resolve(app)
+    return cached
+
+
+def get_theme_options(app: Sphinx) -> ThemeOptions:
+    """The resolved theme options of the current build."""
+    return _get_resolved(app)[1]
+
+
+def get_template_values(app: Sphinx) -> Dict[str, Any]:
+    """The ``theme_*`` template variables of the boolean options, as booleans."""
+    return _get_resolved(app)[2]
+
+
+def init_theme_options(app: Sphinx, config: Optional[Config] = None):
+    """Resolve the theme options once per build.
+
+    This is a ``config-inited`` sphinx event, which resolves them again for
+    the new configuration, so that invalid option values are reported before
+    the build starts. Themes are loaded with the builder, after the
+    configuration is read, so it is also a ``builder-inited`` event, which
+    resolves them unless that was already done and, once the options of the
+    parent themes are known, reports unknown options before the documents are
+    read. Pages then only look them up, and replacing ``html_theme_options``
+    resolves them again.
+    """
+    if config is not None:
+        _resolve(app)
+        return
+    _get_resolved(app)
+    theme = getattr(app.builder, "theme", None)
+    if isinstance(theme, Theme):
+        theme_options = getattr(app.config, "html_theme_options", None) or {}
+        warn_unknown_options(theme_options, theme.get_options())
@@ -0,0 +1,221 @@
+import re
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from docutils import nodes
+from sphinx.application import Sphinx
+from sphinx.util import logging
+from sphinx.util.osutil import relative_uri
+
+from .options import get_theme_options
+
+
+SPHINX_LOGGER = logging.getLogger(__name__)
+
+# Outputs that load or run something in the browser
+HEAVY_OUTPUT = re.compile(r"<(?:iframe|script|embed|object)\b", re.IGNORECASE)
+WIDGET_VIEW_MIMETYPE = "application/vnd.jupyter.widget-view+json"
+DEFERRED_OUTPUT_SCRIPTS = "qe-deferred-output-scripts"
+OUTPUTS_DIR = "_outputs"
+ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+
+
+def _in_cell_output(node: nodes.Node) -> bool:
+    """Whether a node is part of a notebook cell's outputs."""
+    parent = node.parent
+    while parent is not None:
+        if "cell_output" in parent.get("classes", []):
+            return True
+        parent = parent.parent
+    return False
+
+
+def defer_output_html(html: str, click_to_load: bool = False) -> str:
+    """Wrap the HTML of an output in a placeholder that keeps it inert.
+
+    The output is kept in a ``<template>``, so its iframes and scripts do not
+    load until ``outputs.js`` inserts it into the page.
+    """
+    attributes = ' data-defer="click"' if click_to_load else ' data-defer="viewport"'
+    if WIDGET_VIEW_MIMETYPE in html:
+        attributes += ' data-widget="true"'
+    return (
+        f'<div class="qe-deferred-output"{attributes}>'
+        f"<template>{html}</template>"
+        '<button type="button" class="qe-deferred-output__load">'
+        "Load interactive output</button>"
+        "</div>"
+    )
+
+
+def defer_heavy_outputs(app: Sphinx, doctree: nodes.document, docname: str):
+    """Replace interactive notebook outputs with deferred placeholders.
+
+    This is a ``doctree-resolved`` sphinx event, enabled with the
+    ``defer_outputs`` theme option. Outputs of at least
+    ``defer_outputs_click_bytes`` bytes are only loaded on click.
+    """
+    options = get_theme_options(app)
+    if not options.defer_outputs:
+        return
+    click_bytes = options.defer_outputs_click_bytes
+
+    for node in list(doctree.findall(nodes.raw)):
+        if "html" not in node.get("format", "").split():
+            continue
+        html = node.astext()
+        # A nested template would end the placeholder early
+        if not HEAVY_OUTPUT.search(html) or "</template" in html.lower():
+            continue
+        if not _in_cell_output(node):
+            continue
+
+        click_to_load = click_bytes > 0 and len(html.encode("utf-8")) >= click_bytes
+        node.replace_self(
+            nodes.raw(
+                "",
+                defer_output_html(html, click_to_load),
+                format="html",
+                classes=node.get("classes", []),
+            )
+        )
+
+
+def _script_attributes(script) -> Dict[str, str]:
+    """The attributes of a ``script_files`` entry, including its source."""
+    attributes = {"src": getattr(script, "filename", script)}
+    for name, value in getattr(script, "attributes", {}).items():
+        if name not in ("body", "priority") and value is not None:
+            attributes[name] = value
+    return attributes
+
+
+def defer_widget_runtime(
+    app: Sphinx,
+    pagename: str,
+    templatename: str,
+    context: Dict[str, Any],
+    doctree: Optional[nodes.document],
+):
+    """Move the ipywidgets scripts of a page behind its deferred widgets.
+
+    This is a ``html-page-context`` sphinx event. Widget views are rendered
+    once, when the widget runtime loads, so ``outputs.js`` loads it after
+    inserting every deferred widget of the page.
+    """
+    if not get_theme_options(app).defer_outputs:
+        return
+    if 'data-widget="true"' not in context.get("body", ""):
+        return
+
+    runtime = getattr(app.config, "nb_ipywidgets_js", None) or {}
+    scripts, deferred = [], []
+    for script in context.get("script_files", []):
+        if getattr(script, "filename", script) in runtime:
+            deferred.append(_script_attributes(script))
+        else:
+            scripts.append(script)
+    if deferred:
+        context["script_files"] = scripts
+        context["deferred_output_scripts"] = deferred
+
+
+def split_output(text: str, max_lines: int, max_bytes: int) -> Tuple[str, str]:
+    """Split an output into the part that is shown and the remainder.
+
+    The shown part has at most ``max_lines`` lines and ``max_bytes`` bytes
+    (0 means no limit), and ends at a line break unless its first line alone
+    is over the byte limit.
+    """
+    lines = text.splitlines(keepends=True)
+    if max_lines and len(lines) > max_lines:
+        lines = lines[:max_lines]
+    if max_bytes:
+        size = 0
+        for i, line in enumerate(lines):
+            size += len(line.encode("utf-8"))
+            if size > max_bytes:
+                if i == 0:
+                    head = line.encode("utf-8")[:max_bytes].decode("utf-8", "ignore")
+                    return head, text[len(head) :]
+                lines = lines[:i]
+                break
+    head = "".join(lines)
+    return head, text[len(head) :]
+
+
+def remainder_label(head: str, rest: str) -> str:
+    """Describe the part of an output that :func:`split_output` cut off.
+
+    When the cut is inside a line, the rest of that line is not counted as
+    one more line.
+    """
+    more = len(rest.splitlines())
+    if head and not head.endswith(("\n", "\r")):
+        more -= 1
+    if more < 1:
+        return f"{len(rest)} more character{'s' if len(rest) != 1 else ''}"
+    return f"{more} more line{'s' if more != 1 else ''}"
+
+
+def truncate_long_outputs(app: Sphinx, doctree: nodes.document, docname: str):
+    """Cut very long text outputs, moving the remainder to a sidecar file.
+
+    This is a ``doctree-resolved`` sphinx event, enabled with the
+    ``output_max_lines`` and ``output_max_bytes`` theme options. The remainder
+    is written to ``_outputs/<docname>.<n>.txt`` and loaded by ``outputs.js``
+    when the reader asks for the full output.
+    """
+    if app.builder.format != "html":
+        return
+    options = get_theme_options(app)
+    max_lines = max(options.output_max_lines, 0)
+    max_bytes = max(options.output_max_bytes, 0)
+    if not max_lines and not max_bytes:
+        return
+
+    outdir = (Path(app.outdir) / OUTPUTS_DIR / docname).parent
+    name = docname.rsplit("/", 1)[-1]
+    # Drop the sidecar files of the previous build of this page only, as
+    # the pages below it write theirs to the same directory
+    sidecar = re.compile(rf"{re.escape(name)}\.\d+\.txt")
+    if outdir.is_dir():
+        for path in outdir.iterdir():
+            if sidecar.fullmatch(path.name):
+                path.unlink()
+    page_uri = app.builder.get_target_uri(docname)
+
+    count = 0
+    for node in list(doctree.findall(nodes.literal_block)):
+        classes = node.get("classes", [])
+        # stderr outputs are already collapsed by stderr-warnings.js
+        if "output" not in classes or "stderr" in classes:
+            continue
+        if not _in_cell_output(node):
+            continue
+        text = node.astext()
+        head, rest = split_output(text, max_lines, max_bytes)
+        if not rest:
+            continue
+
+        count += 1
+        outdir.mkdir(parents=True, exist_ok=True)
+        outdir.joinpath(f"{name}.{count}.txt").write_text(
+            ANSI_ESCAPE.sub("", rest), encoding="utf-8"
+        )
+        node.children = [nodes.Text(head)]
+        node.rawsource = head
+        node["classes"].append("output-truncated")
+
+        label = remainder_label(head, rest)
+        src = relative_uri(page_uri, f"{OUTPUTS_DIR}/{docname}.{count}.txt")
+        button = (
+            '<button type="button" class="output-truncated-toggle" '
+            f'aria-expanded="false" data-src="{src}">'
+            '<span class="output-truncated-chevron">▶</span> '
+            f'<span class="output-truncated-label">Show full output ({label})</span>'
+            "</button>"
+        )
+        node.parent.insert(
+            node.parent.index(node) + 1, nodes.raw("", button, format="html")
+        )
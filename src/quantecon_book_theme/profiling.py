@@ -0,0 +1,145 @@
+import json
+import os
+import time
+from contextlib import contextmanager
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from sphinx.application import Sphinx
+from sphinx.util import logging
+
+from .metrics import add_handler_time, profiling_enabled
+
+
+SPHINX_LOGGER = logging.getLogger(__name__)
+
+PROFILE_RECORDS = "qe-profile"
+PROFILE_REPORT = "qe-theme-profile.json"
+PROFILE_TOP_PAGES = 10
+
+
+def _record_timing(app: Sphinx, pagename: str, name: str, seconds: float):
+    # Parallel writers are forked processes that exit without cleanup, so
+    # every timing is appended to the records of its process right away
+    record = {"page": pagename, "name": name, "seconds": seconds}
+    records = Path(app.doctreedir) / f"{PROFILE_RECORDS}.{os.getpid()}.jsonl"
+    with open(records, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+@contextmanager
+def profile_step(app: Sphinx, pagename: str, name: str):
+    """Time a part of a handler, recorded as ``<handler>.<step>``."""
+    if not profiling_enabled(app):
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _record_timing(app, pagename, name, time.perf_counter() - start)
+
+
+def profiled(handler: Callable) -> Callable:
+    """Wrap a ``html-page-context`` handler to record its wall time.
+
+    The time is added to the build metrics and recorded per page when
+    profiling is enabled.
+    """
+
+    @wraps(handler)
+    def wrapper(app, pagename, templatename, context, doctree):
+        start = time.perf_counter()
+        try:
+            return handler(app, pagename, templatename, context, doctree)
+        finally:
+            if profiling_enabled(app):
+                seconds = time.perf_counter() - start
+                add_handler_time(pagename, seconds)
+                _record_timing(app, pagename, handler.__name__, seconds)
+
+    return wrapper
+
+
+def clear_profile(app: Sphinx):
+    """Drop the timings left by an interrupted build.
+
+    This is a ``builder-inited`` sphinx event.
+    """
+    for record_file in Path(app.doctreedir).glob(f"{PROFILE_RECORDS}.*.jsonl"):
+        record_file.unlink(missing_ok=True)
+
+
+def summarize_profile(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate timing records into per-handler and per-page totals.
+
+    Handlers and sub-steps are sorted by total time. Sub-steps are named
+    ``<handler>.<step>`` and are not part of the page totals, since some of
+    them run while the page template renders.
+    """
+    handlers, pages = {}, {}
+    for record in records:
+        name, seconds = record["name"], record["seconds"]
+        stats = handlers.setdefault(name, {"calls": 0, "total": 0.0, "max": 0.0})
+        stats["calls"] += 1
+        stats["total"] += seconds
+        stats["max"] = max(stats["max"], seconds)
+        if "." not in name:
+            page = pages.setdefault(record["page"], {"total": 0.0, "handlers": {}})
+            page["total"] += seconds
+            page["handlers"][name] = page["handlers"].get(name, 0.0) + seconds
+
+    for stats in handlers.values():
+        stats["mean"] = stats["total"] / stats["calls"]
+    slowest = sorted(pages.items(), key=lambda item: item[1]["total"], reverse=True)
+    return {
+        "pages": len(pages),
+        "total": sum(page["total"] for page in pages.values()),
+        "handlers": dict(
+            sorted(handlers.items(), key=lambda item: item[1]["total"], reverse=True)
+        ),
+        "slowest_pages": [
+            {"page": pagename, **page} for pagename, page in slowest[:PROFILE_TOP_PAGES]
+        ],
+    }
+
+
+def write_profile(app: Sphinx, exception: Optional[Exception]):
+    """Merge the timings of every writer into a JSON report.
+
+    This is a ``build-finished`` sphinx event. The report is written to
+    ``qe-theme-profile.json`` in the doctree directory, and the slowest pages
+    are logged.
+    """
+    doctreedir = Path(app.doctreedir)
+    record_files = sorted(doctreedir.glob(f"{PROFILE_RECORDS}.*.jsonl"))
+    if not record_files:
+        return
+
+    records = []
+    for record_file in record_files:
+        try:
+            lines = record_file.read_text(encoding="utf-8").splitlines()
+        except OSError:
+            continue
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    for record_file in record_files:
+        record_file.unlink(missing_ok=True)
+
+    report = summarize_profile(records)
+    path = doctreedir / PROFILE_REPORT
+    path.write_text(json.dumps(report, indent=2), encoding="utf-8")
+
+    SPHINX_LOGGER.info(
+        "Theme handlers took %.2fs over %d pages, report written to %s",
+        report["total"],
+        report["pages"],
+        path,
+    )
+    for page in report["slowest_pages"]:
+        SPHINX_LOGGER.info("  %8.1fms  %s", page["total"] * 1000, page["page"])
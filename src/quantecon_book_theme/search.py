@@ -0,0 +1,98 @@
+import gzip
+import hashlib
+import json
+import re
+import shutil
+from pathlib import Path
+from typing import Any, Dict
+
+from sphinx.application import Sphinx
+from sphinx.util import logging
+
+
+SPHINX_LOGGER = logging.getLogger(__name__)
+
+SEARCH_DIR = "_static/search"
+SEARCH_WORKER = "scripts/quantecon-book-theme-search-worker.js"
+PREFIX_LENGTH = 2
+
+
+def load_search_index(path: Path) -> Dict[str, Any]:
+    """Read the index Sphinx writes as ``Search.setIndex({...})``."""
+    text = path.read_text(encoding="utf-8")
+    return json.loads(text[text.index("(") + 1 : text.rindex(")")])
+
+
+def shard_prefix(term: str) -> str:
+    """The shard a search term belongs to, by its lowercased prefix."""
+    return term.lower()[:PREFIX_LENGTH]
+
+
+def _shard_filename(prefix: str, content: bytes) -> str:
+    """A URL-safe, fingerprinted file name for a shard."""
+    safe = "".join(
+        char if char.isascii() and char.isalnum() else f"_{ord(char):x}"
+        for char in prefix
+    )
+    digest = hashlib.sha1(content).hexdigest()[:8]
+    return f"terms-{safe}.{digest}.json"
+
+
+def shard_search_index(index: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Split the ``terms`` and ``titleterms`` of a search index by prefix."""
+    shards = {}
+    for key in ("terms", "titleterms"):
+        for term, docs in index.get(key, {}).items():
+            shard = shards.setdefault(
+                shard_prefix(term), {"terms": {}, "titleterms": {}}
+            )
+            shard[key][term] = docs
+    return shards
+
+
+def _plain_title(title: str) -> str:
+    """Strip the inline markup Sphinx keeps in page titles."""
+    return re.sub(r"<[^>]+>", "", title)
+
+
+def _write_json(path: Path, content: bytes):
+    """Write a JSON file next to a gzip-compressed copy."""
+    path.write_bytes(content)
+    path.with_name(path.name + ".gz").write_bytes(gzip.compress(content, mtime=0))
+
+
+def write_search_shards(app: Sphinx):
+    """Write the search index as prefix shards for the toolbar search worker.
+
+    ``meta.json`` lists the page titles and URLs and maps each term prefix to
+    its shard file, so the worker only downloads the shards a query needs.
+    """
+    index_path = Path(app.outdir) / "searchindex.js"
+    if not index_path.exists():
+        SPHINX_LOGGER.warning(
+            "sharded_search is enabled but no search index was written, skipping."
+        )
+        return
+
+    index = load_search_index(index_path)
+    outdir = Path(app.outdir) / SEARCH_DIR
+    # Drop shards from previous builds
+    shutil.rmtree(outdir, ignore_errors=True)
+    outdir.mkdir(parents=True)
+
+    files = {}
+    for prefix, shard in sorted(shard_search_index(index).items()):
+        content = json.dumps(shard, separators=(",", ":")).encode("utf-8")
+        files[prefix] = _shard_filename(prefix, content)
+        _write_json(outdir / files[prefix], content)
+
+    meta = {
+        "prefixLength": PREFIX_LENGTH,
+        "titles": [_plain_title(title) for title in index.get("titles", [])],
+        "urls": [
+            app.builder.get_target_uri(docname) for docname in index.get("docnames", [])
+        ],
+        "shards": files,
+    }
+    content = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+    _write_json(outdir / "meta.json", content)
@@ -0,0 +1,59 @@
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, Sequence
+
+from sphinx.application import Sphinx
+from sphinx.util import logging
+
+from .options import get_theme_options
+
+
+SPHINX_LOGGER = logging.getLogger(__name__)
+
+SERVICE_WORKER = "sw.js"
+SERVICE_WORKER_TEMPLATE = (
+    Path(__file__).parent / "theme" / "quantecon_book_theme" / "service-worker.js"
+)
+
+
+def get_precache_urls(asset_digests: Dict[str, str], extra: Sequence[str] = ()):
+    """List the URLs the service worker precaches on install.
+
+    :param asset_digests: Maps each asset link (relative to the output
+        directory, e.g. ``_static/scripts/quantecon-book-theme.js``) to its
+        digest. They are precached with the same ``?digest=`` query the pages
+        link them with.
+    :param extra: Other fingerprinted files to precache, such as the shared
+        navigation fragment.
+    """
+    urls = [f"{link}?digest={digest}" for link, digest in sorted(asset_digests.items())]
+    urls.extend(extra)
+    return urls
+
+
+def render_service_worker(precache: list, max_pages: int) -> str:
+    """Fill in the service worker template.
+
+    The cache version is derived from the precached URLs, so it changes
+    whenever a theme asset digest does and old caches are evicted.
+    """
+    version = hashlib.sha1("\n".join(precache).encode("utf-8")).hexdigest()[:12]
+    config = {"version": version, "precache": precache, "maxPages": max_pages}
+    template = SERVICE_WORKER_TEMPLATE.read_text(encoding="utf-8")
+    return template.replace("__CONFIG__", json.dumps(config, indent=2))
+
+
+def write_service_worker(
+    app: Sphinx, asset_digests: Dict[str, str], extra: Sequence[str] = ()
+):
+    """Write the service worker to the root of the HTML output.
+
+    It has to live at the root so that its scope covers every page.
+    """
+    max_pages = get_theme_options(app).service_worker_max_pages
+
+    precache = get_precache_urls(asset_digests, extra)
+    Path(app.outdir).joinpath(SERVICE_WORKER).write_text(
+        render_service_worker(precache, max_pages), encoding="utf-8"
+    )
@@ -0,0 +1,77 @@
+/**
+ * QuantEcon Book Theme - MathJax Renderer
+ *
+ * Renders TeX to SVG at build time for the `math_prerender` option. The
+ * build starts one process per writer and talks to it over stdin/stdout, one
+ * JSON message per line:
+ *
+ *   argv[2]: { macros, scale }
+ *   ->  { ready: true } | { error }           once, on startup
+ *   { tex, display }  ->  { html } | { error }
+ *
+ * mathjax-full is resolved from the project directory (the working directory)
+ * first, then from NODE_PATH.
+ */
+
+const path = require("path");
+const readline = require("readline");
+const { createRequire } = require("module");
+
+const projectRequire = createRequire(path.join(process.cwd(), "index.js"));
+
+function load(name) {
+  try {
+    return projectRequire(name);
+  } catch (e) {
+    return require(name);
+  }
+}
+
+function send(message) {
+  process.stdout.write(JSON.stringify(message) + "\n");
+}
+
+let document;
+let adaptor;
+
+try {
+  const config = JSON.parse(process.argv[2] || "{}");
+  const { mathjax } = load("mathjax-full/js/mathjax.js");
+  const { TeX } = load("mathjax-full/js/input/tex.js");
+  const { SVG } = load("mathjax-full/js/output/svg.js");
+  const { liteAdaptor } = load("mathjax-full/js/adaptors/liteAdaptor.js");
+  const { RegisterHTMLHandler } = load("mathjax-full/js/handlers/html.js");
+  const { AllPackages } = load("mathjax-full/js/input/tex/AllPackages.js");
+
+  adaptor = liteAdaptor();
+  RegisterHTMLHandler(adaptor);
+  document = mathjax.document("", {
+    InputJax: new TeX({ packages: AllPackages, macros: config.macros || {} }),
+    // Each equation carries its own glyphs, so pages need no font cache
+    OutputJax: new SVG({ fontCache: "local", scale: config.scale || 1 }),
+  });
+} catch (e) {
+  send({ error: `could not load mathjax-full: ${e.message}` });
+  process.exit(0);
+}
+
+send({ ready: true });
+
+readline
+  .createInterface({ input: process.stdin, terminal: false })
+  .on("line", (line) => {
+    try {
+      const { tex, display } = JSON.parse(line);
+      const node = document.convert(tex, { display });
+      const html = adaptor.outerHTML(node);
+      // TeX errors are rendered in place instead of thrown
+      if (html.includes("data-mjx-error")) {
+        const error = html.match(/data-mjx-error="([^"]*)"/);
+        send({ error: error ? error[1] : "TeX error" });
+      } else {
+        send({ html });
+      }
+    } catch (e) {
+      send({ error: e.message });
+    }
+  });
@@ -0,0 +1,137 @@
+/**
+ * QuantEcon Book Theme - Service Worker
+ *
+ * Generated at the end of each build when `service_worker` is enabled. The
+ * build fills in CONFIG with the fingerprinted theme assets and a version
+ * derived from their digests.
+ *
+ * - Theme assets are precached in a versioned cache; caches from previous
+ *   versions are deleted when the new worker activates.
+ * - Fingerprinted static files are served cache-first, other static files and
+ *   images are served stale-while-revalidate.
+ * - Pages are served stale-while-revalidate from a cache holding at most
+ *   CONFIG.maxPages entries, dropping the least recently used ones.
+ */
+
+const CONFIG = __CONFIG__;
+
+const PREFIX = "qe-";
+const PRECACHE = `${PREFIX}precache-${CONFIG.version}`;
+const STATIC = `${PREFIX}static-${CONFIG.version}`;
+const PAGES = `${PREFIX}pages`;
+const CURRENT = [PRECACHE, STATIC, PAGES];
+
+const SCOPE = new URL(self.registration.scope);
+const STATIC_DIRS = ["_static/", "_images/"].map(
+  (dir) => new URL(dir, SCOPE).pathname,
+);
+
+self.addEventListener("install", (event) => {
+  event.waitUntil(
+    caches
+      .open(PRECACHE)
+      .then((cache) =>
+        cache.addAll(CONFIG.precache.map((url) => new URL(url, SCOPE).href)),
+      )
+      .then(() => self.skipWaiting()),
+  );
+});
+
+self.addEventListener("activate", (event) => {
+  event.waitUntil(
+    caches
+      .keys()
+      .then((names) =>
+        Promise.all(
+          names
+            .filter((name) => name.startsWith(PREFIX) && !CURRENT.includes(name))
+            .map((name) => caches.delete(name)),
+        ),
+      )
+      .then(() => self.clients.claim()),
+  );
+});
+
+/**
+ * Drop the least recently used pages beyond the cap. Cache keys are kept in
+ * insertion order and every hit re-inserts its page, so the oldest come first.
+ */
+async function trimPages(cache) {
+  const keys = await cache.keys();
+  const excess = keys.length - CONFIG.maxPages;
+  for (let i = 0; i < excess; i++) {
+    await cache.delete(keys[i]);
+  }
+}
+
+/**
+ * Serve from the cache and refresh it from the network in the background
+ */
+async function staleWhileRevalidate(event, cacheName, isPage) {
+  const cache = await caches.open(cacheName);
+  const cached = await cache.match(event.request);
+
+  const network = fetch(event.request)
+    .then(async (response) => {
+      if (response.ok && response.type === "basic") {
+        await cache.put(event.request, response.clone());
+        if (isPage) await trimPages(cache);
+      }
+      return response;
+    })
+    .catch(async () => {
+      if (cached && isPage) {
+        // Keep pages read offline at the recent end of the cache
+        await cache.put(event.request, cached.clone());
+      }
+      return cached || Response.error();
+    });
+
+  if (cached) {
+    event.waitUntil(network);
+    return cached;
+  }
+  return network;
+}
+
+/**
+ * Serve fingerprinted files from the cache, fetching them once
+ */
+async function cacheFirst(event) {
+  const cached = await caches.match(event.request);
+  if (cached) return cached;
+
+  try {
+    const response = await fetch(event.request);
+    if (response.ok && response.type === "basic") {
+      const cache = await caches.open(STATIC);
+      await cache.put(event.request, response.clone());
+    }
+    return response;
+  } catch (error) {
+    // Offline with a page that links an older fingerprint of the same file
+    const fallback = await caches.match(event.request, { ignoreSearch: true });
+    if (fallback) return fallback;
+    throw error;
+  }
+}
+
+self.addEventListener("fetch", (event) => {
+  const request = event.request;
+  if (request.method !== "GET") return;
+
+  const url = new URL(request.url);
+  if (url.origin !== SCOPE.origin || !url.pathname.startsWith(SCOPE.pathname)) {
+    return;
+  }
+
+  if (request.mode === "navigate") {
+    event.respondWith(staleWhileRevalidate(event, PAGES, true));
+  } else if (STATIC_DIRS.some((dir) => url.pathname.startsWith(dir))) {
+    const fingerprinted =
+      url.searchParams.has("digest") || url.searchParams.has("v");
+    event.respondWith(
+      fingerprinted ? cacheFirst(event) : staleWhileRevalidate(event, STATIC),
+    );
+  }
+});
@@ -0,0 +1,146 @@
+import { test, expect, Page } from "@playwright/test";
+import * as fs from "fs";
+import * as path from "path";
+
+/**
+ * Performance budgets for quantecon-book-theme.
+ *
+ * Each file in budgets/ names a page of the fixtures site and the most each
+ * metric may reach on it:
+ *
+ * - longTasks: main-thread tasks over 50ms until the page settles
+ * - totalBlockingTime: the time past 50ms of each long task after the first
+ *   contentful paint, in ms
+ * - cumulativeLayoutShift: the largest session window of layout shifts
+ * - jsBytes, cssBytes: same-origin scripts and stylesheets, decoded
+ * - domContentLoadedToInteractive: from DOMContentLoaded until index.js has
+ *   run every initialiser, in ms: the end of the later of the `qe:init`
+ *   measure and the `qe:idle` measure of the idle-time initialisers
+ *
+ * The measured metrics are attached to each test, so budgets can be
+ * tightened from the report of a passing run.
+ */
+
+const BUDGETS_DIR = path.join(__dirname, "budgets");
+
+const pageBudgets = fs
+  .readdirSync(BUDGETS_DIR)
+  .filter((file) => file.endsWith(".json"))
+  .sort()
+  .map((file) => ({
+    name: path.basename(file, ".json"),
+    ...JSON.parse(fs.readFileSync(path.join(BUDGETS_DIR, file), "utf-8")),
+  }));
+
+// Runs before any script of the page, so that long tasks and layout shifts
+// from the start of the load are recorded.
+function observePerformance() {
+  const w = window as any;
+  w.__qePerf = { longTasks: [], layoutShifts: [] };
+  new PerformanceObserver((list) => {
+    for (const entry of list.getEntries()) {
+      w.__qePerf.longTasks.push({
+        startTime: entry.startTime,
+        duration: entry.duration,
+      });
+    }
+  }).observe({ type: "longtask", buffered: true });
+  new PerformanceObserver((list) => {
+    for (const entry of list.getEntries() as any[]) {
+      if (!entry.hadRecentInput) {
+        w.__qePerf.layoutShifts.push({
+          startTime: entry.startTime,
+          value: entry.value,
+        });
+      }
+    }
+  }).observe({ type: "layout-shift", buffered: true });
+}
+
+async function collectMetrics(page: Page) {
+  return page.evaluate(() => {
+    const w = window as any;
+    const paint = performance.getEntriesByName("first-contentful-paint")[0];
+    const fcp = paint ? paint.startTime : 0;
+    const blocking = w.__qePerf.longTasks
+      .filter((task: any) => task.startTime >= fcp)
+      .reduce((sum: number, task: any) => sum + Math.max(0, task.duration - 50), 0);
+
+    // Shifts less than 1s apart, within 5s, belong to the same session window
+    let cls = 0;
+    let session = 0;
+    let first = 0;
+    let last = 0;
+    for (const shift of w.__qePerf.layoutShifts) {
+      if (session && (shift.startTime - last > 1000 || shift.startTime - first > 5000)) {
+        session = 0;
+      }
+      if (!session) first = shift.startTime;
+      session += shift.value;
+      last = shift.startTime;
+      cls = Math.max(cls, session);
+    }
+
+    const navigation = performance.getEntriesByType(
+      "navigation",
+    )[0] as PerformanceNavigationTiming;
+    const init = performance.getEntriesByName("qe:init", "measure")[0];
+    const idle = performance.getEntriesByName("qe:idle", "measure")[0];
+    return {
+      longTasks: w.__qePerf.longTasks.length,
+      totalBlockingTime: blocking,
+      cumulativeLayoutShift: cls,
+      domContentLoadedToInteractive:
+        init && idle
+          ? Math.max(init.startTime + init.duration, idle.startTime + idle.duration) -
+            navigation.domContentLoadedEventStart
+          : null,
+    };
+  });
+}
+
+test.describe("Performance Budgets", () => {
+  for (const budget of pageBudgets) {
+    test(`${budget.name} - within budget`, async ({ page, baseURL }, testInfo) => {
+      const bytes = { jsBytes: 0, cssBytes: 0 };
+      const bodies: Promise<void>[] = [];
+      page.on("response", (response) => {
+        const type = response.request().resourceType();
+        const key = type === "script" ? "jsBytes" : type === "stylesheet" ? "cssBytes" : null;
+        if (!key || !response.url().startsWith(baseURL!)) return;
+        bodies.push(
+          response
+            .body()
+            .then((body) => {
+              bytes[key] += body.length;
+            })
+            .catch(() => {}),
+        );
+      });
+      await page.addInitScript(observePerformance);
+
+      const response = await page.goto(budget.path);
+      expect(response?.status(), `${budget.path} is not in the fixtures site`).toBe(200);
+      await page.waitForLoadState("networkidle");
+      // Until the idle-time initialisers have all run
+      await page.waitForFunction(
+        () => performance.getEntriesByName("qe:idle", "measure").length > 0,
+      );
+      // Let late long tasks and layout shifts land
+      await page.waitForTimeout(1000);
+      await Promise.all(bodies);
+
+      const metrics = { ...(await collectMetrics(page)), ...bytes };
+      await testInfo.attach("metrics.json", {
+        body: JSON.stringify(metrics, null, 2),
+        contentType: "application/json",
+      });
+
+      for (const [name, limit] of Object.entries(budget.budgets)) {
+        const value = (metrics as any)[name];
+        expect.soft(value, `${name} was not measured`).not.toBeNull();
+        expect.soft(value, `${name} is over budget`).toBeLessThanOrEqual(limit as number);
+      }
+    });
+  }
+});
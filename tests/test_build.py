@@ -1,3 +1,4 @@
+import json
 from bs4 import BeautifulSoup
 from pathlib import Path
 from subprocess import check_output
@@ -588,6 +589,88 @@ def test_git_functions_with_real_file():
         assert isinstance(entry["author"], str)
 
 
+def test_write_changelog_json_unit(tmp_path):
+    """Unit test for write_changelog_json used by lazy_changelog."""
+    import json
+    from datetime import datetime, timezone
+    from quantecon_book_theme import write_changelog_json
+
+    app = Mock()
+    app.outdir = tmp_path
+    changelog = [
+        {
+            "hash": "abc1234",
+            "author": "Jane Doe",
+            "date": datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc),
+            "message": "Fix <typo>",
+            "relative_time": "2 days ago",
+        }
+    ]
+
+    relpath = write_changelog_json(app, "section1/ntbk", changelog)
+    assert relpath == "_changelog/section1/ntbk.json"
+    entries = json.loads(tmp_path.joinpath(relpath).read_text())
+    assert entries == [
+        {
+            "hash": "abc1234",
+            "author": "Jane Doe",
+            "date": "2024-01-02T03:04:05+00:00",
+            "message": "Fix <typo>",
+        }
+    ]
+    # Unchanged history leaves the file alone
+    mtime = tmp_path.joinpath(relpath).stat().st_mtime_ns
+    write_changelog_json(app, "section1/ntbk", changelog)
+    assert tmp_path.joinpath(relpath).stat().st_mtime_ns == mtime
+
+
+def test_lazy_changelog(sphinx_build):
+    """Test that lazy_changelog writes the history as JSON at the end of a build."""
+    import json
+    import os
+    import subprocess
+
+    sphinx_build.copy()
+    env = {
+        **os.environ,
+        "GIT_AUTHOR_NAME": "Jane Doe",
+        "GIT_AUTHOR_EMAIL": "jane@example.org",
+        "GIT_COMMITTER_NAME": "Jane Doe",
+        "GIT_COMMITTER_EMAIL": "jane@example.org",
+    }
+
+    def git(*args):
+        subprocess.run(["git", *args], cwd=sphinx_build.path_book, env=env, check=True)
+
+    git("init", "--quiet")
+    git("add", ".")
+    git("commit", "--quiet", "-m", "Initial book")
+
+    cmd = ["-D", "html_theme_options.lazy_changelog=True"]
+    sphinx_build.build(cmd)
+    content = sphinx_build.get("index.html").find(id="changelog-content")
+    changelog = content.find("ul", class_="changelog-list")
+    assert changelog["data-src"] == "_changelog/index.json"
+    assert changelog.find("li") is None
+    entries = json.loads(sphinx_build.path("_changelog", "index.json").read_text())
+    assert [entry["message"] for entry in entries] == ["Initial book"]
+    assert "relative_time" not in entries[0]
+    assert sphinx_build.path("_changelog", "section1", "ntbk.json").exists()
+
+    # A new commit updates the history written by the next build
+    index = sphinx_build.path_book / "index.md"
+    original = index.read_text()
+    index.write_text(original + "\nEdited.\n")
+    git("commit", "--quiet", "-am", "Edit the index")
+    sphinx_build.clean()
+    sphinx_build.build(cmd)
+    entries = json.loads(sphinx_build.path("_changelog", "index.json").read_text())
+    assert [entry["message"] for entry in entries] == ["Edit the index", "Initial book"]
+    sphinx_build.clean()
+    index.write_text(original)
+    rmtree(sphinx_build.path_book / ".git")
+
+
 def test_add_hub_urls_nb_path_to_notebooks():
     """Unit test for add_hub_urls to verify nb_path_to_notebooks config."""
     from quantecon_book_theme.launch import add_hub_urls
@@ -599,16 +682,14 @@ def test_add_hub_urls_nb_path_to_notebooks():
 
     # Test with flat notebook repository (default empty nb_path_to_notebooks)
     context = {}
-    app.config = {
-        "html_theme_options": {
-            "nb_repository_url": "https://github.com/TestOrg/test-notebooks",
-            "nb_branch": "main",
-            "path_to_docs": "lectures",  # This should NOT affect notebook URLs
-            # nb_path_to_notebooks defaults to empty
-            "launch_buttons": {
-                "colab_url": "https://colab.research.google.com",
-            },
-        }
+    app.config.html_theme_options = {
+        "nb_repository_url": "https://github.com/TestOrg/test-notebooks",
+        "nb_branch": "main",
+        "path_to_docs": "lectures",  # This should NOT affect notebook URLs
+        # nb_path_to_notebooks defaults to empty
+        "launch_buttons": {
+            "colab_url": "https://colab.research.google.com",
+        },
     }
 
     add_hub_urls(app, "test_page", "template", context, Mock())
@@ -622,16 +703,14 @@ def test_add_hub_urls_nb_path_to_notebooks():
 
     # Test with nb_path_to_notebooks set to a subfolder
     context = {}
-    app.config = {
-        "html_theme_options": {
-            "nb_repository_url": "https://github.com/TestOrg/test-notebooks",
-            "nb_branch": "main",
-            "path_to_docs": "docs",
-            "nb_path_to_notebooks": "notebooks",  # Notebooks in subfolder
-            "launch_buttons": {
-                "colab_url": "https://colab.research.google.com",
-            },
-        }
+    app.config.html_theme_options = {
+        "nb_repository_url": "https://github.com/TestOrg/test-notebooks",
+        "nb_branch": "main",
+        "path_to_docs": "docs",
+        "nb_path_to_notebooks": "notebooks",  # Notebooks in subfolder
+        "launch_buttons": {
+            "colab_url": "https://colab.research.google.com",
+        },
     }
 
     add_hub_urls(app, "test_page", "template", context, Mock())
@@ -655,16 +734,14 @@ def test_add_hub_urls_path_to_docs_stripping():
 
     # Test with path_to_docs set and pagename including that prefix
     context = {}
-    app.config = {
-        "html_theme_options": {
-            "nb_repository_url": "https://github.com/QuantEcon/lecture-jax.notebooks",
-            "nb_branch": "main",
-            "path_to_docs": "lectures",  # Source docs are in lectures/ directory
-            # nb_path_to_notebooks not set (flat notebook repo)
-            "launch_buttons": {
-                "colab_url": "https://colab.research.google.com",
-            },
-        }
+    app.config.html_theme_options = {
+        "nb_repository_url": "https://github.com/QuantEcon/lecture-jax.notebooks",
+        "nb_branch": "main",
+        "path_to_docs": "lectures",  # Source docs are in lectures/ directory
+        # nb_path_to_notebooks not set (flat notebook repo)
+        "launch_buttons": {
+            "colab_url": "https://colab.research.google.com",
+        },
     }
 
     # pagename includes "lectures/" prefix because that's where source files are
@@ -678,16 +755,14 @@ def test_add_hub_urls_path_to_docs_stripping():
 
     # Test with path_to_docs and nb_path_to_notebooks both set
     context = {}
-    app.config = {
-        "html_theme_options": {
-            "nb_repository_url": "https://github.com/TestOrg/test-notebooks",
-            "nb_branch": "main",
-            "path_to_docs": "docs",  # Source docs are in docs/ directory
-            "nb_path_to_notebooks": "notebooks",  # Notebooks in notebooks/ subdirectory
-            "launch_buttons": {
-                "colab_url": "https://colab.research.google.com",
-            },
-        }
+    app.config.html_theme_options = {
+        "nb_repository_url": "https://github.com/TestOrg/test-notebooks",
+        "nb_branch": "main",
+        "path_to_docs": "docs",  # Source docs are in docs/ directory
+        "nb_path_to_notebooks": "notebooks",  # Notebooks in notebooks/ subdirectory
+        "launch_buttons": {
+            "colab_url": "https://colab.research.google.com",
+        },
     }
 
     app.env.metadata = {"docs/example": {"kernelspec": {"name": "python3"}}}
@@ -703,16 +778,14 @@ def test_add_hub_urls_path_to_docs_stripping():
     # Test backward compatibility: pagename doesn't start with path_to_docs prefix
     # This ensures existing configurations without the prefix in pagename still work
     context = {}
-    app.config = {
-        "html_theme_options": {
-            "nb_repository_url": "https://github.com/QuantEcon/lecture-python-intro.notebooks",
-            "nb_branch": "main",
-            "path_to_docs": "lectures",  # path_to_docs is set but...
-            # nb_path_to_notebooks not set (flat notebook repo)
-            "launch_buttons": {
-                "colab_url": "https://colab.research.google.com",
-            },
-        }
+    app.config.html_theme_options = {
+        "nb_repository_url": "https://github.com/QuantEcon/lecture-python-intro.notebooks",
+        "nb_branch": "main",
+        "path_to_docs": "lectures",  # path_to_docs is set but...
+        # nb_path_to_notebooks not set (flat notebook repo)
+        "launch_buttons": {
+            "colab_url": "https://colab.research.google.com",
+        },
     }
 
     # pagename does NOT include "lectures/" prefix (typical when building from within lectures/)
@@ -723,3 +796,1148 @@ def test_add_hub_urls_path_to_docs_stripping():
     assert "colab_url" in context
     expected_url = "https://colab.research.google.com/github/QuantEcon/lecture-python-intro.notebooks/blob/main/intro.ipynb"
     assert context["colab_url"] == expected_url
+
+
+def test_root_relative_href_unit():
+    """Unit test for rewriting sidebar links relative to the site root."""
+    from quantecon_book_theme import _root_relative_href
+
+    page = "section1/page1.html"
+    assert _root_relative_href("../page2.html", page) == "page2.html"
+    assert _root_relative_href("ntbk.html", page) == "section1/ntbk.html"
+    assert _root_relative_href("#", page) == "section1/page1.html"
+    assert _root_relative_href("#intro", page) == "section1/page1.html#intro"
+    assert _root_relative_href("../index.html#a", page) == "index.html#a"
+    # Directory URLs of dirhtml builds keep their trailing slash
+    assert _root_relative_href("../page1/", "section1/ntbk/") == "section1/page1/"
+    assert _root_relative_href("../", "section1/") == "./"
+    # External and absolute links are left alone
+    assert _root_relative_href("https://google.com", page) == "https://google.com"
+    assert _root_relative_href("/abs/page.html", page) == "/abs/page.html"
+
+
+def test_shared_navigation_fallback_unit():
+    """The inline fallback keeps only top-level entries, relative to the page."""
+    from quantecon_book_theme import shared_navigation_fallback
+
+    html = (
+        '<ul class="nav bd-sidenav">'
+        '<li class="toctree-l1"><a class="reference internal" href="page1.html">'
+        "Page 1</a></li>"
+        '<li class="toctree-l1 has-children">'
+        '<a class="reference internal" href="section1/index.html">Section 1</a>'
+        "<details><summary></summary><ul>"
+        '<li class="toctree-l2"><a href="section1/page1.html">Sub</a></li>'
+        "</ul></details></li></ul>"
+    )
+    out = BeautifulSoup(
+        shared_navigation_fallback(html, "section1/index.html"), "html.parser"
+    )
+    assert out.find("details") is None
+    links = {a.text.strip(): a for a in out("a")}
+    assert links["Page 1"]["href"] == "../page1.html"
+    assert links["Section 1"]["href"] == "#"
+    assert "current" in links["Section 1"].find_parent("li")["class"]
+    assert "has-children" not in links["Section 1"].find_parent("li")["class"]
+
+
+def test_shared_navigation_cleared_per_build():
+    """A new build in the same process does not reuse the previous fragment."""
+    from types import SimpleNamespace
+
+    from quantecon_book_theme import _SHARED_NAVIGATION, clear_shared_navigation
+
+    app = SimpleNamespace()
+    _SHARED_NAVIGATION[id(app)] = ("_static/navigation/sidebar-old.html", "")
+    clear_shared_navigation(app)
+    assert id(app) not in _SHARED_NAVIGATION
+
+
+def test_shared_navigation(sphinx_build):
+    """Test that shared_navigation writes one fragment and inlines a fallback."""
+    sphinx_build.copy()
+
+    cmd = ["-D", "html_theme_options.shared_navigation=True"]
+    sphinx_build.build(cmd)
+    fragments = list(sphinx_build.path("_static", "navigation").glob("sidebar-*"))
+    assert len(fragments) == 1
+    fragment = BeautifulSoup(fragments[0].read_text(), "html.parser")
+    # The fragment is page-independent: root-relative links, no current markers
+    assert fragment.find("a", href="section1/ntbk.html") is not None
+    assert fragment.find(class_="current") is None
+
+    pages = [(("index.html",), "", "./"), (("section1", "ntbk.html"), "../", "../")]
+    for page, prefix, root in pages:
+        nav = sphinx_build.get(*page).find("nav", id="qe-sidebar-nav")
+        expected = f"{prefix}_static/navigation/{fragments[0].name}"
+        assert nav["data-shared-nav"] == expected
+        assert nav["data-content-root"] == root
+        # Only the top-level entries are inlined
+        assert nav.find("details") is None
+        assert "1. Page 1" in str(nav)
+        assert "3.1. Section 1 page1" not in str(nav)
+    sphinx_build.clean()
+
+
+def test_prefetch(sphinx_build):
+    """Test that prefetch options emit speculation rules and the nav flag."""
+    import json
+
+    sphinx_build.copy()
+
+    # Disabled by default
+    sphinx_build.build()
+    index_html = sphinx_build.get("index.html")
+    assert index_html.find("script", type="speculationrules") is None
+    nav = index_html.find("nav", id="qe-sidebar-nav")
+    assert not nav.has_attr("data-prefetch")
+    sphinx_build.clean()
+
+    sphinx_build.copy()
+    cmd = [
+        "-D",
+        "html_theme_options.prefetch_next_page=True",
+        "-D",
+        "html_theme_options.prefetch_sidebar_links=True",
+    ]
+    sphinx_build.build(cmd)
+    index_html = sphinx_build.get("index.html")
+    rules = index_html.find("script", type="speculationrules")
+    assert json.loads(rules.string) == {
+        "prefetch": [{"source": "list", "urls": ["page1.html"]}]
+    }
+    nav = index_html.find("nav", id="qe-sidebar-nav")
+    assert nav["data-prefetch"] == "true"
+    sphinx_build.clean()
+
+
+def test_instant_navigation(sphinx_build):
+    """Test that instant_navigation flags the page wrapper for the JS."""
+    sphinx_build.copy()
+
+    sphinx_build.build(["-D", "html_theme_options.instant_navigation=True"])
+    for page in [("index.html",), ("section1", "ntbk.html")]:
+        wrapper = sphinx_build.get(*page).find("div", class_="qe-wrapper")
+        assert wrapper["data-instant-navigation"] == "true"
+    sphinx_build.clean()
+
+
+def test_service_worker_unit():
+    """Unit test for rendering the service worker config."""
+    import json
+    from quantecon_book_theme.service_worker import (
+        get_precache_urls,
+        render_service_worker,
+    )
+
+    digests = {"_static/styles/a.css": "111", "_static/scripts/a.js": "222"}
+    precache = get_precache_urls(digests, ["_static/navigation/sidebar-abc.html"])
+    assert precache == [
+        "_static/scripts/a.js?digest=222",
+        "_static/styles/a.css?digest=111",
+        "_static/navigation/sidebar-abc.html",
+    ]
+
+    def config(script):
+        line = script.split("const CONFIG = ", 1)[1].split(";\n", 1)[0]
+        return json.loads(line)
+
+    sw = config(render_service_worker(precache, 10))
+    assert sw["precache"] == precache
+    assert sw["maxPages"] == 10
+
+    # The cache version follows the asset digests
+    same = config(render_service_worker(list(precache), 20))
+    digests["_static/scripts/a.js"] = "333"
+    changed = config(render_service_worker(get_precache_urls(digests), 10))
+    assert same["version"] == sw["version"]
+    assert changed["version"] != sw["version"]
+
+
+def test_service_worker(sphinx_build):
+    """Test that service_worker writes sw.js and registers it from every page."""
+    sphinx_build.copy()
+
+    cmd = [
+        "-D",
+        "html_theme_options.service_worker=True",
+        "-D",
+        "html_theme_options.service_worker_max_pages=5",
+    ]
+    sphinx_build.build(cmd)
+    sw = sphinx_build.path("sw.js").read_text()
+    assert "__CONFIG__" not in sw
+    assert '"maxPages": 5' in sw
+    assert "_static/scripts/quantecon-book-theme.js?digest=" in sw
+
+    for page, root in [(("index.html",), ""), (("section1", "ntbk.html"), "../")]:
+        meta = sphinx_build.get(*page).find("meta", attrs={"name": "qe-service-worker"})
+        assert meta["content"] == f"{root}sw.js"
+    sphinx_build.clean()
+
+
+def test_service_worker_shared_navigation(sphinx_build):
+    """Test that a parallel build precaches the shared navigation fragment."""
+    sphinx_build.copy()
+
+    cmd = [
+        "-j",
+        "2",
+        "-D",
+        "html_theme_options.service_worker=True",
+        "-D",
+        "html_theme_options.shared_navigation=True",
+    ]
+    sphinx_build.build(cmd)
+    fragments = list(sphinx_build.path("_static", "navigation").glob("sidebar-*"))
+    assert len(fragments) == 1
+    assert (
+        f"_static/navigation/{fragments[0].name}"
+        in sphinx_build.path("sw.js").read_text()
+    )
+    sphinx_build.clean()
+
+
+def test_shard_search_index_unit(tmp_path):
+    """Unit test for splitting a search index by term prefix."""
+    from quantecon_book_theme.search import load_search_index, shard_search_index
+
+    path = tmp_path / "searchindex.js"
+    path.write_text(
+        'Search.setIndex({"terms":{"x":1,"matrix":[0,2],"math":0},'
+        '"titleterms":{"matrix":1,"Éta":2}})'
+    )
+    index = load_search_index(path)
+    shards = shard_search_index(index)
+    assert set(shards) == {"x", "ma", "ét"}
+    assert shards["ma"] == {
+        "terms": {"matrix": [0, 2], "math": 0},
+        "titleterms": {"matrix": 1},
+    }
+    assert shards["ét"]["titleterms"] == {"Éta": 2}
+
+
+def test_sharded_search(sphinx_build):
+    """Test that sharded_search writes the shards and configures the toolbar."""
+    import gzip
+    import json
+
+    sphinx_build.copy()
+
+    sphinx_build.build(["-D", "html_theme_options.sharded_search=True"])
+    search_dir = sphinx_build.path("_static", "search")
+    meta = json.loads(search_dir.joinpath("meta.json").read_text())
+    assert meta["urls"][meta["titles"].index("1. Page 1")] == "page1.html"
+    shard = search_dir.joinpath(meta["shards"]["no"])
+    assert "notebook" in json.loads(shard.read_text())["terms"]
+    gz = shard.with_name(shard.name + ".gz")
+    assert gzip.decompress(gz.read_bytes()) == shard.read_bytes()
+
+    form = sphinx_build.get("section1", "ntbk.html").find(
+        "form", action="../search.html"
+    )
+    assert form["data-search-index"] == "../_static/search/meta.json"
+    assert form["data-search-worker"].startswith(
+        "../_static/scripts/quantecon-book-theme-search-worker.js"
+    )
+    sphinx_build.clean()
+
+
+def test_extract_data_uri_images_unit(tmp_path):
+    """Unit test for moving data-URI images into content-addressed files."""
+    import base64
+    from quantecon_book_theme.images import extract_page_images
+
+    png = b"\x89PNG\r\n\x1a\n" + bytes(2048)
+    encoded = base64.b64encode(png).decode()
+    tiny = base64.b64encode(b"GIF89a").decode()
+    body = (
+        f'<img alt="a" src="data:image/png;base64,{encoded}">'
+        f"<p>text</p><img src='data:image/png;base64,{encoded}' />"
+        f'<img src="data:image/gif;base64,{tiny}">'
+    )
+
+    app = Mock()
+    app.outdir = tmp_path
+    app.builder.get_target_uri.return_value = "section1/ntbk.html"
+
+    # Disabled by default
+    context = {"body": body}
+    app.config.html_theme_options = {}
+    extract_page_images(app, "section1/ntbk", "page.html", context, None)
+    assert context["body"] == body
+
+    app.config.html_theme_options = {"extract_data_uri_images": "true"}
+    extract_page_images(app, "section1/ntbk", "page.html", context, None)
+    images = list(tmp_path.joinpath("_images").iterdir())
+    assert len(images) == 1
+    assert images[0].read_bytes() == png
+    src = f"../_images/{images[0].name}"
+    assert f'<img alt="a" src="{src}">' in context["body"]
+    assert f"<img src='{src}' />" in context["body"]
+    # Tiny images stay inline
+    assert f"data:image/gif;base64,{tiny}" in context["body"]
+
+
+def test_lazy_loading_unit(tmp_path):
+    """Unit test for image sizes and native lazy loading of page media."""
+    import struct
+    from quantecon_book_theme.images import (
+        lazy_load_page_media,
+        merge_image_sizes,
+        read_image_size,
+    )
+
+    png = (
+        b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR" + struct.pack(">II", 640, 480) + bytes(8)
+    )
+    svg = b'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 120 80"></svg>'
+    assert read_image_size(png) == (640, 480)
+    assert read_image_size(b"GIF89a" + struct.pack("<HH", 3, 5)) == (3, 5)
+    assert read_image_size(svg) == (120, 80)
+    assert read_image_size(b"not an image") is None
+
+    srcdir, outdir, doctreedir = (tmp_path / name for name in ("src", "out", "dt"))
+    for directory in (srcdir, outdir, doctreedir):
+        directory.mkdir()
+    srcdir.joinpath("fig.png").write_bytes(png)
+    # The previous build's copy, of an older version of the image
+    outdir.joinpath("_images").mkdir()
+    outdir.joinpath("_images", "fig.png").write_bytes(
+        png.replace(b"\x02\x80", b"\x01\x40")
+    )
+    outdir.joinpath("_static").mkdir()
+    outdir.joinpath("_static", "logo.svg").write_bytes(svg)
+
+    app = Mock()
+    app.srcdir, app.outdir, app.doctreedir = srcdir, outdir, doctreedir
+    app.builder.images = {"fig.png": "fig.png"}
+    app.builder.get_target_uri.return_value = "section1/ntbk.html"
+    body = (
+        '<img alt="logo" src="../_static/logo.svg" />'
+        '<img src="../_images/fig.png">'
+        '<img src="../_images/fig.png" width="50%">'
+        '<img alt="x > y" src="../_images/fig.png" height="10">'
+        '<img src="https://example.com/remote.png">'
+        '<iframe src="https://example.com"></iframe>'
+    )
+
+    # Disabled by default
+    context = {"body": body}
+    app.config.html_theme_options = {}
+    lazy_load_page_media(app, "section1/ntbk", "page.html", context, None)
+    assert context["body"] == body
+
+    app.config.html_theme_options = {"lazy_loading": "true"}
+    lazy_load_page_media(app, "section1/ntbk", "page.html", context, None)
+    html = context["body"]
+    # The first image is not lazy-loaded
+    assert (
+        '<img alt="logo" src="../_static/logo.svg" decoding="async" '
+        'width="120" height="80" />'
+    ) in html
+    assert (
+        '<img src="../_images/fig.png" decoding="async" loading="lazy" '
+        'width="640" height="480">'
+    ) in html
+    assert 'width="50%" decoding="async" loading="lazy">' in html
+    # A ">" in an attribute value does not end the tag early
+    assert '<img alt="x > y" src="../_images/fig.png" height="10" decoding' in html
+    assert 'remote.png" decoding="async" loading="lazy">' in html
+    assert '<iframe src="https://example.com" loading="lazy">' in html
+
+    # Sizes are persisted in the doctree directory for the next build
+    merge_image_sizes(app, None)
+    index = json.loads(doctreedir.joinpath("qe-image-sizes.json").read_text())
+    assert sorted(index["sizes"].values()) == [[120, 80], [640, 480]]
+    assert list(doctreedir.glob("*.jsonl")) == []
+
+
+def test_responsive_images_unit(tmp_path):
+    """Unit test for the WebP variants of content images."""
+    Image = pytest.importorskip("PIL.Image")
+    from quantecon_book_theme.images import (
+        add_responsive_page_images,
+        encode_responsive_images,
+        write_responsive_images,
+    )
+
+    srcdir, outdir, doctreedir = (tmp_path / name for name in ("src", "out", "dt"))
+    for directory in (srcdir, outdir, doctreedir):
+        directory.mkdir()
+    Image.new("RGB", (1200, 600), "steelblue").save(srcdir / "fig.png")
+    stale = doctreedir / "qe-responsive" / "0000000000000000-480w.webp"
+    stale.parent.mkdir()
+    stale.write_bytes(b"")
+
+    app = Mock()
+    app.srcdir, app.outdir, app.doctreedir = srcdir, outdir, doctreedir
+    app.builder.format = "html"
+    app.builder.images = {"fig.png": "fig.png"}
+    app.builder.get_target_uri.return_value = "section1/ntbk.html"
+    app.config.html_theme_options = {
+        "responsive_images": True,
+        "responsive_image_widths": "480, 960",
+    }
+    env = Mock()
+    env.images = {"fig.png": ({"section1/ntbk"}, "fig.png"), "logo.svg": (set(), "")}
+    encode_responsive_images(app, env)
+
+    body = '<img alt="fig" src="../_images/fig.png" /><img src="../_static/logo.svg">'
+    context = {"body": body}
+    add_responsive_page_images(app, "section1/ntbk", "page.html", context, None)
+
+    html = BeautifulSoup(context["body"], "html.parser")
+    source = html.select_one("picture > source")
+    assert source["type"] == "image/webp"
+    srcset = [item.split() for item in source["srcset"].split(", ")]
+    names = [url.split("/")[-1] for url, _ in srcset]
+    assert [width for _, width in srcset] == ["480w", "960w", "1200w"]
+    assert html.select_one("picture > img")["src"] == "../_images/fig.png"
+    # Images outside _images are left alone
+    assert len(html.select("picture")) == 1
+
+    write_responsive_images(app, None)
+    for name, width in zip(names, (480, 960, 1200)):
+        with Image.open(outdir / "_images" / "responsive" / name) as variant:
+            assert variant.format == "WEBP"
+            assert variant.size == (width, width // 2)
+    # Variants of images that are no longer in the book are removed
+    assert not stale.exists()
+    assert sorted(path.name for path in stale.parent.iterdir()) == sorted(names)
+
+
+def test_responsive_images_encode_failure(tmp_path):
+    """An image whose variants cannot be encoded keeps its plain <img>."""
+    Image = pytest.importorskip("PIL.Image")
+    from quantecon_book_theme.images import (
+        add_responsive_page_images,
+        encode_responsive_images,
+        write_responsive_images,
+    )
+
+    srcdir, outdir, doctreedir = (tmp_path / name for name in ("src", "out", "dt"))
+    for directory in (srcdir, outdir, doctreedir):
+        directory.mkdir()
+    # The header of a truncated PNG still gives its size, but it cannot be read
+    Image.new("RGB", (1200, 600), "steelblue").save(srcdir / "fig.png")
+    data = srcdir.joinpath("fig.png").read_bytes()
+    srcdir.joinpath("fig.png").write_bytes(data[:64])
+    Image.new("RGB", (800, 400), "tomato").save(srcdir / "other.png")
+
+    app = Mock()
+    app.srcdir, app.outdir, app.doctreedir = srcdir, outdir, doctreedir
+    app.builder.format = "html"
+    app.builder.images = {"fig.png": "fig.png", "other.png": "other.png"}
+    app.builder.get_target_uri.return_value = "index.html"
+    app.config.html_theme_options = {"responsive_images": True}
+    env = Mock()
+    env.images = {"fig.png": ({"index"}, "fig.png"), "other.png": ({"index"}, "")}
+    encode_responsive_images(app, env)
+
+    body = '<img alt="a > b" src="_images/fig.png" /><img src="_images/other.png" />'
+    context = {"body": body}
+    add_responsive_page_images(app, "index", "page.html", context, None)
+
+    assert context["body"].startswith('<img alt="a > b" src="_images/fig.png" />')
+    html = BeautifulSoup(context["body"], "html.parser")
+    pictures = html.select("picture")
+    assert len(pictures) == 1
+    assert pictures[0].img["src"] == "_images/other.png"
+    write_responsive_images(app, None)
+    for url in pictures[0].source["srcset"].split(", "):
+        assert outdir.joinpath(url.split()[0]).exists()
+
+
+def test_changed_image_rebuild(sphinx_build):
+    """A changed image is measured and encoded from its source on a rebuild."""
+    Image = pytest.importorskip("PIL.Image")
+
+    sphinx_build.copy()
+    path_page = sphinx_build.path_book / "figure.md"
+    path_image = sphinx_build.path_book / "fig.png"
+    path_page.write_text("---\norphan: true\n---\n# Figure\n\n![fig](fig.png)\n")
+    Image.new("RGB", (1200, 600), "red").save(path_image)
+    cmd = [
+        "-D",
+        "html_theme_options.lazy_loading=True",
+        "-D",
+        "html_theme_options.responsive_images=True",
+        # The executed notebooks of the first build are not sources
+        "-D",
+        "exclude_patterns=_build",
+    ]
+
+    def built_figure():
+        img = sphinx_build.get("figure.html").select_one("picture > img")
+        url = img.find_previous_sibling("source")["srcset"].split(", ")[-1].split()[0]
+        with Image.open(sphinx_build.path(url)) as variant:
+            return (img["width"], img["height"]), variant.size, variant.getpixel((0, 0))
+
+    try:
+        sphinx_build.build(cmd)
+        size, variant_size, pixel = built_figure()
+        assert size == ("1200", "600")
+        assert variant_size == (1200, 600)
+        assert pixel[0] > 200 and pixel[2] < 50
+
+        # The previous build's copy in _images is not used
+        Image.new("RGB", (2000, 500), "blue").save(path_image)
+        sphinx_build.build(cmd)
+        size, variant_size, pixel = built_figure()
+        assert size == ("2000", "500")
+        assert variant_size == (2000, 500)
+        assert pixel[2] > 200 and pixel[0] < 50
+    finally:
+        path_page.unlink()
+        path_image.unlink()
+        sphinx_build.clean()
+
+
+def test_page_has_math_unit():
+    """Unit test for detecting math in a doctree."""
+    from docutils import nodes
+    from docutils.utils import new_document
+    from docutils.frontend import get_default_settings
+    from docutils.parsers.rst import Parser
+    from quantecon_book_theme import page_has_math
+
+    doctree = new_document("test", get_default_settings(Parser))
+    doctree += nodes.paragraph(text="No equations here.")
+    assert page_has_math(None) is False
+    assert page_has_math(doctree) is False
+
+    doctree[0] += nodes.math(text="x^2")
+    assert page_has_math(doctree) is True
+
+
+def test_mathjax_lazy(sphinx_build):
+    """MathJax is only configured on pages with math, and can typeset lazily."""
+    sphinx_build.copy()
+    path_math = sphinx_build.path_book.joinpath("math.md")
+    path_math.write_text(
+        "---\norphan: true\n---\n# Math\n\n```{math}\nx^2 + y^2\n```\n"
+    )
+    try:
+        sphinx_build.build(["-D", "html_theme_options.mathjax_lazy=True"])
+        math = sphinx_build.get("math.html")
+        config = [s for s in math.find_all("script") if "MathJax = {" in s.text]
+        assert len(config) == 1
+        assert "'ui/lazy'" in config[0].text
+        assert math.find("script", src=lambda src: src and "mathjax" in src)
+
+        index = sphinx_build.get("index.html")
+        assert "MathJax = {" not in str(index)
+        assert not index.find("script", src=lambda src: src and "mathjax" in src)
+    finally:
+        path_math.unlink()
+        sphinx_build.clean()
+
+
+def test_prerender_math_unit(tmp_path):
+    """Unit test for replacing math with cached build-time renderings."""
+    from quantecon_book_theme.mathjax import _start_renderer, prerender_page_math
+
+    app = Mock()
+    app.doctreedir = tmp_path
+    app.srcdir = tmp_path
+    app.config = MagicMock()
+    app.config.__getitem__.side_effect = {
+        "mathjax_path": "https://cdn.jsdelivr.net/npm/mathjax@3/es5/tex-svg.js"
+    }.get
+    app.config.mathjax_inline = [r"\(", r"\)"]
+    app.config.mathjax_display = [r"\[", r"\]"]
+    app.config.html_theme_options = {"math_prerender": True}
+    body = (
+        '<p><span class="math notranslate nohighlight">\\(a &lt; b\\)</span></p>'
+        '<div class="math notranslate nohighlight" id="equation-eq1">\n'
+        '<span class="eqno">(1)<a class="headerlink" href="#equation-eq1">#</a>'
+        "</span>\\[x^2\\]</div>"
+    )
+
+    def render(app, tex, display):
+        return f'<mjx-container display="{str(display).lower()}">{tex}</mjx-container>'
+
+    context = {"body": body, "has_maths_elements": True}
+    with patch("quantecon_book_theme.mathjax.render_equation", side_effect=render):
+        prerender_page_math(app, "page", "page.html", context, None)
+    assert context["math_prerendered"] is True
+    assert '<mjx-container display="false">a < b</mjx-container></span>' in (
+        context["body"]
+    )
+    assert (
+        '#</a></span><mjx-container display="true">x^2</mjx-container></div>'
+        in context["body"]
+    )
+
+    # Cached equations are not rendered again
+    context = {"body": body, "has_maths_elements": True}
+    with patch("quantecon_book_theme.mathjax.render_equation") as render_equation:
+        prerender_page_math(app, "page", "page.html", context, None)
+        render_equation.assert_not_called()
+    assert context["math_prerendered"] is True
+
+    # The user's macros reach the renderer, and changing them renders again
+    app.config.mathjax3_config = {"tex": {"macros": {"RR": "\\mathbf{R}"}}}
+    context = {"body": body, "has_maths_elements": True}
+    with patch(
+        "quantecon_book_theme.mathjax.render_equation", side_effect=render
+    ) as render_equation:
+        prerender_page_math(app, "page", "page.html", context, None)
+        assert render_equation.call_count == 2
+    with patch("shutil.which", return_value="node"), patch("subprocess.Popen") as popen:
+        popen.return_value.stdout.readline.return_value = '{"ready": true}'
+        _start_renderer(app)
+    config = json.loads(popen.call_args.args[0][2])
+    assert config["macros"]["RR"] == "\\mathbf{R}"
+    assert config["macros"]["EE"] == "\\mathbb{E}"
+
+    # Equations that fail to render are left to MathJax
+    context = {"body": body.replace("x^2", "y^2"), "has_maths_elements": True}
+    with patch("quantecon_book_theme.mathjax.render_equation", return_value=None):
+        prerender_page_math(app, "page", "page.html", context, None)
+    assert context["math_prerendered"] is False
+    assert "\\[y^2\\]" in context["body"]
+
+
+def test_math_cache_key_renderer_version(tmp_path, monkeypatch):
+    """Upgrading mathjax-full invalidates the pre-rendered equations."""
+    from quantecon_book_theme.mathjax import math_cache_key, mathjax_full_version
+
+    package = tmp_path.joinpath("node_modules", "mathjax-full", "package.json")
+    package.parent.mkdir(parents=True)
+    package.write_text('{"version": "3.2.2"}')
+    project = tmp_path.joinpath("book")
+    project.mkdir()
+    monkeypatch.setenv("NODE_PATH", "")
+    # The lookup walks up from the project directory, like node's
+    assert mathjax_full_version(str(project)) == "3.2.2"
+    assert math_cache_key("x", True, "3.2.2") != math_cache_key("x", True, "3.2.1")
+    assert math_cache_key("x", True, "3.2.2") != math_cache_key(
+        "x", True, "3.2.2", {"RR": "\\mathbf{R}"}
+    )
+
+
+def test_defer_outputs_unit():
+    """Unit test for deferring interactive notebook outputs."""
+    from docutils import nodes
+    from docutils.utils import new_document
+    from docutils.frontend import get_default_settings
+    from docutils.parsers.rst import Parser
+    from quantecon_book_theme.outputs import defer_heavy_outputs, defer_widget_runtime
+
+    iframe = '<iframe srcdoc="&lt;p&gt;map&lt;/p&gt;"></iframe>'
+    widget = '<script type="application/vnd.jupyter.widget-view+json">{}</script>'
+    doctree = new_document("test", get_default_settings(Parser))
+    for html in (iframe, widget, "<b>table</b>"):
+        output = nodes.container(classes=["cell_output"])
+        output += nodes.raw("", html, format="html", classes=["output", "text_html"])
+        doctree += output
+    doctree += nodes.raw("", iframe, format="html")
+
+    app = Mock()
+    app.config.html_theme_options = {}
+    defer_heavy_outputs(app, doctree, "page")
+    assert "qe-deferred-output" not in doctree.astext()
+
+    app.config.html_theme_options = {
+        "defer_outputs": True,
+        "defer_outputs_click_bytes": 60,
+    }
+    defer_heavy_outputs(app, doctree, "page")
+    raw = list(doctree.findall(nodes.raw))
+    assert (
+        raw[0]
+        .astext()
+        .startswith(
+            f'<div class="qe-deferred-output" data-defer="viewport"><template>{iframe}'
+        )
+    )
+    assert raw[0]["classes"] == ["output", "text_html"]
+    # Large outputs are loaded on click
+    assert (
+        raw[1]
+        .astext()
+        .startswith(
+            '<div class="qe-deferred-output" data-defer="click" data-widget="true">'
+        )
+    )
+    assert raw[2].astext() == "<b>table</b>"
+    # Only notebook outputs are deferred
+    assert raw[3].astext() == iframe
+
+    # The widget runtime is loaded by the deferred widgets
+    runtime = "https://cdn.jsdelivr.net/npm/embed-amd.js"
+    app.config.nb_ipywidgets_js = {runtime: {}}
+    context = {
+        "body": "".join(node.astext() for node in raw),
+        "script_files": ["_static/doctools.js", runtime],
+    }
+    defer_widget_runtime(app, "page", "page.html", context, None)
+    assert context["script_files"] == ["_static/doctools.js"]
+    assert context["deferred_output_scripts"] == [{"src": runtime}]
+
+
+def test_truncate_long_outputs_unit(tmp_path):
+    """Unit test for cutting long text outputs into sidecar files."""
+    from docutils import nodes
+    from docutils.utils import new_document
+    from docutils.frontend import get_default_settings
+    from docutils.parsers.rst import Parser
+    from quantecon_book_theme.outputs import (
+        remainder_label,
+        split_output,
+        truncate_long_outputs,
+    )
+
+    text = "".join(f"line {i}\n" for i in range(10))
+    assert split_output(text, 0, 0) == (text, "")
+    assert split_output(text, 2, 0) == ("line 0\nline 1\n", text[14:])
+    assert split_output(text, 0, 20) == ("line 0\nline 1\n", text[14:])
+    # A single long line is cut at the byte limit
+    assert split_output("é" * 10, 0, 5) == ("éé", "é" * 8)
+    # The rest of a line cut at the byte limit is not one more line
+    assert remainder_label(*split_output("abcdef\nline 1\n", 0, 3)) == "1 more line"
+    assert remainder_label(*split_output("é" * 10, 0, 5)) == "8 more characters"
+    assert remainder_label(*split_output(text, 2, 0)) == "8 more lines"
+
+    doctree = new_document("test", get_default_settings(Parser))
+    for classes, content in (
+        (["output", "stream"], "\x1b[31m" + text),
+        (["output", "stderr"], text),
+        (["output", "text_plain"], "short\n"),
+    ):
+        output = nodes.container(classes=["cell_output"])
+        output += nodes.literal_block(content, content, classes=classes)
+        doctree += output
+
+    app = Mock()
+    app.builder.format = "html"
+    app.builder.get_target_uri.return_value = "section/page.html"
+    app.outdir = str(tmp_path)
+    app.config.html_theme_options = {}
+    truncate_long_outputs(app, doctree, "section/page")
+    assert not (tmp_path / "_outputs").exists()
+
+    app.config.html_theme_options = {"output_max_lines": 3}
+    truncate_long_outputs(app, doctree, "section/page")
+    blocks = list(doctree.findall(nodes.literal_block))
+    assert blocks[0].astext() == "\x1b[31mline 0\nline 1\nline 2\n"
+    assert blocks[0]["classes"] == ["output", "stream", "output-truncated"]
+    # stderr outputs are collapsed in the browser instead
+    assert blocks[1].astext() == text
+    assert blocks[2].astext() == "short\n"
+
+    sidecar = tmp_path / "_outputs" / "section" / "page.1.txt"
+    assert sidecar.read_text() == text[21:]
+    button = blocks[0].parent[1]
+    assert isinstance(button, nodes.raw)
+    assert 'data-src="../_outputs/section/page.1.txt"' in button.astext()
+    assert "Show full output (7 more lines)" in button.astext()
+
+    # Rebuilding a page keeps the sidecars of the pages below it
+    nested = tmp_path / "_outputs" / "section" / "page" / "child.1.txt"
+    nested.parent.mkdir()
+    nested.write_text("child")
+    stale = tmp_path / "_outputs" / "section" / "page.2.txt"
+    stale.write_text("stale")
+    truncate_long_outputs(app, doctree, "section/page")
+    assert nested.exists()
+    assert not stale.exists()
+
+
+def test_truncate_long_outputs(sphinx_build):
+    """Test that long notebook outputs are cut when the options are set."""
+    sphinx_build.copy()
+
+    sphinx_build.build(["-D", "html_theme_options.output_max_bytes=1"])
+    ntbk_html = sphinx_build.get("section1", "ntbk.html")
+    toggle = ntbk_html.find("button", class_="output-truncated-toggle")
+    assert toggle is not None
+    assert toggle["data-src"] == "../_outputs/section1/ntbk.1.txt"
+    assert "output-truncated" in toggle.find_previous_sibling("div")["class"]
+    sidecar = sphinx_build.path_html / "_outputs" / "section1" / "ntbk.1.txt"
+    assert sidecar.read_text() == "i\n"
+
+    sphinx_build.clean()
+
+
+def test_defer_thebe_unit():
+    """Unit test for moving the sphinx-thebe assets out of the page head."""
+    from quantecon_book_theme.launch import defer_thebe
+
+    def page_context():
+        return {
+            "pathto": lambda filename, resource: f"../{filename}",
+            "script_files": ["_static/doctools.js", "_static/sphinx-thebe.js"],
+            "css_files": ["_static/sphinx-thebe.css"],
+        }
+
+    app = Mock()
+    app.config.thebe_config = {"always_load": False}
+    app.config.html_theme_options = {"launch_buttons": {}}
+    context = page_context()
+    defer_thebe(app, "page", "page.html", context, None)
+    assert "thebe_assets" not in context
+
+    app.config.html_theme_options = {"launch_buttons": {"thebe": True}}
+    defer_thebe(app, "page", "page.html", context, None)
+    assert context["script_files"] == ["_static/doctools.js"]
+    assert context["css_files"] == []
+    # No BinderHub is configured, so there is nothing to preconnect
+    assert context["thebe_assets"] == {
+        "scripts": [{"src": "../_static/sphinx-thebe.js"}],
+        "stylesheets": ["../_static/sphinx-thebe.css"],
+        "preconnect": [],
+    }
+
+    # The BinderHub of the launch buttons, unless thebe_config names one
+    app.config.html_theme_options = {
+        "launch_buttons": {"thebe": True, "binderhub_url": "https://hub.org/binder"}
+    }
+    context = page_context()
+    defer_thebe(app, "page", "page.html", context, None)
+    assert context["thebe_assets"]["preconnect"] == ["https://hub.org"]
+    app.config.thebe_config = {"binderhub_url": "https://thebe.org"}
+    context = page_context()
+    defer_thebe(app, "page", "page.html", context, None)
+    assert context["thebe_assets"]["preconnect"] == ["https://thebe.org"]
+
+    # Thebe stays in the head when it should load on every page
+    app.config.thebe_config = {"always_load": True}
+    context = page_context()
+    defer_thebe(app, "page", "page.html", context, None)
+    assert "thebe_assets" not in context
+
+
+def test_thebe_on_demand(sphinx_build):
+    """Test that Thebe is only loaded once a launch button is clicked."""
+    sphinx_build.copy()
+
+    sphinx_build.build()
+    ntbk_html = sphinx_build.get("section1", "ntbk.html")
+    head = ntbk_html.find("head")
+    assert head.find("script", src=lambda src: src and "sphinx-thebe" in src) is None
+    assert head.find("link", href=lambda href: href and "sphinx-thebe" in href) is None
+    assets = json.loads(ntbk_html.find("script", id="qe-thebe-assets").string)
+    assert assets["scripts"][0]["src"].startswith("../_static/sphinx-thebe.js")
+    assert assets["preconnect"] == ["https://mybinder.org"]
+    # sphinx-thebe's page configuration is kept
+    assert ntbk_html.find("script", attrs={"type": "text/x-thebe-config"})
+
+    sphinx_build.clean()
+
+
+def test_sync_notebook_unit(tmp_path):
+    """Unit test for copying notebooks into _sources only when they change."""
+    import os
+    from quantecon_book_theme.launch import sync_notebook
+
+    source = tmp_path / "jupyter_execute" / "page.ipynb"
+    destination = tmp_path / "html" / "_sources" / "page.ipynb"
+    source.parent.mkdir()
+    source.write_text('{"cells": []}')
+
+    assert sync_notebook(source, destination)
+    assert destination.read_text() == '{"cells": []}'
+    assert not sync_notebook(source, destination)
+
+    # Executed again with the same outputs
+    destination.unlink()
+    sync_notebook(source, destination)
+    os.utime(source, ns=(0, 10**9))
+    if not os.path.samefile(source, destination):
+        assert not sync_notebook(source, destination)
+        assert destination.stat().st_mtime_ns == 10**9
+
+    # Executed again with new outputs
+    source.unlink()
+    source.write_text('{"cells": [1]}')
+    assert sync_notebook(source, destination)
+    assert destination.read_text() == '{"cells": [1]}'
+
+
+def test_copy_notebooks(sphinx_build):
+    """Test that markdown notebooks are copied into _sources once written."""
+    sphinx_build.copy()
+
+    sphinx_build.build()
+    notebook = sphinx_build.path_html / "_sources" / "section1" / "ntbkmd.ipynb"
+    assert json.loads(notebook.read_text())["cells"]
+    doctrees = sphinx_build.path_html / ".doctrees"
+    assert doctrees.is_dir()
+    assert not list(doctrees.glob("qe-notebook-copies.*.jsonl"))
+
+    sphinx_build.clean()
+
+
+def test_compile_launch_config_unit():
+    """Unit test for resolving the launch buttons once per build."""
+    from quantecon_book_theme.launch import (
+        add_hub_urls,
+        compile_launch_config,
+        init_launch_config,
+    )
+    from quantecon_book_theme.options import resolve_theme_options
+
+    config_theme = {
+        "nb_repository_url": "https://github.com/TestOrg/test-notebooks",
+        "nb_branch": "main",
+        "nb_path_to_notebooks": "notebooks",
+        "launch_buttons": {
+            "binderhub_url": "https://mybinder.org",
+            "jupyterhub_url": "https://datahub.example.org",
+            "colab_url": "https://colab.research.google.com",
+            "notebook_interface": "jupyterlab",
+        },
+    }
+    hub = compile_launch_config(resolve_theme_options(config_theme))["hub"]
+    assert hub["colab"] == (
+        "https://colab.research.google.com/github/TestOrg/test-notebooks"
+        "/blob/main/notebooks/{path}"
+    )
+    assert hub["jupyterhub_urlpath"] == "lab/tree/test-notebooks/notebooks/{path}"
+    assert compile_launch_config(resolve_theme_options({}))["hub"] is None
+
+    # Pages only fill in their path
+    app = Mock()
+    app.env.metadata = {"intro": {}}
+    app.config.html_theme_options = config_theme
+    context = {}
+    add_hub_urls(app, "intro", "template", context, Mock())
+    assert context["binder_url"] == (
+        "https://mybinder.org/v2/gh/TestOrg/test-notebooks/main?"
+        "urlpath=tree/intro.ipynb"
+    )
+    assert context["jupyterhub_urlpath"] == (
+        "lab/tree/test-notebooks/notebooks/intro.ipynb"
+    )
+    assert len(context["launch_buttons"]) == 3
+
+    # Two launch servers without Colab have no default server to fall back to
+    del config_theme["launch_buttons"]["colab_url"]
+    app = Mock()
+    app.env.metadata = {"intro": {}}
+    app.config.html_theme_options = dict(config_theme)
+    context = {}
+    add_hub_urls(app, "intro", "template", context, Mock())
+    assert len(context["launch_buttons"]) == 2
+    assert context["default_server"] is None
+
+    # Misconfigured launch buttons are reported before any page is written,
+    # by HTML builders only
+    config_theme["launch_buttons"]["notebook_interface"] = "vscode"
+    with pytest.raises(ValueError, match="Notebook UI"):
+        compile_launch_config(resolve_theme_options(config_theme))
+    app = Mock()
+    app.builder.format = "latex"
+    app.config.html_theme_options = config_theme
+    init_launch_config(app)
+
+
+def test_summarize_profile_unit():
+    """Unit test for aggregating handler timings across writers."""
+    from quantecon_book_theme.profiling import summarize_profile
+
+    report = summarize_profile(
+        [
+            {"page": "intro", "name": "add_to_context", "seconds": 0.5},
+            {"page": "intro", "name": "add_to_context.git", "seconds": 0.25},
+            {"page": "intro", "name": "add_hub_urls", "seconds": 0.125},
+            {"page": "section1/ntbk", "name": "add_to_context", "seconds": 1.5},
+        ]
+    )
+    assert report["pages"] == 2
+    assert report["total"] == 2.125
+    assert list(report["handlers"]) == [
+        "add_to_context",
+        "add_to_context.git",
+        "add_hub_urls",
+    ]
+    assert report["handlers"]["add_to_context"] == {
+        "calls": 2,
+        "total": 2.0,
+        "max": 1.5,
+        "mean": 1.0,
+    }
+    # Sub-steps are reported per handler, not added to the page totals
+    assert report["slowest_pages"][1] == {
+        "page": "intro",
+        "total": 0.625,
+        "handlers": {"add_to_context": 0.5, "add_hub_urls": 0.125},
+    }
+
+
+def test_profile(sphinx_build):
+    """Test that the profile option writes a report of the handler timings."""
+    sphinx_build.copy()
+
+    sphinx_build.build(["-D", "html_theme_options.profile=True"])
+    doctrees = sphinx_build.path_html / ".doctrees"
+    report = json.loads((doctrees / "qe-theme-profile.json").read_text())
+    assert not list(doctrees.glob("qe-profile.*.jsonl"))
+    assert "add_to_context" in report["handlers"]
+    assert "add_to_context.toctree" in report["handlers"]
+    assert report["pages"] > 1
+    assert report["slowest_pages"][0]["total"] >= report["slowest_pages"][-1]["total"]
+    metrics = json.loads((doctrees / "qe-theme-metrics.json").read_text())
+    assert metrics["handler_seconds"] > 0
+
+    sphinx_build.clean()
+
+    # Timings are not recorded by default, the build metrics still are
+    sphinx_build.copy()
+    sphinx_build.build()
+    assert not (doctrees / "qe-theme-profile.json").exists()
+    assert not list(doctrees.glob("qe-profile.*.jsonl"))
+    metrics = json.loads((doctrees / "qe-theme-metrics.json").read_text())
+    assert metrics["handler_seconds"] is None
+    assert metrics["pages"] > 1
+
+    sphinx_build.clean()
+
+
+def test_compare_metrics_unit():
+    """Unit test for measuring pages and comparing the metrics of two builds."""
+    from quantecon_book_theme.metrics import compare_metrics, page_bytes
+
+    sizes = page_bytes(
+        "<style>p{}</style><script>var a;</script><script src='b.js'></script>"
+        '<nav class="qe-sidebar__nav" id="qe-sidebar-nav"><ul></ul></nav>'
+    )
+    assert sizes["inline_css"] == 3
+    assert sizes["inline_js"] == 6
+    assert sizes["navigation"] == 9
+
+    baseline = {
+        "handler_seconds": 1.0,
+        "git_subprocesses": 8,
+        "bytes": {"html": 1000, "inline_css": 8, "inline_js": 100, "navigation": 50},
+    }
+    current = {
+        "handler_seconds": 2.0,
+        "git_subprocesses": 8,
+        "bytes": {"html": 1040, "inline_css": 10, "inline_js": 120, "navigation": 50},
+    }
+    assert compare_metrics(baseline, current) == [
+        "bytes.inline_css: 8 -> 10 (+25.0%)",
+        "bytes.inline_js: 100 -> 120 (+20.0%)",
+    ]
+    assert compare_metrics(baseline, current, tolerance=0.5) == []
+    # Handler time depends on the machine, so it is only compared on request
+    assert compare_metrics(baseline, current, 0.5, time_tolerance=0.5) == [
+        "handler_seconds: 1.0 -> 2.0 (+100.0%)"
+    ]
+    assert compare_metrics(current, baseline) == []
+
+
+def test_count_from_threads_unit():
+    """Unit test that counts made from several threads are not lost."""
+    from concurrent.futures import ThreadPoolExecutor
+
+    from quantecon_book_theme.metrics import _take_counters, count, count_cache
+
+    def work(_):
+        for _ in range(1000):
+            count("git_subprocesses")
+            count_cache("notebook_copies", hits=1)
+
+    _take_counters()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(work, range(8)))
+    counters = _take_counters()
+    assert counters["git_subprocesses"] == 8000
+    assert counters["cache.notebook_copies.hits"] == 8000
+
+
+def test_build_metrics(sphinx_build, tmp_path):
+    """Test that builds write their metrics."""
+    from quantecon_book_theme.metrics import main
+
+    sphinx_build.copy()
+
+    sphinx_build.build()
+    doctrees = sphinx_build.path_html / ".doctrees"
+    metrics = json.loads((doctrees / "qe-theme-metrics.json").read_text())
+    assert not list(doctrees.glob("qe-metrics.*.jsonl"))
+    assert metrics["pages"] == len(metrics["page_bytes"])
+    assert metrics["page_bytes"]["index"]["navigation"] > 0
+    assert metrics["git_subprocesses"] > 0
+    assert metrics["bytes"]["html"] == sum(
+        sizes["html"] for sizes in metrics["page_bytes"].values()
+    )
+    largest = [page["html"] for page in metrics["largest_pages"]]
+    assert largest == sorted(largest, reverse=True)
+    assert metrics["caches"]["asset_digests"]["hit_rate"] > 0.5
+    assert metrics["caches"]["notebook_copies"]["misses"] > 0
+
+    # The metrics of a build do not regress from themselves
+    baseline = tmp_path / "baseline.json"
+    baseline.write_text(json.dumps(metrics))
+    assert main([str(baseline), str(doctrees / "qe-theme-metrics.json")]) == 0
+    metrics["bytes"]["html"] //= 2
+    baseline.write_text(json.dumps(metrics))
+    assert main([str(baseline), str(doctrees / "qe-theme-metrics.json")]) == 1
+
+    sphinx_build.clean()
+
+
+def test_perf_report_url(sphinx_build):
+    """Test that the performance report endpoint is only given when set."""
+    sphinx_build.copy()
+
+    sphinx_build.build(
+        ["-D", "html_theme_options.perf_report_url=http://localhost:9000/perf"]
+    )
+    meta = sphinx_build.get("index.html").find("meta", attrs={"name": "qe-perf-report"})
+    assert meta["content"] == "http://localhost:9000/perf"
+    sphinx_build.clean()
+
+    sphinx_build.copy()
+    sphinx_build.build()
+    assert not sphinx_build.get("index.html").find(
+        "meta", attrs={"name": "qe-perf-report"}
+    )
+    sphinx_build.clean()
+
+
+def test_prepaint_settings(sphinx_build):
+    """Test that saved settings and option classes apply before first paint."""
+    sphinx_build.copy()
+
+    sphinx_build.build(
+        [
+            "-D",
+            "html_theme_options.color_scheme=gruvbox",
+            "-D",
+            "html_theme_options.persistent_sidebar=True",
+        ]
+    )
+    index_html = sphinx_build.get("index.html")
+    bootstrap = [
+        script.string
+        for script in index_html.find("head").find_all("script")
+        if script.string and "localStorage.setContrast" in script.string
+    ]
+    assert len(bootstrap) == 1
+    assert "font-plus" in bootstrap[0]
+    assert "qe-sidebar-open" in bootstrap[0]
+    # The option classes are in the markup, not added by scripts in <body>
+    body_tag = index_html.find("body")
+    assert "color-scheme-gruvbox" in body_tag["class"]
+    assert "main-index" in body_tag["class"]
+    assert not [
+        script
+        for script in body_tag.find_all("script")
+        if script.string and "color-scheme" in script.string
+    ]
+    sphinx_build.clean()
+
+    sphinx_build.copy()
+    sphinx_build.build()
+    index_html = sphinx_build.get("index.html")
+    head = str(index_html.find("head"))
+    assert "localStorage.setContrast" in head
+    assert "qe-sidebar-open" not in head
+    assert "color-scheme-gruvbox" not in index_html.find("body").get("class", [])
+    sphinx_build.clean()
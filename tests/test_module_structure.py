@@ -23,9 +23,11 @@ class TestSCSSModuleStructure:
         "_margin.scss",
         "_modals.scss",
         "_normalize.scss",
+        "_outputs.scss",
         "_page.scss",
         "_quantecon-defaults.scss",
         "_rtl.scss",
+        "_search.scss",
         "_sidebar.scss",
         "_stderr.scss",
         "_syntax.scss",
@@ -50,6 +52,7 @@ class TestSCSSModuleStructure:
             "dark-theme",
             "color-schemes",
             "toolbar",
+            "search",
             "sidebar",
             "page",
             "content",
@@ -58,6 +61,7 @@ class TestSCSSModuleStructure:
             "stderr",
             "modals",
             "autodoc",
+            "outputs",
         ]
 
         for module in expected_forwards:
@@ -86,12 +90,20 @@ class TestJavaScriptModuleStructure:
     EXPECTED_JS_MODULES = [
         "code-blocks.js",
         "index.js",
+        "instant-navigation.js",
         "navigation.js",
+        "outputs.js",
         "page-header.js",
+        "perf.js",
         "popups.js",
+        "prefetch.js",
+        "scheduler.js",
         "search.js",
+        "search-worker.js",
+        "service-worker.js",
         "sidebar.js",
         "stderr-warnings.js",
+        "thebe.js",
         "theme-settings.js",
     ]
 
@@ -114,6 +126,13 @@ class TestJavaScriptModuleStructure:
             "popups.js",
             "page-header.js",
             "stderr-warnings.js",
+            "prefetch.js",
+            "instant-navigation.js",
+            "service-worker.js",
+            "outputs.js",
+            "thebe.js",
+            "perf.js",
+            "scheduler.js",
         ]
 
         for module in expected_imports:
@@ -123,13 +142,20 @@ class TestJavaScriptModuleStructure:
         """Verify JavaScript modules export their functions."""
         modules_to_check = {
             "theme-settings.js": ["initThemeSettings", "initFontSize"],
-            "sidebar.js": ["initSidebar"],
-            "search.js": ["initSearch"],
+            "sidebar.js": ["initSidebar", "initSharedNavigation"],
+            "search.js": ["initSearch", "initSearchResults"],
             "navigation.js": ["initFullscreen", "initBackToTop"],
             "code-blocks.js": ["initCollapsibleCode", "initTableContainers"],
             "popups.js": ["initPopups", "initLauncherSettings"],
             "page-header.js": ["initPageHeader", "initChangelog"],
             "stderr-warnings.js": ["initStderrWarnings"],
+            "prefetch.js": ["initPrefetch", "prefetch"],
+            "instant-navigation.js": ["initInstantNavigation"],
+            "service-worker.js": ["initServiceWorker"],
+            "outputs.js": ["initDeferredOutputs", "initTruncatedOutputs", "loadScript"],
+            "thebe.js": ["initThebeLauncher"],
+            "perf.js": ["measure", "initPerfReporting"],
+            "scheduler.js": ["whenIdle"],
         }
 
         for module, exports in modules_to_check.items():
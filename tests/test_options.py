@@ -0,0 +1,121 @@
+"""Tests for the typed theme options."""
+
+import configparser
+from dataclasses import FrozenInstanceError, fields
+from pathlib import Path
+from unittest.mock import Mock, patch
+
+import pytest
+
+from quantecon_book_theme.options import (
+    ColorScheme,
+    ThemeOptions,
+    get_template_values,
+    get_theme_options,
+    init_theme_options,
+    resolve_theme_options,
+    warn_unknown_options,
+)
+
+
+THEME_CONF = (
+    Path(__file__).parents[1]
+    / "src/quantecon_book_theme/theme/quantecon_book_theme/theme.conf"
+)
+
+
+def _theme_conf_options():
+    parser = configparser.RawConfigParser()
+    parser.read(THEME_CONF, encoding="utf-8")
+    return dict(parser.items("options"))
+
+
+class TestThemeOptions:
+    """Tests for resolving html_theme_options into ThemeOptions."""
+
+    def test_fields_match_theme_conf(self):
+        names = {option.name for option in fields(ThemeOptions)}
+        assert names == set(_theme_conf_options())
+
+    def test_defaults_match_theme_conf(self):
+        assert resolve_theme_options(_theme_conf_options()) == ThemeOptions()
+
+    def test_string_values_are_parsed(self):
+        options = resolve_theme_options(
+            {
+                "math_prerender": "True",
+                "sticky_contents": "false",
+                "service_worker_max_pages": "3",
+                "responsive_image_widths": "960, 480",
+                "languages": "[{'code': 'en'}]",
+                "color_scheme": "Gruvbox",
+            }
+        )
+        assert options.math_prerender is True
+        assert options.sticky_contents is False
+        assert options.service_worker_max_pages == 3
+        assert options.responsive_image_widths == (480, 960)
+        assert options.languages == [{"code": "en"}]
+        assert options.color_scheme is ColorScheme.GRUVBOX
+
+    def test_invalid_values_fall_back_to_defaults(self):
+        options = resolve_theme_options(
+            {
+                "math_prerender": "yes",
+                "output_max_lines": "many",
+                "responsive_image_widths": ["wide"],
+                "launch_buttons": "not a dict",
+                "color_scheme": "solarized",
+            }
+        )
+        assert options == ThemeOptions()
+
+    def test_unknown_options_are_ignored(self):
+        options = resolve_theme_options({"logo": "logo.png", "twitter": "qe"})
+        assert options.twitter == "qe"
+        assert not hasattr(options, "logo")
+
+    def test_unknown_options_are_reported(self):
+        theme_options = {"logo": "logo.png", "lazy_loadng": True, "foo": 1}
+        with patch("quantecon_book_theme.options.SPHINX_LOGGER") as logger:
+            warn_unknown_options(theme_options, inherited={"logo"})
+        assert [call.args[0] for call in logger.warning.call_args_list] == [
+            "Unknown theme option 'lazy_loadng', did you mean 'lazy_loading'?",
+            "Unknown theme option 'foo'.",
+        ]
+
+    def test_options_are_frozen(self):
+        with pytest.raises(FrozenInstanceError):
+            ThemeOptions().math_prerender = True
+
+    def test_resolved_once_per_configuration(self):
+        app = Mock()
+        app.config.html_theme_options = {"enable_rtl": "true"}
+        options = get_theme_options(app)
+        assert get_theme_options(app) is options
+        assert get_template_values(app)["theme_enable_rtl"] is True
+
+        app.config.html_theme_options = {"enable_rtl": False}
+        assert get_theme_options(app) is not options
+        assert get_template_values(app)["theme_enable_rtl"] is False
+
+    def test_resolved_again_on_config_change(self):
+        app = Mock()
+        app.config.html_theme_options = {"output_max_lines": 5}
+        init_theme_options(app, app.config)
+        options = get_theme_options(app)
+        # Looking the options up does not compare the configured values
+        app.config.html_theme_options["output_max_lines"] = 10
+        assert get_theme_options(app) is options
+        init_theme_options(app)
+        assert get_theme_options(app) is options
+        # A new configuration resolves them again
+        init_theme_options(app, app.config)
+        assert get_theme_options(app).output_max_lines == 10
+
+    def test_git_metadata_options(self):
+        options = resolve_theme_options(
+            {"changelog_max_entries": "3", "last_modified_date_format": "%Y-%m-%d"}
+        )
+        assert options.changelog_max_entries == 3
+        assert options.last_modified_date_format == "%Y-%m-%d"
@@ -68,16 +68,18 @@ def test_rtl_html_template():
 
 def test_rtl_python_integration():
     """Test that Python code handles RTL setting"""
+    from unittest.mock import Mock
 
-    # Read __init__.py file
-    init_py_path = "src/quantecon_book_theme/__init__.py"
-    with open(init_py_path, "r") as f:
-        init_content = f.read()
+    from quantecon_book_theme.options import get_template_values
 
     # Check that RTL setting is processed as boolean
+    app = Mock()
+    app.config.html_theme_options = {"enable_rtl": "True"}
     assert (
-        '"theme_enable_rtl"' in init_content
+        get_template_values(app)["theme_enable_rtl"] is True
     ), "Python code should process theme_enable_rtl setting"
+    app.config.html_theme_options = {}
+    assert get_template_values(app)["theme_enable_rtl"] is False
 
     print("✅ RTL Python integration found")
 
@@ -18,6 +18,9 @@ module.exports = {
     "quantecon-book-theme": [
       "./src/quantecon_book_theme/assets/scripts/index.js",
     ],
+    "quantecon-book-theme-search-worker": [
+      "./src/quantecon_book_theme/assets/scripts/search-worker.js",
+    ],
   },
   output: {
     filename: "scripts/[name].js",